@@ -0,0 +1,77 @@
+# Compare how fast each preview encoder preset encodes, and the size it writes.
+#
+#   python benchmarkencoders.py                       # the test clips
+#   python benchmarkencoders.py clip.cptv --presets grain ultrafast --encoder pyav
+#
+# Frames are colourised and scaled like the classified preview, without drawing tracks.
+
+import argparse
+import glob
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from cptv import CPTVReader
+
+from ml_tools import tools
+from ml_tools.logs import init_logging
+from ml_tools.mpeg_creator import ENCODERS, PRESETS, benchmark_presets
+
+TEST_CLIPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "clips")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "clips", nargs="*", help="CPTV files to encode, defaults to the test clips"
+    )
+    parser.add_argument(
+        "--presets",
+        nargs="+",
+        default=list(PRESETS),
+        choices=list(PRESETS),
+        help="Presets to compare",
+    )
+    parser.add_argument(
+        "--encoder", default=ENCODERS[0], choices=ENCODERS, help="Encoder to use"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=4.0, help="Scale frames are resized by"
+    )
+    return parser.parse_args()
+
+
+def load_frames(filename, colour_lut, scale):
+    with open(filename, "rb") as f:
+        thermals = [np.float32(frame.pix) for frame in CPTVReader(f)]
+    temp_min = np.amin(thermals)
+    temp_max = np.amax(thermals)
+    frames = []
+    for thermal in thermals:
+        image = tools.heat_to_rgb(thermal, colour_lut, temp_min, temp_max)
+        height, width = image.shape[:2]
+        frames.append(cv2.resize(image, (int(width * scale), int(height * scale))))
+    return frames
+
+
+def main():
+    init_logging()
+    args = parse_args()
+    clips = args.clips or sorted(glob.glob(os.path.join(TEST_CLIPS, "*.cptv")))
+    colour_lut = tools.colourmap_lut(
+        tools.load_colourmap(tools.resource_path("colourmap.dat"))
+    )
+    frames = [
+        frame for clip in clips for frame in load_frames(clip, colour_lut, args.scale)
+    ]
+    print("Encoding {} frames from {} clips".format(len(frames), len(clips)))
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = benchmark_presets(frames, args.presets, work_dir, args.encoder)
+    print("{:<12} {:>10} {:>10}".format("Preset", "Frames/s", "KB"))
+    for preset, fps, size in results:
+        print("{:<12} {:>10.1f} {:>10.1f}".format(preset, fps, size / 1000))
+
+
+if __name__ == "__main__":
+    main()
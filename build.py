@@ -5,7 +5,6 @@
 
 import argparse
 import os
-import pickle
 import numpy as np
 import datetime
 from dateutil.parser import parse as parse_date
@@ -14,7 +13,9 @@ from ml_tools.logs import init_logging
 from ml_tools.trackdatabase import TrackDatabase
 from config.config import Config
 from ml_tools.dataset import Dataset, dataset_db_path
+from ml_tools.datasetstore import save_datasets
 from ml_tools.datasetstructures import Camera
+from ml_tools.segmentcache import SegmentCache, segment_cache_path
 import pytz
 
 LOW_DATA_LABELS = ["wallaby", "human", "dog"]
@@ -98,6 +99,17 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config-file", help="Path to config file to use")
     parser.add_argument("-d", "--date", help="Use clips after this")
+    parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        help="Seed for track loading so the dataset can be rebuilt identically",
+    )
+    parser.add_argument(
+        "--segment-cache",
+        action="store_true",
+        help="Preprocess the frames of every track into the segment cache used for training",
+    )
     parser.add_argument(
         "--consecutive-segments",
         action="count",
@@ -248,9 +260,11 @@ def add_camera_tracks(
     dataset.balance_bins()
 
 
-def test_dataset(db, config, date):
+def test_dataset(db, config, date, seed=None):
     test = Dataset(db, "test", config)
-    tracks_loaded, total_tracks = test.load_tracks(shuffle=True, after_date=date)
+    tracks_loaded, total_tracks = test.load_tracks(
+        shuffle=True, after_date=date, workers=config.worker_threads, seed=seed
+    )
     print("Test Loaded {}/{} tracks".format(tracks_loaded, total_tracks))
     for key, value in test.filtered_stats.items():
         if value != 0:
@@ -267,7 +281,9 @@ def main():
     dataset = Dataset(
         db, "dataset", config, consecutive_segments=args.consecutive_segments
     )
-    tracks_loaded, total_tracks = dataset.load_tracks(before_date=args.date)
+    tracks_loaded, total_tracks = dataset.load_tracks(
+        before_date=args.date, workers=config.worker_threads, seed=args.seed
+    )
     print(
         "Loaded {}/{} tracks, found {:.1f}k segments".format(
             tracks_loaded, total_tracks, len(dataset.segments) / 1000
@@ -290,11 +306,23 @@ def main():
     datasets = split_dataset_by_cameras(db, dataset, config, args)
     if args.date is None:
         args.date = datetime.datetime.now(pytz.utc) - datetime.timedelta(days=7)
-    test = test_dataset(db, config, args.date)
+    test = test_dataset(db, config, args.date, args.seed)
     datasets = (*datasets, test)
     print_counts(dataset, *datasets)
     print_cameras(*datasets)
-    pickle.dump(datasets, open(dataset_db_path(config), "wb"))
+    save_datasets(dataset_db_path(config), datasets)
+    if args.segment_cache:
+        build_segment_cache(db, config, datasets)
+
+
+def build_segment_cache(db, config, datasets):
+    cache = SegmentCache(
+        segment_cache_path(config), Dataset.FRAME_SIZE, Dataset.DEFAULT_INSET
+    )
+    tracks = [track for dataset in datasets for track in dataset.tracks]
+    print("Caching preprocessed frames for {} tracks".format(len(tracks)))
+    added = cache.build(db, tracks)
+    print("Cached {} new tracks in {}".format(added, cache.filename))
 
 
 if __name__ == "__main__":
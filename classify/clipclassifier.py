@@ -34,6 +34,8 @@ class ClipClassifier(CPTVFileProcessor):
 
         super(ClipClassifier, self).__init__(config, tracking_config)
         self.model = model
+        # classifiers loaded once per worker, by model id
+        self.classifiers = {}
         # prediction record for each track
 
         self.previewer = Previewer.create_if_required(config, config.classify.preview)
@@ -139,6 +141,18 @@ class ClipClassifier(CPTVFileProcessor):
                     )
         return track_prediction
 
+    def init_worker(self):
+        """
+        Loads the classifiers once, rather than for every clip.  Models that fail to
+        load are logged and loaded for each clip instead.
+        """
+        models = [self.model] if self.model else self.config.classify.models
+        for model in models:
+            try:
+                self.classifiers[model.id] = self.get_classifier(model)
+            except Exception:
+                logging.exception("Error loading model %s", model.model_file)
+
     def get_classifier(self, model):
         """
         Returns a classifier object, which is created on demand.
@@ -211,7 +225,11 @@ class ClipClassifier(CPTVFileProcessor):
         meta_filename = classify_name + ".txt"
 
         if self.previewer:
-            logging.info("Exporting preview to '{}'".format(mpeg_filename))
+            logging.info(
+                "Exporting preview to '{}'".format(
+                    self.previewer.output_filename(mpeg_filename)
+                )
+            )
 
             self.previewer.export_clip_preview(
                 mpeg_filename, clip, list(model_predictions.values())[0]
@@ -247,7 +265,10 @@ class ClipClassifier(CPTVFileProcessor):
 
     def classify_clip(self, clip, model):
         load_start = time.time()
-        classifier = self.get_classifier(model)
+        classifier = self.classifiers.get(model.id)
+        loaded = classifier is None
+        if loaded:
+            classifier = self.get_classifier(model)
         load_time = time.time() - load_start
         logging.info("classifier loaded (%s)", load_time)
         predictions = Predictions(classifier.labels, model)
@@ -268,9 +289,10 @@ class ClipClassifier(CPTVFileProcessor):
                 (time.time() - start) * 1000 / max(1, len(clip.frame_buffer.frames))
             )
             logging.info("Took {:.1f}ms per frame".format(ms_per_frame))
-        tools.clear_session()
-        del classifier
-        gc.collect()
+        if loaded:
+            tools.clear_session()
+            del classifier
+            gc.collect()
 
         return predictions
 
@@ -283,9 +305,6 @@ class ClipClassifier(CPTVFileProcessor):
         models,
         tracking_time,
     ):
-        if self.cache_to_disk:
-            clip.frame_buffer.remove_cache()
-
         # read in original metadata
         meta_data = self.get_meta_data(filename)
 
@@ -323,8 +342,11 @@ class ClipClassifier(CPTVFileProcessor):
             model_dictionaries.append(model_dic)
 
         save_file["models"] = model_dictionaries
+        # the thumbnail of a clip without tracks reads frames, so before the cache is removed
         thumbnail_region = get_thumbnail(clip, predictions_per_model)
         save_file["thumbnail_region"] = thumbnail_region
+        if self.cache_to_disk:
+            clip.frame_buffer.remove_cache()
         if self.config.classify.meta_to_stdout:
             print(json.dumps(save_file, cls=tools.CustomJSONEncoder))
         else:
@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+
+from classify.clipclassifier import ClipClassifier
+from classify.thumbnail import best_trackless_region, window_means
+from config.config import Config
+from load.clip import Clip
+
+CLIPS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "tests", "clips"
+)
+
+
+def brute_force_means(image, size):
+    height, width = image.shape
+    return np.array(
+        [
+            [
+                np.mean(image[y : y + size, x : x + size])
+                for x in range(width - size + 1)
+            ]
+            for y in range(height - size + 1)
+        ]
+    )
+
+
+def make_clip(thermal, background):
+    frames = [
+        SimpleNamespace(thermal=np.full(thermal.shape, 3000.0)),
+        SimpleNamespace(thermal=thermal),
+    ]
+    return SimpleNamespace(
+        region_history=[[], []],
+        stats=SimpleNamespace(frame_stats_mean=[3000, 3100]),
+        frame_buffer=SimpleNamespace(get_frame=lambda i: frames[i]),
+        background=background,
+    )
+
+
+class TestThumbnail:
+    def test_window_means(self):
+        image = np.random.RandomState(0).uniform(0, 100, (20, 30))
+        assert np.allclose(window_means(image, 7), brute_force_means(image, 7))
+
+    def test_best_trackless_region(self):
+        thermal = np.full((120, 160), 3000.0)
+        # warmer than the background
+        thermal[50:70, 90:110] += 200
+        region = best_trackless_region(make_clip(thermal, np.full((120, 160), 3000.0)))
+        assert region.frame_number == 1
+        assert (region.width, region.height) == (64, 64)
+        assert region.left <= 90 and region.right >= 110
+        assert region.top <= 50 and region.bottom >= 70
+
+        # nothing above the background so the warmest thermal window is used
+        thermal = np.full((120, 160), 3000.0)
+        thermal[:64, -64:] += 50
+        region = best_trackless_region(make_clip(thermal, thermal + 10))
+        assert (region.left, region.top) == (96, 0)
+
+    def test_trackless_thumbnail_from_cache(self, tmp_path):
+        source = str(tmp_path / "background.cptv")
+        shutil.copy(os.path.join(CLIPS_DIR, "background.cptv"), source)
+        config = Config.get_defaults()
+        config.classify.classify_folder = str(tmp_path)
+        classifier = ClipClassifier(
+            config, config.classify_tracking, cache_to_disk=True
+        )
+        clip = Clip(config.classify_tracking, source)
+        classifier.track_extractor.parse_clip(clip)
+        # as if nothing was tracked
+        clip.tracks = []
+        clip.region_history = []
+
+        meta_filename = str(tmp_path / "meta.txt")
+        classifier.save_metadata(source, meta_filename, clip, {}, [], 0)
+        with open(meta_filename) as f:
+            region = json.load(f)["thumbnail_region"]
+        assert region["width"] == 64
+        assert not os.path.exists(str(tmp_path / "background.cache"))
@@ -1,5 +1,7 @@
 import numpy as np
 
+from track.region import Region
+
 
 def visit_tag(clip, predictions_per_model):
     """From all tracks get that tag that occurs the most, choosing any tag of an
@@ -46,6 +48,18 @@ def track_score(pred, track):
     return score, best_frame
 
 
+def window_means(image, size):
+    """
+    Returns the mean of every size x size window of image, using a summed area table
+    :return: array of shape [height - size + 1, width - size + 1] indexed by window top left
+    """
+    table = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    np.cumsum(np.cumsum(image, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    sums = table[size:, size:] - table[:-size, size:] - table[size:, :-size]
+    sums += table[:-size, :-size]
+    return sums / (size * size)
+
+
 def best_trackless_region(clip):
     """Choose a frame for clips without any track"""
     best_region = None
@@ -58,35 +72,22 @@ def best_trackless_region(clip):
                 best_region = region
     if best_region is not None:
         return best_region
+    if not clip.stats.frame_stats_mean:
+        return None
 
     # take region with greatest filtered mean values, and
     # if zero take thermal mean values
-    best_frame = np.argmax(clip.stats.frame_stats_mean)
-    frame_height, frame_width = best_frame.shape
-    best_filtered = best_frame - clip.background
-    best_region = None
-    for y in range(frame_height - THUMBNAIL_SIZE):
-        for x in range(frame_width - THUMBNAIL_SIZE):
-            thermal_sum = np.mean(
-                best_frame[y : y + THUMBNAIL_SIZE, x : x + THUMBNAIL_SIZE]
-            )
-            filtered_sum = np.mean(
-                best_filtered[y : y + THUMBNAIL_SIZE, x : x + THUMBNAIL_SIZE]
-            )
-            if best_region is None:
-                best_region = ((y, x), filtered_sum, thermal_sum)
-            elif best_region[1] > 0:
-                if best_region[1] < filtered_sum:
-                    best_region = ((y, x), thermal_sum, filtered_sum)
-            elif best_region[2] < thermal_sum:
-                best_region = ((y, x), thermal_sum, filtered_sum)
-    return Region(
-        best_region[0][1],
-        best_region[0][1],
-        THUMBNAIL_SIZE,
-        THUMBNAIL_SIZE,
-        frame_number=best_frame,
-    )
+    frame_number = int(np.argmax(clip.stats.frame_stats_mean))
+    frame = clip.frame_buffer.get_frame(frame_number)
+    if frame is None:
+        return None
+    thermal = frame.thermal
+    size = min(THUMBNAIL_SIZE, *thermal.shape)
+    means = window_means(thermal - clip.background, size)
+    if np.amax(means) <= 0:
+        means = window_means(thermal, size)
+    y, x = np.unravel_index(np.argmax(means), means.shape)
+    return Region(int(x), int(y), size, size, frame_number=frame_number)
 
 
 def get_thumbnail(clip, predictions_per_model):
@@ -11,6 +11,7 @@ from .classifyconfig import ClassifyConfig
 from .buildconfig import BuildConfig
 from .evaluateconfig import EvaluateConfig
 from .defaultconfig import DefaultConfig, deep_copy_map_if_key_not_exist
+from ml_tools.mpeg_creator import ENCODERS, PRESETS
 
 CONFIG_FILENAME = "classifier.yaml"
 CONFIG_DIRS = [Path(__file__).parent.parent, Path("/etc/cacophony")]
@@ -35,6 +36,8 @@ class Config(DefaultConfig):
     excluded_tags = attr.ib()
     reprocess = attr.ib()
     previews_colour_map = attr.ib()
+    previews_preset = attr.ib()
+    previews_encoder = attr.ib()
     use_gpu = attr.ib()
     worker_threads = attr.ib()
     debug = attr.ib()
@@ -75,6 +78,12 @@ class Config(DefaultConfig):
             excluded_tags=raw["excluded_tags"],
             reprocess=raw["reprocess"],
             previews_colour_map=raw["previews_colour_map"],
+            previews_preset=parse_options_param(
+                "previews_preset", raw["previews_preset"], list(PRESETS)
+            ),
+            previews_encoder=parse_options_param(
+                "previews_encoder", raw["previews_encoder"], ENCODERS
+            ),
             use_gpu=raw["use_gpu"],
             worker_threads=raw["worker_threads"],
             labels=raw["labels"],
@@ -92,6 +101,8 @@ class Config(DefaultConfig):
             excluded_tags=Config.EXCLUDED_TAGS,
             reprocess=True,
             previews_colour_map="custom_colormap.dat",
+            previews_preset="grain",
+            previews_encoder="ffmpeg",
             use_gpu=False,
             worker_threads=0,
             build=BuildConfig.get_defaults(),
@@ -1,24 +1,18 @@
 import os
-from datetime import timedelta
+from datetime import datetime
 import matplotlib.pyplot as plt
 from sklearn import metrics
 import numpy as np
 import itertools
 import argparse
+import logging
 import seaborn as sns
 
 from config.config import Config
 from ml_tools.logs import init_logging
 from ml_tools import tools
-from .evaluateresults import *
-
-
-def is_stats_file(filename):
-    """returns if filename is a valid stats file."""
-    # note, we also have track stats files which have 4 parts, date-time-camera-track
-    ext = os.path.splitext(filename)[-1].lower()
-    parts = filename.split("-")
-    return ext == ".txt" and len(parts) == 3
+from ml_tools.metadatareader import MetadataReader
+from .resultstore import ResultTable, group_visits, ingest_folder
 
 
 def show_confusion_matrix(
@@ -90,65 +84,50 @@ def show_breakdown(true_class, pred_class, title="Confusion Matrix"):
     )
 
 
-def breakdown_tracks(visits):
+def breakdown_tracks(table, visits):
     """Prints out a breakdown of per track accuracy."""
 
     print("-" * 60)
     print("Tracks:")
-    total_duration = 0
-    tracks = []
-    true_class = []
-    pred_class = []
-    for visit in visits:
-        for clip in visit.clips:
-            if clip.true_tag not in classes:
-                print("Warning, invalid true tag", clip.true_tag)
-            for track in clip.tracks:
-                tracks.append(track)
-                total_duration += track.duration
-                true_class.append(clip.true_tag)
-                pred_class.append(track.label)
-                if track.label not in classes:
-                    print("Warning, invalid label", track.label)
+    tracks = np.flatnonzero(visits.clip_visit[table.tracks["clip"]] >= 0)
+    true_class = table.track_true_tag[tracks]
+    pred_class = table.tracks["label"][tracks]
+    for tag in np.unique(true_class[~np.isin(true_class, classes)]):
+        print("Warning, invalid true tag", tag)
+    for label in np.unique(pred_class[~np.isin(pred_class, classes)]):
+        print("Warning, invalid label", label)
+    total_duration = np.sum(
+        table.tracks["end_s"][tracks] - table.tracks["start_s"][tracks]
+    )
 
     print()
     print("Total tracks: {} {:.1f}h".format(len(tracks), total_duration / 60 / 60))
 
     print("-" * 60)
 
-    show_breakdown(true_class, pred_class, "Track Confusion Matrix")
+    show_breakdown(list(true_class), list(pred_class), "Track Confusion Matrix")
 
 
-def breakdown_clips(visits):
+def breakdown_clips(table, visits):
     """Prints out a breakdown of per clip accuracy."""
 
     # display each clip
     print("-" * 60)
     print("Clips:")
-    errors = 0
-    correct = 0
-    total_duration = 0
-    i = 0
-    clips = []
-    for visit in visits:
-        for clip in visit.clips:
-            i += 1
-            clips.append(clip)
-            if clip.true_tag != clip.classifier_best_guess:
-                print(
-                    "{} {} {} {:.2f} {}".format(
-                        i + 1,
-                        clip.true_tag,
-                        clip.classifier_best_guess,
-                        clip.classifier_best_score,
-                        clip.source,
-                    )
-                )
-            if clip.true_tag == clip.classifier_best_guess:
-                correct += 1
-            else:
-                errors += 1
-            total_duration += clip.duration
+    clips = visits.clip_rows
+    true_class = table.clips["true_tag"][clips]
+    pred_class = table.clips["best_guess"][clips]
+    for i in np.flatnonzero(true_class != pred_class):
+        print(
+            "{} {} {} {:.2f} {}".format(
+                i + 2,
+                true_class[i],
+                pred_class[i],
+                table.clips["best_score"][clips[i]],
+                table.clips["source"][clips[i]],
+            )
+        )
+    total_duration = np.sum(table.duration[clips])
 
     print()
     print(
@@ -157,17 +136,39 @@ def breakdown_clips(visits):
 
     print("-" * 60)
 
-    true_class = [clip.true_tag for clip in clips]
-    pred_class = [clip.classifier_best_guess for clip in clips]
+    show_breakdown(list(true_class), list(pred_class), "Clip Confusion Matrix")
 
-    show_breakdown(true_class, pred_class, "Clip Confusion Matrix")
 
-
-def show_error_tree(visits):
+def show_error_tree(table, visits):
     """Prints a tree showing predictions at the visit, clip, and track level."""
-    for i, visit in enumerate(visits):
-        if visit.true_tag != visit.predicted_tag:
-            visit.print_tree()
+    clip_visit = visits.clip_visit[visits.clip_rows]
+    track_order = np.argsort(table.tracks["clip"], kind="stable")
+    track_clips = table.tracks["clip"][track_order]
+    for visit in np.flatnonzero(visits.true_tag != visits.predicted_tag):
+        print(
+            "-{} {} {:.1f}".format(
+                visits.true_tag[visit],
+                visits.predicted_tag[visit],
+                visits.predicted_confidence[visit] * 10,
+            )
+        )
+        for clip in visits.clip_rows[clip_visit == visit]:
+            print(
+                "\t-{} {} {:.1f}".format(
+                    table.clips["true_tag"][clip],
+                    table.clips["best_guess"][clip],
+                    table.clips["best_score"][clip] * 10,
+                )
+            )
+            start, end = np.searchsorted(track_clips, [clip, clip + 1])
+            for track in track_order[start:end]:
+                print(
+                    "\t\t-{} {:.1f} clarity {:.1f}".format(
+                        table.tracks["label"][track],
+                        table.tracks["score"][track] * 10,
+                        table.tracks["clarity"][track] * 10,
+                    )
+                )
 
 
 def breakdown_visits(visits):
@@ -178,165 +179,97 @@ def breakdown_visits(visits):
     print("Visits:")
     print("-" * 60)
 
-    correct = 0
-    for i, visit in enumerate(visits):
-        if visit.true_tag == visit.predicted_tag:
-            correct += 1
-
     # confusion matrix
-    true_class = [visit.true_tag for visit in visits]
-    pred_class = [visit.predicted_tag for visit in visits]
-
-    show_breakdown(true_class, pred_class, "Visit Confusion Matrix")
+    show_breakdown(
+        list(visits.true_tag), list(visits.predicted_tag), "Visit Confusion Matrix"
+    )
 
 
-def show_errors_by_score(visits):
+def show_errors_by_score(table, visits):
     """Displays errors in terms of their score level."""
 
-    # visits by score
-
-    errors = []
-    correct = []
-
-    for visit in visits:
-        if visit.true_tag == visit.predicted_tag:
-            correct.append(visit.predicted_confidence * 10)
-        else:
-            errors.append(visit.predicted_confidence * 10)
-
     bin_divisions = 2
     bins = [x / bin_divisions for x in range(10 * bin_divisions + 1)]
-    plt.title("Visit Errors by Confidence")
-    plt.hist(correct, bins=bins, label="correct")
-    plt.hist(errors, bins=bins, label="error")
-    plt.legend()
-    plt.show()
 
+    def plot_errors(title, correct, confidence):
+        plt.title(title)
+        plt.hist(confidence[correct] * 10, bins=bins, label="correct")
+        plt.hist(confidence[~correct] * 10, bins=bins, label="error")
+        plt.legend()
+        plt.show()
+
+    # visits by score
+    correct = visits.true_tag == visits.predicted_tag
+    plot_errors("Visit Errors by Confidence", correct, visits.predicted_confidence)
+    errors = visits.predicted_confidence[~correct] * 10
     print(
-        "Max confidence on misclassified visit", 0 if len(errors) == 0 else max(errors)
+        "Max confidence on misclassified visit",
+        0 if len(errors) == 0 else np.amax(errors),
     )
 
     # clips by score
-
-    errors = []
-    correct = []
-
-    for visit in visits:
-        for clip in visit.clips:
-            if clip.true_tag == clip.classifier_best_guess:
-                correct.append(clip.classifier_best_score * 10)
-            else:
-                errors.append(clip.classifier_best_score * 10)
-
-    plt.title("Clip Errors by Confidence")
-    plt.hist(correct, bins=bins, label="correct")
-    plt.hist(errors, bins=bins, label="error")
-    plt.legend()
-    plt.show()
+    clips = visits.clip_rows
+    correct = table.clips["true_tag"][clips] == table.clips["best_guess"][clips]
+    plot_errors("Clip Errors by Confidence", correct, table.clips["best_score"][clips])
 
     # tracks by score
-
-    errors = []
-    correct = []
-
-    for visit in visits:
-        for clip in visit.clips:
-            for track in clip.tracks:
-                if clip.true_tag == track.label:
-                    correct.append(track.confidence * 10)
-                else:
-                    errors.append(track.confidence * 10)
-
-    plt.title("Track Errors by Confidence")
-    plt.hist(correct, bins=bins, label="correct")
-    plt.hist(errors, bins=bins, label="error")
-    plt.legend()
-    plt.show()
+    tracks = np.flatnonzero(visits.clip_visit[table.tracks["clip"]] >= 0)
+    correct = table.track_true_tag[tracks] == table.tracks["label"][tracks]
+    plot_errors("Track Errors by Confidence", correct, table.track_confidence[tracks])
 
 
-def get_visits(path, visit_threshold):
-    """Scans a folder loading all clip statstics, and formats them into visits."""
-    all_records = []
-    # fetch the records
-    for filename in os.listdir(path):
-        if is_stats_file(filename):
-            record = ClipResult(os.path.join(path, filename))
-            if record.classifier_best_guess in classes:
-                all_records.append(record)
-
-    # check basic stats, such as missed objects, incorrect objects.
-
-    cameras = set([record.camera for record in all_records])
-
-    visits = []
-
-    for camera in cameras:
-
-        records = [
-            record
-            for record in all_records
-            if record.camera == camera and record.true_tag in classes
-        ]
-
-        # group clips into visits by camera
-        records.sort(key=lambda x: x.start_time)
-
-        current_visit = None
-        previous_record_end = None
-
-        for record in records:
-
-            if not current_visit:
-                current_visit = VisitResult(record)
-                visits.append(current_visit)
-
-            gap = (
-                (record.start_time - previous_record_end).total_seconds()
-                if previous_record_end
-                else 0.0
-            )
-
-            # start a new visit if gap is too large, or tag changes.
-            if gap >= visit_threshold or (record.true_tag != current_visit.true_tag):
-                current_visit = VisitResult(record)
-                visits.append(current_visit)
-            else:
-                current_visit.add_clip(record)
-
-            previous_record_end = record.end_time
-
-    return visits
+def get_visits(
+    path, visit_threshold, table_file=None, metadata_cache=None, update=False
+):
+    """
+    Loads all clip statistics in a folder into a results table, and groups them into visits.
+    :param table_file: results table to load, or to save the table to if it doesn't exist
+    :param metadata_cache: file caching parsed stats files between runs
+    :param update: read stats files that are new or changed since the table was saved
+    :return: the table and visits
+    """
+    table = None
+    if table_file is not None and os.path.exists(table_file):
+        try:
+            table = ResultTable.load(table_file)
+        except ValueError as e:
+            logging.warning("%s, reading all stats files again", e)
+    if table is not None and table.null_tags != sorted(null_tags):
+        logging.warning(
+            "Results table %s was built with null tags %s, reading all stats files again",
+            table_file,
+            table.null_tags,
+        )
+        table = None
+    if table is None or update:
+        reader = MetadataReader(cache_file=metadata_cache)
+        table, files_read = ingest_folder(path, null_tags, reader, table)
+        reader.save_cache()
+        logging.info("Read %d stats files, %d clips in total", files_read, len(table))
+        if table_file is not None:
+            table.save(table_file)
+    return table, group_visits(table, visit_threshold, classes)
 
 
 def show_visits_over_days(visits):
 
     # bin visits in days
-    visit_bins = {}
-    for visit in visits:
-        if visit.predicted_tag == "none":
-            continue
-        visit_midpoint = visit.start_time + timedelta(seconds=visit.duration / 2)
-        date = visit_midpoint.replace(hour=0, minute=0, second=0, microsecond=0)
-        offset = (visit_midpoint - date).total_seconds() / 60 / 60
-        if date not in visit_bins:
-            visit_bins[date] = []
-        visit_bins[date].append((offset, visit))
+    visits_shown = visits.predicted_tag != "none"
+    mid_time = visits.mid_time[visits_shown]
+    predicted_tag = visits.predicted_tag[visits_shown]
+    dates = mid_time.astype("datetime64[D]")
+    offsets = (mid_time - dates) / np.timedelta64(1, "h")
 
     bins = range(0, 24)
 
-    for date, visit_bin in visit_bins.items():
+    for date in np.unique(dates):
         plt.title(
-            "Classifier Visit Sightings for {}".format(date.strftime("%D %Y/%m/%d"))
+            "Classifier Visit Sightings for {}".format(
+                date.astype(datetime).strftime("%D %Y/%m/%d")
+            )
         )
-
-        xs = []
-
-        for label in classes:
-            xs.append([])
-            for offset, visit in visit_bin:
-                if visit.predicted_tag != label:
-                    continue
-                xs[-1].append(offset)
+        on_date = dates == date
+        xs = [list(offsets[on_date & (predicted_tag == label)]) for label in classes]
 
         print(xs)
 
@@ -351,25 +284,25 @@ def show_visits_over_days(visits):
 def plot_visits(visits, true_tags=False):
     """
     Plots visits over time for each camera.
-    :param visits: list of visit objects
+    :param visits: Visits
     :param true_tags: If true true (hand labeled) tags will be used instead of predicted tags
     :return:
     """
 
-    start_date = min([visit.start_time for visit in visits])
+    start_date = np.amin(visits.start_time)
 
-    visits = sorted(visits, key=lambda x: x.predicted_tag)
-    cameras = sorted(list(set([visit.camera for visit in visits])))
+    order = np.argsort(visits.predicted_tag, kind="stable")
+    cameras = list(np.unique(visits.camera))
 
-    data_x = [visit.camera for visit in visits]
-    data_y = [
-        (visit.start_time - start_date).total_seconds() / (60 * 60 * 24)
-        for visit in visits
-    ]
-    data_c = [visit.true_tag if true_tags else visit.predicted_tag for visit in visits]
-    data_s = [visit.duration / 60 for visit in visits]
+    data_x = visits.camera[order]
+    data_y = (visits.start_time[order] - start_date) / np.timedelta64(1, "D")
+    data_c = (visits.true_tag if true_tags else visits.predicted_tag)[order]
     plt.figure(figsize=(14, 6))
-    plt.title("Strip plot for week starting {}".format(start_date.strftime("%Y/%m/%d")))
+    plt.title(
+        "Strip plot for week starting {}".format(
+            start_date.astype(datetime).strftime("%Y/%m/%d")
+        )
+    )
 
     sns.stripplot(
         y=data_x,
@@ -388,36 +321,22 @@ def plot_visits(visits, true_tags=False):
 def plot_camera_visits(camera, visits):
     """
     Plots visits over time for a specific camera.
-    :param visits: list of visit objects
-    :param true_tags: If true true (hand labeled) tags will be used instead of predicted tags
+    :param visits: Visits
     :return:
     """
 
-    def time_in_seconds(time):
-        return (
-            time - time.replace(hour=0, minute=0, second=0, microsecond=0)
-        ).total_seconds()
-
-    def map_noon(hour):
-        return hour if hour < 12 else hour - 24
-
-    visits = [visit for visit in visits if visit.camera == camera]
-
-    x = []
-    for i, class_name in enumerate(classes):
-        x.append(
-            [
-                map_noon(time_in_seconds(visit.mid_time) / 60 / 60)
-                for visit in visits
-                if visit.true_tag == class_name
-            ]
-        )
+    on_camera = visits.camera == camera
+    mid_time = visits.mid_time[on_camera]
+    hours = (mid_time - mid_time.astype("datetime64[D]")) / np.timedelta64(1, "h")
+    # map times after noon to before midnight
+    hours = np.where(hours < 12, hours, hours - 24)
+    true_tag = visits.true_tag[on_camera]
+    x = [hours[true_tag == class_name] for class_name in classes]
 
     plt.figure(figsize=(8, 6))
     plt.title("{} activity".format(camera))
 
     # sns.stripplot(x=data_x, hue_order=classes, linewidth=0.5, jitter = 0.25, hue=data_c, dodge=True)
-    bin_divisions = 2
     bins = range(-12, 13, 2)
 
     plt.hist(x, bins=bins, histtype="bar", stacked=True, label=classes)
@@ -431,15 +350,10 @@ def print_summary(visits):
 
     print("Found {} visits.".format(len(visits)))
 
-    animal_visits = {}
-    for label in classes:
-        animal_visits[label] = 0
-
-    for visit in visits:
-        animal_visits[visit.predicted_tag] += 1
-
-    for class_name, visit_count in animal_visits.items():
-        print("{:<10} {}".format(class_name, visit_count))
+    labels, counts = np.unique(visits.predicted_tag, return_counts=True)
+    visit_counts = dict(zip(labels, counts))
+    for class_name in classes:
+        print("{:<10} {}".format(class_name, visit_counts.get(class_name, 0)))
 
     # show_visits_over_days(visits)
 
@@ -447,18 +361,38 @@ def print_summary(visits):
     plot_camera_visits("akaroa09", visits)
 
 
-def print_evaluation(visits):
+def print_evaluation(table, visits):
     """Runs through all stats files in a folder and evaluates the performance of the classifier."""
-    breakdown_tracks(visits)
-    breakdown_clips(visits)
+    breakdown_tracks(table, visits)
+    breakdown_clips(table, visits)
     breakdown_visits(visits)
-    show_errors_by_score(visits)
+    show_errors_by_score(table, visits)
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config-file", help="Path to config file to use")
 
+    parser.add_argument(
+        "-t",
+        "--table",
+        help="Results table file, loaded if it exists otherwise the classify folder "
+        "is read and saved to it",
+    )
+
+    parser.add_argument(
+        "-u",
+        "--update",
+        action="store_true",
+        help="Update the results table with stats files that are new or changed since "
+        "it was saved",
+    )
+
+    parser.add_argument(
+        "--metadata-cache",
+        help="File caching parsed stats files, so only new or changed files are parsed",
+    )
+
     parser.add_argument(
         "-x",
         "--show-extended-evaluation",
@@ -488,12 +422,16 @@ def main():
     null_tags = conf.evaluate.null_tags
     classes = conf.labels
 
-    visits = get_visits(
-        conf.classify.classify_folder, conf.evaluate.new_visit_threshold
+    table, visits = get_visits(
+        conf.classify.classify_folder,
+        conf.evaluate.new_visit_threshold,
+        args.table,
+        args.metadata_cache,
+        args.update,
     )
 
     if conf.evaluate.show_extended_evaluation:
-        print_evaluation(visits)
+        print_evaluation(table, visits)
     else:
         print_summary(visits)
 
@@ -0,0 +1,336 @@
+"""
+Columnar table of classifier results for evaluation.
+
+The stats files written by the classifier are read once into NumPy columns, one row
+per clip and one row per track, which can be saved as a single .npz file.  Visits,
+confusion matrices and plots are computed with array group-bys over the columns.
+
+A saved table records the modification time and size of each stats file, so it can be
+brought up to date by reading only the files that are new or changed since.
+"""
+
+import os
+
+import dateutil.parser
+import dateutil.tz
+import numpy as np
+
+from ml_tools.metadatareader import MetadataReader, scan_files
+from .evaluateresults import null_tags as NULL_TAGS
+
+FORMAT_VERSION = 3
+
+# stats times are UTC, they are shifted to NZ time for grouping by day
+TIME_OFFSET = np.timedelta64(13, "h")
+TIME_UNIT = "datetime64[ms]"
+
+CLIP_COLUMNS = [
+    "source",
+    "camera",
+    "true_tag",
+    "start_time",
+    "end_time",
+    "best_guess",
+    "best_score",
+    # of the stats file when it was read
+    "file_mtime",
+    "file_size",
+]
+TRACK_COLUMNS = ["clip", "label", "score", "clarity", "start_s", "end_s"]
+
+
+def is_stats_file(filename):
+    """returns if filename is a valid stats file."""
+    # note, we also have track stats files which have 4 parts, date-time-camera-track
+    ext = os.path.splitext(filename)[-1].lower()
+    parts = filename.split("-")
+    return ext == ".txt" and len(parts) == 3
+
+
+def parse_time(text):
+    time = dateutil.parser.parse(text)
+    if time.tzinfo is not None:
+        time = time.astimezone(dateutil.tz.UTC).replace(tzinfo=None)
+    return np.datetime64(time, "ms") + TIME_OFFSET
+
+
+def track_confidence(score, clarity):
+    """The tracks 'confidence' level which is a combination of the score and clarity."""
+    return 1 - np.sqrt((1 - score) * (1 - clarity))
+
+
+class ResultTable:
+    """Clip and track results as dictionaries of column arrays"""
+
+    def __init__(self, clips, tracks, null_tags=NULL_TAGS):
+        self.clips = clips
+        self.tracks = tracks
+        # tags that were mapped to none when the table was built
+        self.null_tags = sorted(null_tags)
+
+    @classmethod
+    def from_stats(cls, sources, stats, null_tags=NULL_TAGS, stamps=None):
+        """
+        Makes a table from classifier stats
+        :param sources: name of each stats file
+        :param stats: parsed json of each stats file
+        :param stamps: (modification time in ns, size) of each stats file
+        """
+        clips = {name: [] for name in CLIP_COLUMNS[:5]}
+        tracks = {name: [] for name in TRACK_COLUMNS}
+        for i, (source, clip) in enumerate(zip(sources, stats)):
+            clips["source"].append(source)
+            clips["camera"].append(clip.get("camera", "none"))
+            clips["true_tag"].append(clip.get("original_tag", "unknown"))
+            clips["start_time"].append(parse_time(clip["start_time"]))
+            clips["end_time"].append(parse_time(clip["end_time"]))
+            for track in clip["tracks"]:
+                tracks["clip"].append(i)
+                tracks["label"].append(track["label"])
+                tracks["score"].append(track["confidence"])
+                tracks["clarity"].append(track["clarity"])
+                tracks["start_s"].append(track["start_s"])
+                tracks["end_s"].append(track["end_s"])
+
+        clips = {
+            "source": np.array(clips["source"], dtype=str),
+            "camera": np.array(clips["camera"], dtype=str),
+            "true_tag": replace_null_tags(
+                np.array(clips["true_tag"], dtype=str), null_tags
+            ),
+            "start_time": np.array(clips["start_time"], dtype=TIME_UNIT),
+            "end_time": np.array(clips["end_time"], dtype=TIME_UNIT),
+        }
+        tracks = {
+            "clip": np.array(tracks["clip"], dtype=np.int32),
+            "label": replace_null_tags(np.array(tracks["label"], dtype=str), null_tags),
+            "score": np.array(tracks["score"], dtype=np.float64),
+            "clarity": np.array(tracks["clarity"], dtype=np.float64),
+            "start_s": np.array(tracks["start_s"], dtype=np.float64),
+            "end_s": np.array(tracks["end_s"], dtype=np.float64),
+        }
+        clips["best_guess"], clips["best_score"] = best_guesses(
+            len(sources),
+            tracks["clip"],
+            tracks["label"],
+            track_confidence(tracks["score"], tracks["clarity"]),
+        )
+        if stamps is None:
+            stamps = np.zeros((len(sources), 2), dtype=np.int64)
+        stamps = np.array(stamps, dtype=np.int64).reshape(-1, 2)
+        clips["file_mtime"] = stamps[:, 0]
+        clips["file_size"] = stamps[:, 1]
+        return cls(clips, tracks, null_tags)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Returns a table with the rows of each of tables in turn"""
+        offsets = np.cumsum([0] + [len(table) for table in tables[:-1]])
+        clips = {
+            name: np.concatenate([table.clips[name] for table in tables])
+            for name in CLIP_COLUMNS
+        }
+        tracks = {
+            name: np.concatenate([table.tracks[name] for table in tables])
+            for name in TRACK_COLUMNS
+        }
+        tracks["clip"] = np.concatenate(
+            [table.tracks["clip"] + offset for table, offset in zip(tables, offsets)]
+        ).astype(np.int32)
+        return cls(clips, tracks, tables[0].null_tags)
+
+    def select(self, rows):
+        """Returns a table of the clips in rows, in that order, and their tracks"""
+        new_row = np.full(len(self), -1, dtype=np.int32)
+        new_row[rows] = np.arange(len(rows))
+        track_clip = new_row[self.tracks["clip"]]
+        tracks = np.flatnonzero(track_clip >= 0)
+        tracks = tracks[np.argsort(track_clip[tracks], kind="stable")]
+        clips = {name: values[rows] for name, values in self.clips.items()}
+        tracks = {name: values[tracks] for name, values in self.tracks.items()}
+        tracks["clip"] = new_row[tracks["clip"]]
+        return ResultTable(clips, tracks, self.null_tags)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            version = int(data["version"])
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    "Results table {} has version {}, expected {}".format(
+                        filename, version, FORMAT_VERSION
+                    )
+                )
+            clips = {name: data["clip_" + name] for name in CLIP_COLUMNS}
+            tracks = {name: data["track_" + name] for name in TRACK_COLUMNS}
+            null_tags = [str(tag) for tag in data["null_tags"]]
+        return cls(clips, tracks, null_tags)
+
+    def save(self, filename):
+        columns = {"clip_" + name: values for name, values in self.clips.items()}
+        columns.update(
+            {"track_" + name: values for name, values in self.tracks.items()}
+        )
+        with open(filename, "wb") as f:
+            np.savez(
+                f,
+                version=FORMAT_VERSION,
+                null_tags=np.array(self.null_tags, dtype=str),
+                **columns,
+            )
+
+    def __len__(self):
+        return len(self.clips["source"])
+
+    @property
+    def track_confidence(self):
+        return track_confidence(self.tracks["score"], self.tracks["clarity"])
+
+    @property
+    def track_true_tag(self):
+        return self.clips["true_tag"][self.tracks["clip"]]
+
+    @property
+    def duration(self):
+        """Duration of each clip in seconds"""
+        return (self.clips["end_time"] - self.clips["start_time"]) / np.timedelta64(
+            1, "s"
+        )
+
+
+def replace_null_tags(tags, null_tags):
+    return np.where(np.isin(tags, null_tags), "none", tags)
+
+
+def best_guesses(num_clips, track_clip, labels, confidence):
+    """
+    Returns the best label and confidence of each clip from its tracks.  False-positives
+    are weighted lower so an animal that co-occurs with them is chosen.
+    """
+    confidence = np.where(labels == "none", confidence * 0.5, confidence)
+    best_score = np.zeros(num_clips)
+    np.maximum.at(best_score, track_clip, confidence)
+    best_guess = np.full(num_clips, "none", dtype=object)
+    # the first track with the best confidence, if it is above 0
+    best = np.flatnonzero((confidence == best_score[track_clip]) & (confidence > 0))
+    clips, first = np.unique(track_clip[best], return_index=True)
+    best_guess[clips] = labels[best[first]]
+    return best_guess.astype(str), best_score
+
+
+def ingest_folder(path, null_tags=NULL_TAGS, reader=None, table=None):
+    """
+    Reads every clip stats file in path into a ResultTable
+    :param reader: MetadataReader to read the files with, files that can't be read are skipped
+    :param table: a previously ingested table to update, only stats files that are new
+        or changed since are read and clips of deleted files are dropped
+    :return: the table, sorted by source, and the number of files read
+    """
+    if reader is None:
+        reader = MetadataReader()
+    files = {}
+    for entry in scan_files(path, is_stats_file, False):
+        stat = entry.stat()
+        files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+    tables = []
+    if table is not None:
+        unchanged = [
+            files.get(source) == (mtime, size)
+            for source, mtime, size in zip(
+                table.clips["source"],
+                table.clips["file_mtime"],
+                table.clips["file_size"],
+            )
+        ]
+        tables.append(table.select(np.flatnonzero(unchanged)))
+        for source in tables[0].clips["source"]:
+            del files[source]
+
+    names = sorted(files)
+    sources, stats, stamps = [], [], []
+    for name, (_, clip_stats) in zip(
+        names, reader.iter_read(os.path.join(path, name) for name in names)
+    ):
+        if clip_stats is not None:
+            sources.append(name)
+            stats.append(clip_stats)
+            stamps.append(files[name])
+    tables.append(ResultTable.from_stats(sources, stats, null_tags, stamps))
+    table = ResultTable.concatenate(tables)
+    return table.select(np.argsort(table.clips["source"], kind="stable")), len(names)
+
+
+class Visits:
+    """
+    Clips grouped into visits, as columns with one row per visit.
+    clip_rows holds the table rows of the visits' clips in visit order, clip_visit the
+    visit of every table row or -1 if it is not in a visit.
+    """
+
+    def __init__(self, table, clip_rows, visit_starts):
+        clips = table.clips
+        self.clip_rows = clip_rows
+        visit = np.zeros(len(clip_rows), dtype=np.int32)
+        visit[visit_starts[1:]] = 1
+        visit = np.cumsum(visit)
+        self.clip_visit = np.full(len(table), -1, dtype=np.int32)
+        self.clip_visit[clip_rows] = visit
+        visit_ends = (
+            np.append(visit_starts[1:], len(clip_rows))[: len(visit_starts)] - 1
+        )
+
+        self.camera = clips["camera"][clip_rows[visit_starts]]
+        self.true_tag = clips["true_tag"][clip_rows[visit_starts]]
+        self.start_time = clips["start_time"][clip_rows[visit_starts]]
+        self.end_time = clips["end_time"][clip_rows[visit_ends]]
+
+        # the best guess of the visits highest scoring clip, the latest if tied
+        scores = clips["best_score"][clip_rows]
+        if len(clip_rows):
+            best_score = np.maximum.reduceat(scores, visit_starts)
+        else:
+            best_score = np.zeros(0)
+        best = np.flatnonzero(scores == best_score[visit])
+        last = np.ones(len(best), dtype=bool)
+        last[:-1] = visit[best][1:] != visit[best][:-1]
+        best_rows = clip_rows[best[last]]
+        self.predicted_tag = clips["best_guess"][best_rows]
+        self.predicted_confidence = clips["best_score"][best_rows]
+
+    def __len__(self):
+        return len(self.camera)
+
+    @property
+    def duration(self):
+        """Duration of each visit in seconds"""
+        return (self.end_time - self.start_time) / np.timedelta64(1, "s")
+
+    @property
+    def mid_time(self):
+        return self.start_time + (self.end_time - self.start_time) / 2
+
+
+def group_visits(table, visit_threshold, classes):
+    """
+    Groups clips of each camera into visits. A new visit starts when the gap from the
+    previous clip is at least visit_threshold seconds, or the true tag changes.
+    Only clips whose true tag and best guess are in classes are used.
+    """
+    clips = table.clips
+    rows = np.flatnonzero(
+        np.isin(clips["best_guess"], classes) & np.isin(clips["true_tag"], classes)
+    )
+    rows = rows[np.lexsort((clips["start_time"][rows], clips["camera"][rows]))]
+    camera = clips["camera"][rows]
+    true_tag = clips["true_tag"][rows]
+    gap = (clips["start_time"][rows][1:] - clips["end_time"][rows][:-1]) / (
+        np.timedelta64(1, "s")
+    )
+    new_visit = np.ones(len(rows), dtype=bool)
+    new_visit[1:] = (
+        (camera[1:] != camera[:-1])
+        | (true_tag[1:] != true_tag[:-1])
+        | (gap >= visit_threshold)
+    )
+    return Visits(table, rows, np.flatnonzero(new_visit))
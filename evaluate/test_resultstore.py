@@ -0,0 +1,131 @@
+import json
+import os
+
+import numpy as np
+
+from evaluate.evaluateresults import null_tags as NULL_TAGS
+from evaluate.resultstore import ResultTable, group_visits, ingest_folder
+
+CLASSES = ["bird", "possum", "rat", "none"]
+
+
+def clip_stats(camera, tag, start_minute, tracks, length=1):
+    return {
+        "camera": camera,
+        "original_tag": tag,
+        "start_time": "2020-01-01T10:{:02d}:00+00:00".format(start_minute),
+        "end_time": "2020-01-01T10:{:02d}:00+00:00".format(start_minute + length),
+        "tracks": [
+            {
+                "label": label,
+                "confidence": confidence,
+                "clarity": 0.5,
+                "start_s": 0,
+                "end_s": 10,
+            }
+            for label, confidence in tracks
+        ],
+    }
+
+
+def make_table():
+    stats = [
+        # camera a: two possum clips close together, then a bird after a gap
+        clip_stats("a", "possum", 0, [("possum", 0.9), ("false-positive", 0.95)]),
+        clip_stats("a", "possum", 2, [("rat", 0.8)]),
+        clip_stats("a", "bird", 30, [("bird", 0.7)]),
+        # camera b: the tag changes between clips without a gap
+        clip_stats("b", "rat", 2, [("rat", 0.6)]),
+        clip_stats("b", "possum", 3, [("possum", 0.6)]),
+        # no tracks so the best guess is none
+        clip_stats("b", "no-tag", 40, []),
+        # not a class, excluded from visits
+        clip_stats("b", "cat", 50, [("cat", 0.9)]),
+    ]
+    return ResultTable.from_stats(
+        ["{}.txt".format(i) for i in range(len(stats))], stats
+    )
+
+
+def write_stats(folder, name, stats):
+    with open(os.path.join(folder, name), "w") as f:
+        json.dump(stats, f)
+
+
+def assert_tables_equal(table, expected):
+    for name, values in expected.clips.items():
+        assert np.array_equal(table.clips[name], values), name
+    for name, values in expected.tracks.items():
+        assert np.array_equal(table.tracks[name], values), name
+
+
+class TestResultStore:
+    def test_best_guesses(self):
+        table = make_table()
+        assert list(table.clips["best_guess"]) == [
+            "possum",
+            "rat",
+            "bird",
+            "rat",
+            "possum",
+            "none",
+            "cat",
+        ]
+        assert list(table.clips["true_tag"][4:6]) == ["possum", "none"]
+        assert table.clips["best_score"][5] == 0
+        # false-positives are renamed none and weighted lower
+        assert table.tracks["label"][1] == "none"
+        assert np.isclose(table.clips["best_score"][0], 1 - np.sqrt(0.1 * 0.5))
+
+    def test_group_visits(self):
+        table = make_table()
+        visits = group_visits(table, 180, CLASSES)
+        assert list(visits.camera) == ["a", "a", "b", "b", "b"]
+        assert list(visits.true_tag) == ["possum", "bird", "rat", "possum", "none"]
+        # the highest scoring clip of the visit
+        assert list(visits.predicted_tag) == ["possum", "bird", "rat", "possum", "none"]
+        assert list(visits.clip_visit) == [0, 0, 1, 2, 3, 4, -1]
+        assert list(visits.duration) == [180, 60, 60, 60, 60]
+
+    def test_save_load(self, tmp_path):
+        table = make_table()
+        filename = str(tmp_path / "results.npz")
+        table.save(filename)
+        loaded = ResultTable.load(filename)
+        assert_tables_equal(loaded, table)
+        assert loaded.null_tags == sorted(NULL_TAGS)
+
+    def test_ingest_updates(self, tmp_path):
+        folder = str(tmp_path)
+        write_stats(folder, "20200101-100000-a.txt", clip_stats("a", "rat", 0, []))
+        write_stats(
+            folder, "20200101-100200-a.txt", clip_stats("a", "rat", 2, [("rat", 0.6)])
+        )
+        write_stats(
+            folder, "20200101-100500-b.txt", clip_stats("b", "bird", 5, [("bird", 1)])
+        )
+        table, files_read = ingest_folder(folder)
+        assert files_read == 3
+
+        # one file changed, one new and one deleted
+        write_stats(
+            folder,
+            "20200101-100200-a.txt",
+            clip_stats("a", "possum", 2, [("possum", 0.8), ("rat", 0.2)]),
+        )
+        os.utime(os.path.join(folder, "20200101-100200-a.txt"), ns=(1, 1))
+        write_stats(
+            folder, "20200101-100100-c.txt", clip_stats("c", "rat", 1, [("rat", 0.5)])
+        )
+        os.remove(os.path.join(folder, "20200101-100500-b.txt"))
+
+        updated, files_read = ingest_folder(folder, table=table)
+        assert files_read == 2
+        assert list(updated.clips["source"]) == [
+            "20200101-100000-a.txt",
+            "20200101-100100-c.txt",
+            "20200101-100200-a.txt",
+        ]
+        assert_tables_equal(updated, ingest_folder(folder)[0])
+        _, files_read = ingest_folder(folder, table=updated)
+        assert files_read == 0
@@ -371,6 +371,8 @@ class Clip:
         )
         if self.calc_stats:
             self.stats.add_frame(thermal, filtered)
+        else:
+            self.stats.update_temp_range(thermal)
 
 
 class ClipStats:
@@ -392,13 +394,18 @@ class ClipStats:
         self.average_delta = None
         self.is_static_background = None
 
-    def add_frame(self, thermal, filtered):
-        f_median = np.median(thermal)
+    def update_temp_range(self, thermal):
+        """Updates the running min and max temperature with a frame, returning its min and max"""
         f_max = np.max(thermal)
         f_min = np.min(thermal)
-        f_mean = np.nanmean(thermal)
         self.max_temp = null_safe_compare(self.max_temp, f_max, max)
         self.min_temp = null_safe_compare(self.min_temp, f_min, min)
+        return f_min, f_max
+
+    def add_frame(self, thermal, filtered):
+        f_median = np.median(thermal)
+        f_min, f_max = self.update_temp_range(thermal)
+        f_mean = np.nanmean(thermal)
 
         self.frame_stats_min.append(f_min)
         self.frame_stats_max.append(f_max)
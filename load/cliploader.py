@@ -29,6 +29,8 @@ from track.region import Region
 from ml_tools import tools
 
 from ml_tools.kerasmodel import KerasModel
+from ml_tools.metadatareader import MetadataReader, scan_files
+from ml_tools.mpeg_creator import purge_outputs
 from ml_tools.previewer import Previewer
 from ml_tools.trackdatabase import TrackDatabase
 from .clip import Clip
@@ -48,16 +50,16 @@ def process_job(loader, queue, model_file=None):
         classifier.load_model(model_file)
     while True:
         i += 1
-        clip_id = queue.get()
+        job = queue.get()
+        if job == "DONE":
+            break
+        filename, metadata = job
         try:
-            if clip_id == "DONE":
-                break
-            else:
-                loader.process_file(str(clip_id), classifier=classifier)
+            loader.process_file(filename, classifier=classifier, metadata=metadata)
             if i % 50 == 0:
                 logging.info("%s jobs left", queue.qsize())
         except Exception as e:
-            logging.error("Process_job error %s %s", clip_id, e)
+            logging.error("Process_job error %s %s", filename, e)
             traceback.print_exc()
 
 
@@ -177,13 +179,26 @@ class ClipLoader:
         if root is None:
             root = self.config.source_folder
 
-        for folder_path, _, files in os.walk(root):
-            for name in files:
-                if os.path.splitext(name)[1] == ".cptv":
-                    full_path = os.path.join(folder_path, name)
-                    job_queue.put(full_path)
-
-        logging.info("Processing %d", job_queue.qsize())
+        # metadata is read in bulk here, so workers start on clips as they are found
+        clips = (
+            entry.path
+            for entry in scan_files(
+                root, lambda name: os.path.splitext(name)[1] == ".cptv"
+            )
+        )
+        reader = MetadataReader()
+        jobs = 0
+        for metadata_filename, metadata in reader.iter_read(
+            os.path.splitext(filename)[0] + ".txt" for filename in clips
+        ):
+            # clips without metadata are skipped, the reader has logged why
+            if metadata is None:
+                continue
+            filename = os.path.splitext(metadata_filename)[0] + ".cptv"
+            job_queue.put((filename, metadata))
+            jobs += 1
+
+        logging.info("Processing %d", jobs)
         for i in range(len(processes)):
             job_queue.put("DONE")
         for process in processes:
@@ -295,7 +310,11 @@ class ClipLoader:
         confidence = track_tag.get("confidence", 0)
         return tag and tag not in excluded_tags and confidence >= min_confidence
 
-    def process_file(self, filename, classifier=None):
+    def process_file(self, filename, classifier=None, metadata=None):
+        """
+        Tracks a clip and adds it to the database
+        :param metadata: the clips metadata as loaded from json, read from the file if None
+        """
         start = time.time()
         base_filename = os.path.splitext(os.path.basename(filename))[0]
 
@@ -303,18 +322,23 @@ class ClipLoader:
 
         destination_folder = self._get_dest_folder(base_filename)
         # delete any previous files
-        tools.purge(destination_folder, base_filename + "*.mp4")
+        purge_outputs(
+            destination_folder, base_filename + "*.mp4", self.config.previews_preset
+        )
 
         # read metadata
-        metadata_filename = os.path.join(
-            os.path.dirname(filename), base_filename + ".txt"
-        )
+        if metadata is None:
+            metadata_filename = os.path.join(
+                os.path.dirname(filename), base_filename + ".txt"
+            )
 
-        if not os.path.isfile(metadata_filename):
-            logging.error("No meta data found for %s", metadata_filename)
-            return
+            if not os.path.isfile(metadata_filename):
+                logging.error("No meta data found for %s", metadata_filename)
+                return
 
-        metadata = tools.load_clip_metadata(metadata_filename)
+            metadata = tools.load_clip_metadata(metadata_filename)
+        else:
+            metadata = tools.parse_clip_metadata(metadata)
         if not self.reprocess and self.database.has_clip(str(metadata["id"])):
             if not self.database.has_prediction(str(metadata["id"])) and classifier:
                 logging.info("Adding predictions to %s", filename)
@@ -1,21 +1,94 @@
+import functools
+import heapq
+import json
 import logging
 import multiprocessing
 import os
+import queue
 import time
 from datetime import datetime
 
+from ml_tools.metadatareader import scan_files
 
-def process_job(job):
-    """Just a wrapper to pass tupple containing (extractor, *params) to the process_file method."""
-    processor = job[0]
-    path = job[1]
+# the processor of a worker process, set by init_worker
+worker_processor = None
 
+
+def init_worker(processor):
+    """Pool initializer, keeps processor for the jobs run by this worker and prepares it."""
+    global worker_processor
+    worker_processor = processor
+    # an error raised here makes the pool restart the worker forever, so it is only
+    # logged and the processor is left to prepare itself in process_file
+    try:
+        processor.init_worker()
+    except Exception:
+        logging.exception("Error initialising worker")
+
+
+def process_job(filename):
+    """Processes filename with the worker's processor."""
+    return run_job(worker_processor, filename)
+
+
+def run_job(processor, filename):
+    """
+    Processes filename, logging any error.
+    :return: tuple of (filename, seconds taken, if it succeeded)
+    """
+    start = time.time()
     try:
-        processor.process_file(path)
+        processor.process_file(filename)
+        succeeded = True
     except Exception:
         logging.exception("Warning - error processing job")
+        succeeded = False
 
     time.sleep(0.001)  # apparently gives me a chance to catch the control-c
+    return filename, time.time() - start, succeeded
+
+
+def job_failed(results, filename, error):
+    """Error callback of a job that failed in the pool rather than in process_file."""
+    logging.error("Error processing %s: %s", filename, error)
+    results.put((filename, 0, False))
+
+
+class ProgressJournal:
+    """
+    Records the time taken to process each file, one json object per line, so an
+    interrupted run can skip the files it completed.  Removed when a run finishes.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # files processed successfully by the interrupted run
+        self.completed = set()
+        self._file = None
+        if os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # partly written when the run was interrupted
+                        continue
+                    if entry["succeeded"]:
+                        self.completed.add(entry["file"])
+
+    def record(self, filename, seconds, succeeded):
+        if self._file is None:
+            self._file = open(self.filename, "a")
+        entry = {"file": filename, "seconds": round(seconds, 1), "succeeded": succeeded}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
 
 
 class CPTVFileProcessor:
@@ -24,6 +97,9 @@ class CPTVFileProcessor:
     Supports a worker pool to process multiple files at once.
     """
 
+    # records the files processed so far, in the classify folder
+    JOURNAL_NAME = "process-journal.jsonl"
+
     def __init__(self, config, tracker_config):
 
         self.config = config
@@ -50,19 +126,41 @@ class CPTVFileProcessor:
         """The function to process an individual file."""
         raise Exception("Process file method must be overwritten in sub class.")
 
+    def init_worker(self):
+        """
+        Called once in each worker process, before it processes any files.  Errors are
+        logged and the worker goes on to process files.
+        """
+        pass
+
+    def find_jobs(self, root, skip=()):
+        """Yields (file size, filename) of each cptv file under root that needs processing."""
+        for entry in scan_files(
+            root, lambda name: os.path.splitext(name)[1] == ".cptv"
+        ):
+            if entry.path not in skip and self.needs_processing(entry.path):
+                yield entry.stat().st_size, entry.path
+
     def process_all(self, root):
         if root is None:
             root = self.config.source_folder
 
-        jobs = []
-        for folder_path, _, files in os.walk(root):
-            for name in files:
-                if os.path.splitext(name)[1] == ".cptv":
-                    full_path = os.path.join(folder_path, name)
-                    if self.needs_processing(full_path):
-                        jobs.append((self, full_path))
-
-        self._process_job_list(jobs)
+        journal = ProgressJournal(
+            os.path.join(self.config.classify.classify_folder, self.JOURNAL_NAME)
+        )
+        if journal.completed:
+            logging.info(
+                "Resuming, %d files were already processed", len(journal.completed)
+            )
+        jobs = self.find_jobs(root, journal.completed)
+        if self.workers_threads == 0:
+            # just process the jobs in the main thread
+            init_worker(self)
+            for _, filename in sorted(jobs, reverse=True):
+                journal.record(*run_job(self, filename))
+        else:
+            self._process_job_list(jobs, journal)
+        journal.finish()
 
     def needs_processing(self, filename):
         """
@@ -90,32 +188,59 @@ class CPTVFileProcessor:
         else:
             return not os.path.exists(meta_filename)
 
-    def _process_job_list(self, jobs):
+    def _process_job_list(self, jobs, journal):
         """
-        Processes a list of jobs. Supports worker threads.
-        :param jobs: List of jobs to process
+        Processes jobs on a pool of worker processes while they are still being found.
+        Each time a worker is free it is given the largest file found so far, so long
+        files don't hold up the end of the run.
+        :param jobs: iterable of (file size, filename)
+        :param journal: ProgressJournal the result of each job is recorded to
         """
 
-        if self.workers_threads == 0:
-            # just process the jobs in the main thread
-            for job in jobs:
-                process_job(job)
-        else:
-            # send the jobs to a worker pool
-            pool = multiprocessing.Pool(self.workers_threads)
-            try:
-                # see https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
-                pool.map(process_job, jobs, chunksize=1)
-                pool.close()
-                pool.join()
-            except KeyboardInterrupt:
-                logging.info("KeyboardInterrupt, terminating.")
-                pool.terminate()
-                exit()
-            except Exception:
-                logging.exception("Error processing files")
-            else:
-                pool.close()
+        pool = multiprocessing.Pool(
+            self.workers_threads, initializer=init_worker, initargs=(self,)
+        )
+        results = queue.Queue()
+        # heap of (-file size, filename) waiting for a worker
+        pending = []
+        running = 0
+        jobs = iter(jobs)
+        walking = True
+        try:
+            while walking or pending or running:
+                if walking:
+                    job = next(jobs, None)
+                    if job is None:
+                        walking = False
+                    else:
+                        heapq.heappush(pending, (-job[0], job[1]))
+
+                while pending and running < self.workers_threads:
+                    _, filename = heapq.heappop(pending)
+                    pool.apply_async(
+                        process_job,
+                        (filename,),
+                        callback=results.put,
+                        error_callback=functools.partial(job_failed, results, filename),
+                    )
+                    running += 1
+
+                # collect finished jobs, waiting for one once all jobs are found
+                wait = not walking
+                while running:
+                    try:
+                        result = results.get(block=wait)
+                    except queue.Empty:
+                        break
+                    wait = False
+                    running -= 1
+                    journal.record(*result)
+        except KeyboardInterrupt:
+            logging.info("KeyboardInterrupt, terminating.")
+            pool.terminate()
+            exit()
+        pool.close()
+        pool.join()
 
     def log_message(self, message):
         """Record message in stdout.  Will be printed if verbose is enabled."""
@@ -7,22 +7,28 @@ Dataset used for training a tensorflow model from track data.
 Tracks are broken into segments.  Filtered, and then passed to the trainer using a weighted random sample.
 
 """
+
 import logging
 import math
 import multiprocessing
 import os
 import queue
-import random
 import threading
 import time
 
 import dateutil
 import numpy as np
 
-from ml_tools.datasetstructures import TrackHeader, SegmentHeader, Camera
+from ml_tools.datasetstructures import (
+    TrackHeader,
+    SegmentHeader,
+    Camera,
+    FrameSample,
+)
 from ml_tools.trackdatabase import TrackDatabase
-from ml_tools.preprocess import preprocess_segment
+from ml_tools.preprocess import augment_segment, preprocess_segment, segment_array
 from ml_tools.imageprocessing import clear_frame
+from ml_tools.segmentcache import SegmentCache
 
 
 class TrackChannels:
@@ -35,6 +41,93 @@ class TrackChannels:
     mask = 4
 
 
+class SampleWeights:
+    """
+    Sampling weights for a list of samples, held in contiguous arrays along with the
+    cumulative sums so whole batches can be drawn with np.searchsorted.
+    """
+
+    def __init__(self, weights, label_index, num_labels, bin_index=None, scale=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        # index of each samples (mapped) label in Dataset.labels, samples with a label
+        # of -1 are not in the dataset labels and are never chosen
+        self.label_index = np.asarray(label_index, dtype=np.int32)
+        self.num_labels = num_labels
+        self.bin_index = (
+            None if bin_index is None else np.asarray(bin_index, dtype=np.int32)
+        )
+        # per sample multiplier used when sampling, but not stored in the weights
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.cdf = None
+        self.label_samples = None
+        self.label_cdf = None
+        self.update()
+
+    def __len__(self):
+        return len(self.weights)
+
+    def update(self):
+        """Recalculates the cumulative sums after the weights have changed"""
+        p = self.weights if self.scale is None else self.weights * self.scale
+        unlabelled = self.label_index < 0
+        if np.any(unlabelled):
+            p = np.where(unlabelled, 0, p)
+        self.cdf = np.cumsum(p)
+        counts = np.bincount(self.label_index + 1, minlength=self.num_labels + 1)
+        order = np.argsort(self.label_index, kind="stable")
+        self.label_samples = np.split(order, np.cumsum(counts)[:-1])[1:]
+        self.label_cdf = [np.cumsum(p[samples]) for samples in self.label_samples]
+
+    def label_totals(self):
+        """Returns the total weight for each label"""
+        return np.bincount(
+            self.label_index + 1, weights=self.weights, minlength=self.num_labels + 1
+        )[1:]
+
+    def rescale(self, factors):
+        """Multiplies the weight of each sample by factors"""
+        self.weights *= factors
+        self.update()
+
+    def rescale_labels(self, label_factors):
+        """Multiplies the weight of each sample by the factor for its label"""
+        # unlabelled samples (-1) index the appended 1
+        self.rescale(np.append(label_factors, 1.0)[self.label_index])
+
+    def keep(self, mask):
+        """Removes samples where mask is False"""
+        self.weights = self.weights[mask]
+        self.label_index = self.label_index[mask]
+        if self.bin_index is not None:
+            self.bin_index = self.bin_index[mask]
+        if self.scale is not None:
+            self.scale = self.scale[mask]
+        self.update()
+
+    def sample(self, n, label_index=None, rng=None):
+        """
+        Returns the indices of n weighted random samples
+        :param label_index: if specified only samples of this label are chosen
+        :param rng: random generator to use, defaults to np.random
+        """
+        if rng is None:
+            rng = np.random
+        if label_index is None:
+            cdf = self.cdf
+            samples = None
+        else:
+            cdf = self.label_cdf[label_index]
+            samples = self.label_samples[label_index]
+        if len(cdf) == 0 or cdf[-1] <= 0:
+            return np.empty(0, dtype=np.int64)
+        choice = np.searchsorted(cdf, rng.random(n) * cdf[-1], side="right")
+        # guard against rounding at the top of the range
+        np.minimum(choice, len(cdf) - 1, out=choice)
+        if samples is None:
+            return choice
+        return samples[choice]
+
+
 class Dataset:
     """
     Stores visit, clip, track, and segment information headers in memory, and allows track / segment streaming from
@@ -48,11 +141,19 @@ class Dataset:
     # transfer time required per segment.  Processes scale much better but require ~1ms to pickling the segments
     # across processes.
     # In general if worker threads is one set this to False, if it is two or more set it to True.
+    # Threads scale better when the track database is opened read_only, as decompression then
+    # happens outside of h5py's lock.
     PROCESS_BASED = True
 
     # number of pixels to inset from frame edges by default
     DEFAULT_INSET = 2
 
+    # size frames are scaled to when preprocessed
+    FRAME_SIZE = 48
+
+    # number of tracks in each load_tracks job
+    LOAD_SHARD_SIZE = 100
+
     def __init__(
         self,
         track_db: TrackDatabase,
@@ -60,6 +161,7 @@ class Dataset:
         config=None,
         use_segments=True,
         consecutive_segments=False,
+        seed=None,
     ):
         self.consecutive_segments = consecutive_segments
         self.camera_bins = {}
@@ -79,14 +181,12 @@ class Dataset:
 
         # writes the frame motion into the center of the optical flow channels
         self.encode_frame_offsets_in_flow = False
-        self.segment_cdf = []
-        self.segment_label_cdf = {}
+        self.segment_weights = None
         self.segments = []
         self.segments_by_label = {}
         self.segments_by_id = {}
 
-        self.frame_cdf = []
-        self.frame_label_cdf = {}
+        self.frame_weights = None
 
         self.frame_samples = []
         self.clips_to_samples = {}
@@ -106,6 +206,12 @@ class Dataset:
         self.preloader_queue = None
         self.preloader_threads = None
         self.preloader_stop_flag = False
+        # optional SegmentCache of preprocessed frames, used instead of the track db
+        self.segment_cache = None
+
+        # all sampling and augmentation draws from this generator, async workers are
+        # given independent generators spawned from the same seed sequence
+        self.set_seed(seed)
         # a copy of our entire dataset, if loaded.
         self.X = None
         self.y = None
@@ -138,6 +244,59 @@ class Dataset:
             "no_data": 0,
         }
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # segments and frames are pickled as arrays of (track, index) so pickle size
+        # scales with the number of tracks rather than samples
+        track_index = {id(track): i for i, track in enumerate(self.tracks)}
+        state["segments"] = encode_segments(self.segments, track_index)
+        state["segments_by_label"] = {
+            label: encode_segments(segments, track_index)
+            for label, segments in self.segments_by_label.items()
+        }
+        del state["segments_by_id"]
+        state["frame_samples"] = encode_frames(self.frame_samples, track_index)
+        state["frames_by_label"] = {
+            label: encode_frames(frames, track_index)
+            for label, frames in self.frames_by_label.items()
+        }
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.segments = decode_segments(state["segments"], self.tracks)
+        self.segments_by_label = {
+            label: decode_segments(segments, self.tracks)
+            for label, segments in state["segments_by_label"].items()
+        }
+        self.segments_by_id = {
+            segment.id: segment
+            for segments in self.segments_by_label.values()
+            for segment in segments
+        }
+        self.frame_samples = decode_frames(state["frame_samples"], self.tracks)
+        self.frames_by_label = {
+            label: decode_frames(frames, self.tracks)
+            for label, frames in state["frames_by_label"].items()
+        }
+
+    def set_seed(self, seed):
+        """
+        Resets the random generator used for sampling and augmentation.
+        :param seed: run seed, an int or sequence of ints, None for fresh entropy
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+    def use_segment_cache(self, filename):
+        """
+        Fetch preprocessed frames from the segment cache at filename, tracks missing
+        from the cache are still read from the track database.
+        """
+        self.segment_cache = SegmentCache(
+            filename, frame_size=self.FRAME_SIZE, default_inset=self.DEFAULT_INSET
+        )
+
     @property
     def rows(self):
         return len(self.segments)
@@ -178,7 +337,7 @@ class Dataset:
             )
         return segments, frames, tracks, bins, weight
 
-    def next_batch(self, n, disable_async=False, force_no_augmentation=False):
+    def next_batch(self, n, disable_async=False, force_no_augmentation=False, rng=None):
         """
         Returns a batch of n segments (X, y) from dataset.
         Applies augmentation and preprocessing automatically.
@@ -186,6 +345,7 @@ class Dataset:
         :param disable_async: forces fetching of segment in this thread / process rather than collecting from
             an aync reader queue (if one exists)
         :param force_no_augmentation: forces augmentation off, may disable asyc loading.
+        :param rng: random generator used for sampling and augmentation, defaults to self.rng
         :return: X of shape [n, channels, height, width], y (labels) of shape [n]
         """
 
@@ -205,14 +365,18 @@ class Dataset:
 
             return np.asarray(batch_X), np.asarray(batch_y)
 
-        segments = [self.sample_segment() for _ in range(n)]
+        if rng is None:
+            rng = self.rng
+        segments = self.sample_segments(n, rng=rng)
 
         batch_X = []
         batch_y = []
 
         for segment in segments:
             data = self.fetch_segment(
-                segment, augment=self.enable_augmentation and not force_no_augmentation
+                segment,
+                augment=self.enable_augmentation and not force_no_augmentation,
+                rng=rng,
             )
             batch_X.append(data)
             batch_y.append(self.labels.index(segment.label))
@@ -227,23 +391,82 @@ class Dataset:
 
         return batch_X, batch_y
 
-    def load_tracks(self, shuffle=False, before_date=None, after_date=None):
+    def load_tracks(
+        self, shuffle=False, before_date=None, after_date=None, workers=0, seed=None
+    ):
         """
         Loads track headers from track database with optional filter
+        :param workers: number of processes to build track headers with, 0 loads in this process
+        :param seed: if specified the shuffle and segment sampling are seeded so the
+            dataset is the same for any number of workers
         :return: [number of tracks added, total tracks].
         """
-        labels = self.db.get_labels()
-        counter = 0
         track_ids = self.db.get_all_track_ids(
             before_date=before_date, after_date=after_date
         )
         if shuffle:
-            np.random.shuffle(track_ids)
-        for clip_id, track_id in track_ids:
-            if self.load_track(clip_id, track_id, labels):
-                counter += 1
+            rng = np.random if seed is None else np.random.RandomState(seed)
+            rng.shuffle(track_ids)
+        # make sure we don't already have these tracks
+        new_ids = [
+            (clip_id, track_id)
+            for clip_id, track_id in track_ids
+            if "{}-{}".format(clip_id, track_id) not in self.tracks_by_bin
+        ]
+        # every shard samples from its own generator, also when no seed is given, as
+        # forked workers would otherwise share the global random state
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        jobs = [
+            (new_ids[start : start + self.LOAD_SHARD_SIZE], seed, shard)
+            for shard, start in enumerate(range(0, len(new_ids), self.LOAD_SHARD_SIZE))
+        ]
+
+        pool = None
+        if workers == 0:
+            results = (self.load_track_shard(*job) for job in jobs)
+        else:
+            pool = multiprocessing.Pool(
+                workers, initializer=init_track_loader, initargs=(self,)
+            )
+            # imap keeps results in job order so the merge is deterministic
+            results = pool.imap(load_track_shard, jobs)
+        counter = 0
+        try:
+            for headers, filtered_stats in results:
+                for key, value in filtered_stats.items():
+                    self.filtered_stats[key] += value
+                for track_header in headers:
+                    track_header.assign_segment_ids()
+                    self.add_loaded_track(track_header)
+                    counter += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
         return [counter, len(track_ids)]
 
+    def load_track_shard(self, track_ids, seed=None, shard=0):
+        """
+        Creates track headers for a list of tracks, run by load_tracks workers
+        :param seed: segment sampling is seeded by seed and shard, fresh entropy if None
+        :return: (track headers, filtered stats)
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        rng = np.random.default_rng([seed, shard])
+        filtered_stats = {key: 0 for key in self.filtered_stats}
+        headers = []
+        for clip_id, _, clip_meta, track_meta, predictions in self.db.get_tracks_meta(
+            track_ids
+        ):
+            track_header = self.create_track_header(
+                clip_id, clip_meta, track_meta, predictions, filtered_stats, rng
+            )
+            if track_header is not None:
+                headers.append(track_header)
+        return headers, filtered_stats
+
     def add_tracks(self, tracks, max_segments_per_track=None):
         """
         Adds list of tracks to dataset
@@ -263,8 +486,10 @@ class Dataset:
         # gp test less segments more tracks
         if max_segments_per_track is not None:
             if len(track_header.segments) > max_segments_per_track:
-                segments = random.sample(track_header.segments, max_segments_per_track)
-                track_header.segments = segments
+                chosen = self.rng.choice(
+                    len(track_header.segments), max_segments_per_track, replace=False
+                )
+                track_header.segments = [track_header.segments[i] for i in chosen]
 
         self.tracks.append(track_header)
         self.add_track_to_mappings(track_header)
@@ -289,12 +514,31 @@ class Dataset:
         clip_meta = self.db.get_clip_meta(clip_id)
         track_meta = self.db.get_track_meta(clip_id, track_id)
         predictions = self.db.get_track_predictions(clip_id, track_id)
-        if self.filter_track(clip_meta, track_meta):
+        track_header = self.create_track_header(
+            clip_id, clip_meta, track_meta, predictions
+        )
+        if track_header is None:
             return False
+        self.add_loaded_track(track_header)
+        return True
+
+    def create_track_header(
+        self, clip_id, clip_meta, track_meta, predictions, filtered_stats=None, rng=None
+    ):
+        """
+        Creates a track header and its segments
+        :param filtered_stats: stats to count filtered tracks and segments in, defaults
+            to this datasets stats
+        :param rng: random generator used to create segments
+        :return: the TrackHeader or None if it was filtered out
+        """
+        if filtered_stats is None:
+            filtered_stats = self.filtered_stats
+        if self.filter_track(clip_meta, track_meta, filtered_stats):
+            return None
         track_header = TrackHeader.from_meta(
             clip_id, clip_meta, track_meta, predictions
         )
-        self.tracks.append(track_header)
         segment_frame_spacing = int(
             round(self.segment_spacing * track_header.frames_per_second)
         )
@@ -306,27 +550,30 @@ class Dataset:
                 segment_width,
                 self.segment_min_mass,
                 use_important=not self.consecutive_segments,
+                rng=rng,
             )
 
-        self.filtered_stats["segment_mass"] += track_header.filtered_stats[
-            "segment_mass"
-        ]
+        filtered_stats["segment_mass"] += track_header.filtered_stats["segment_mass"]
+        return track_header
+
+    def add_loaded_track(self, track_header):
+        self.tracks.append(track_header)
         self.segments.extend(track_header.segments)
         self.add_track_to_mappings(track_header)
 
-        return True
-
-    def filter_track(self, clip_meta, track_meta):
+    def filter_track(self, clip_meta, track_meta, filtered_stats=None):
+        if filtered_stats is None:
+            filtered_stats = self.filtered_stats
         # some clips are banned for various reasons
         source = os.path.basename(clip_meta["filename"])
         if self.banned_clips and source in self.banned_clips:
-            self.filtered_stats["banned"] += 1
+            filtered_stats["banned"] += 1
             return True
         if "tag" not in track_meta:
-            self.filtered_stats["tags"] += 1
+            filtered_stats["tags"] += 1
             return True
         if track_meta["tag"] not in self.included_labels:
-            self.filtered_stats["tags"] += 1
+            filtered_stats["tags"] += 1
             return True
 
         # filter by date
@@ -335,13 +582,13 @@ class Dataset:
             and dateutil.parser.parse(clip_meta["start_time"]).date()
             > self.clip_before_date.date()
         ):
-            self.filtered_stats["date"] += 1
+            filtered_stats["date"] += 1
             return True
 
         # always let the false-positives through as we need them even though they would normally
         # be filtered out.
         if "bounds_history" not in track_meta or len(track_meta["bounds_history"]) == 0:
-            self.filtered_stats["no_data"] += 1
+            filtered_stats["no_data"] += 1
             return True
 
         if track_meta["tag"] == "false-positive":
@@ -349,7 +596,7 @@ class Dataset:
 
         # for some reason we get some records with a None confidence?
         if track_meta.get("confidence", 0.0) <= 0.6:
-            self.filtered_stats["confidence"] += 1
+            filtered_stats["confidence"] += 1
             return True
 
         # remove tracks of trapped animals
@@ -357,14 +604,14 @@ class Dataset:
             "trap" in clip_meta.get("event", "").lower()
             or "trap" in clip_meta.get("trap", "").lower()
         ):
-            self.filtered_stats["trap"] += 1
+            filtered_stats["trap"] += 1
             return True
 
         return False
 
     def add_track_to_mappings(self, track_header):
         if self.label_mapping and track_header.label in self.label_mapping:
-            track_header.label = self.mapped_label(track_header.label)
+            track_header.label = self.label_mapping[track_header.label]
 
         self.tracks_by_id[track_header.unique_id] = track_header
         bins = self.tracks_by_bin.setdefault(track_header.bin_id, [])
@@ -403,23 +650,32 @@ class Dataset:
         :param track: the track to fetch
         :return: segment data of shape [frames, channels, height, width]
         """
-        data = self.db.get_track(track.clip_id, track.track_number, 0, track.frames)
-        data = preprocess_segment(
-            data,
+        if self.segment_cache is not None and self.segment_cache.has_track(
+            track.clip_id, track.track_id
+        ):
+            return self.segment_cache.get_frames(
+                track.clip_id, track.track_id, 0, track.num_frames
+            )
+        frames = self.db.get_track(track.clip_id, track.track_id, 0, track.num_frames)
+        frames, _ = preprocess_segment(
+            frames,
             reference_level=track.frame_temp_median,
             frame_velocity=track.frame_velocity,
-            encode_frame_offsets_in_flow=self.encode_frame_offsets_in_flow,
             default_inset=self.DEFAULT_INSET,
+            frame_size=self.FRAME_SIZE,
         )
-        return data
+        return segment_array(frames, 0, track.num_frames, self.FRAME_SIZE)
 
-    def fetch_segment(self, segment: SegmentHeader, augment=False):
+    def fetch_segment(self, segment: SegmentHeader, augment=False, rng=None):
         """
         Fetches data for segment.
         :param segment: The segment header to fetch
         :param augment: if true applies data augmentation
+        :param rng: random generator used for augmentation, defaults to self.rng
         :return: segment data of shape [frames, channels, height, width]
         """
+        if rng is None:
+            rng = self.rng
         segment_width = self.segment_length * segment.track.frames_per_second
         # if we are requesting a segment smaller than the default segment size take it from the middle.
         unused_frames = segment.frames - segment_width
@@ -435,43 +691,78 @@ class Dataset:
         if augment and unused_frames > 0:
             # jitter first frame
             prev_frames = first_frame
-            post_frames = segment.track.frames - 1 - last_frame
+            post_frames = segment.track.num_frames - last_frame
             max_jitter = max(5, unused_frames)
             jitter = np.clip(
-                np.random.randint(-max_jitter, max_jitter), -prev_frames, post_frames
+                rng.integers(-max_jitter, max_jitter), -prev_frames, post_frames
             )
         else:
             jitter = 0
         first_frame += jitter
         last_frame += jitter
 
-        data = self.db.get_track(
-            segment.clip_id, segment.track_number, first_frame, last_frame
+        if self.segment_cache is not None and self.segment_cache.has_track(
+            segment.clip_id, segment.track_id
+        ):
+            data = self.segment_cache.get_frames(
+                segment.clip_id, segment.track_id, first_frame, last_frame
+            )
+            if augment:
+                data = augment_segment(data, rng)
+            return data
+
+        frames = self.db.get_track(
+            segment.clip_id, segment.track_id, first_frame, last_frame
         )
 
-        if len(data) != segment_width:
+        if len(frames) != segment_width:
             logging.error(
-                "invalid segment length %d, expected %d", len(data), len(segment_width)
+                "invalid segment length %d, expected %d", len(frames), segment_width
             )
 
-        data = preprocess_segment(
-            data,
+        frames, _ = preprocess_segment(
+            frames,
             segment.track.frame_temp_median[first_frame:last_frame],
             segment.track.frame_velocity[first_frame:last_frame],
             augment=augment,
             default_inset=self.DEFAULT_INSET,
+            frame_size=self.FRAME_SIZE,
+            rng=rng,
         )
-
-        return data
+        return segment_array(frames, first_frame, segment_width, self.FRAME_SIZE)
 
     def sample_segment(self):
         """Returns a random segment from weighted list."""
+        segments = self.sample_segments(1)
+        return segments[0] if segments else None
+
+    def sample_segments(self, n, label=None, rng=None):
+        """
+        Returns n random segments from weighted list.
+        :param label: if specified only segments of this label are sampled
+        :param rng: random generator to use, defaults to self.rng
+        """
         if not self.segments:
-            return None
-        choice = np.random.choice(self.samples(), 1, p=self.segment_cdf)
-        if len(choice) > 0:
-            return choice[0]
-        return None
+            return []
+        label_index = None if label is None else self.labels.index(label)
+        indices = self.get_segment_weights().sample(
+            n, label_index, self.rng if rng is None else rng
+        )
+        return [self.segments[i] for i in indices]
+
+    def sample_frames(self, n, label=None, rng=None):
+        """
+        Returns n random frame samples, each track has equal weight.
+        :param label: if specified only frames of this label are sampled
+        :param rng: random generator to use, defaults to self.rng
+        """
+        if not self.frame_samples:
+            return []
+        label_index = None if label is None else self.labels.index(label)
+        indices = self.get_frame_weights().sample(
+            n, label_index, self.rng if rng is None else rng
+        )
+        return [self.frame_samples[i] for i in indices]
 
     def load_all(self, force=False):
         """Loads all X and y into dataset if required."""
@@ -486,27 +777,23 @@ class Dataset:
         :return:
         """
 
-        label_weight = {}
-        mean_label_weight = 0
-
-        for label in self.labels:
-            label_weight[label] = self.get_label_weight(label)
-            mean_label_weight += label_weight[label] / len(self.labels)
-
-        scale_factor = {}
-        for label in self.labels:
-            modifier = (
+        weights = self.get_segment_weights()
+        label_weight = weights.label_totals()
+        modifiers = np.float64(
+            [
                 1.0 if weight_modifiers is None else weight_modifiers.get(label, 1.0)
-            )
-            if label_weight[label] == 0:
-                scale_factor[label] = 1.0
-            else:
-                scale_factor[label] = mean_label_weight / label_weight[label] * modifier
-
-        for segment in self.segments:
-            segment.weight *= scale_factor.get(segment.label, 1.0)
-
-        self.rebuild_cdf()
+                for label in self.labels
+            ]
+        )
+        scale_factor = np.ones(len(self.labels))
+        np.divide(
+            np.mean(label_weight) * modifiers,
+            label_weight,
+            out=scale_factor,
+            where=label_weight > 0,
+        )
+        weights.rescale_labels(scale_factor)
+        self._store_segment_weights()
 
     def balance_bins(self, max_bin_weight=None):
         """
@@ -514,21 +801,21 @@ class Dataset:
         :param max_bin_weight: bins with more weight than this number will be scaled back to this weight.
         """
 
-        for bin_name, tracks in self.tracks_by_bin.items():
-            bin_weight = sum(track.weight for track in tracks)
-            if bin_weight == 0:
-                continue
-            if max_bin_weight is None:
-                scale_factor = 1 / bin_weight
-                # means each bin has equal possiblity
-            elif bin_weight > max_bin_weight:
-                scale_factor = max_bin_weight / bin_weight
-            else:
-                scale_factor = 1
-            for track in tracks:
-                for segment in track.segments:
-                    segment.weight *= scale_factor
-        self.rebuild_cdf()
+        weights = self.get_segment_weights()
+        bin_weight = np.bincount(weights.bin_index, weights=weights.weights)
+        scale_factor = np.ones(len(bin_weight))
+        if max_bin_weight is None:
+            # means each bin has equal possiblity
+            np.divide(1, bin_weight, out=scale_factor, where=bin_weight > 0)
+        else:
+            np.divide(
+                max_bin_weight,
+                bin_weight,
+                out=scale_factor,
+                where=bin_weight > max_bin_weight,
+            )
+        weights.rescale(scale_factor[weights.bin_index])
+        self._store_segment_weights()
 
     def remove_label(self, label_to_remove):
         """
@@ -537,11 +824,11 @@ class Dataset:
         """
         if label_to_remove not in self.labels:
             return
-        self.segments = [
-            segment for segment in self.segments if segment.label != label_to_remove
-        ]
+        weights = self.get_segment_weights()
+        keep = weights.label_index != self.labels.index(label_to_remove)
+        self.segments = [self.segments[i] for i in np.flatnonzero(keep)]
+        weights.keep(keep)
         self._purge_track_segments()
-        self.rebuild_cdf()
 
     def _purge_track_segments(self):
         """Removes any segments from track_headers where the segment has been deleted"""
@@ -572,7 +859,10 @@ class Dataset:
         sample = (
             self.segments
             if n is None or n >= len(self.segments)
-            else random.sample(self.segments, n)
+            else [
+                self.segments[i]
+                for i in self.rng.choice(len(self.segments), n, replace=False)
+            ]
         )
 
         # fetch a sample to see what the dims are
@@ -604,108 +894,77 @@ class Dataset:
         return normalisation_constants
 
     def rebuild_cdf(self, lbl_p=None):
-        """Calculates the CDF used for fast random sampling for frames and
-        segments, if balance labels is set each label has an equal chance of
-        being chosen
+        """Builds the weight arrays used for fast random sampling for frames and
+        segments
+        :param lbl_p: optional dictionary mapping from label to a multiplier applied
+            when sampling
         """
 
         self.rebuild_segment_cdf(lbl_p=lbl_p)
         self.rebuild_frame_cdf(lbl_p=lbl_p)
 
     def rebuild_frame_cdf(self, lbl_p=None):
-        self.frame_cdf = []
-        total = 0
-        self.frame_label_cdf = {}
-
-        for track in self.tracks:
-            for frame in track.sample_frames:
-                frame_weight = track.frame_weight
-                if lbl_p and track.label in lbl_p:
-                    frame_weight *= lbl_p[track.label]
-                total += frame_weight
-
-                self.frame_cdf.append(frame_weight)
-
-                cdf = self.frame_label_cdf.setdefault(track.label, [])
-                cdf.append(track.frame_weight)
-
-        if len(self.frame_cdf) > 0:
-            self.frame_cdf = [x / total for x in self.frame_cdf]
-
-        for key, cdf in self.frame_label_cdf.items():
-            total = sum(cdf)
-            self.frame_label_cdf[key] = [x / total for x in cdf]
-
-        if self.label_mapping:
-            mapped_cdf = {}
-            labels = list(self.label_mapping.keys())
-            labels.sort()
-            for label in labels:
-                if label not in self.frame_label_cdf:
-                    continue
-                label_cdf = self.frame_label_cdf[label]
-                new_label = self.label_mapping[label]
-                if lbl_p and label in lbl_p:
-                    label_cdf = np.float64(label_cdf)
-                    label_cdf *= lbl_p[label]
-                cdf = mapped_cdf.setdefault(new_label, [])
-                cdf.extend(label_cdf)
-
-            for key, cdf in mapped_cdf.items():
-                total = sum(cdf)
-                mapped_cdf[key] = [x / total for x in cdf]
-            self.frame_label_cdf = mapped_cdf
+        """Builds the frame weight arrays, each frame is weighted by its track frame weight"""
+        tracks = [
+            self.tracks_by_id[sample.unique_track_id] for sample in self.frame_samples
+        ]
+        self.frame_weights = self._sample_weights(
+            self.frame_samples, [track.frame_weight for track in tracks], lbl_p
+        )
 
     def rebuild_segment_cdf(self, lbl_p=None):
-        """Calculates the CDF used for fast random sampling"""
-        self.segment_cdf = []
-        total = 0
-        self.segment_label_cdf = {}
-        for segment in self.segments:
-            seg_weight = segment.weight
-            if lbl_p and segment.track.label in lbl_p:
-                seg_weight *= lbl_p[segment.track.label]
-            total += seg_weight
-            self.segment_cdf.append(seg_weight)
-
-        if len(self.segment_cdf) > 0:
-            self.segment_cdf = [x / total for x in self.segment_cdf]
-
-        # guarantee that the cdf is in the same order that we will sample by
-        for label, segments in self.segments_by_label.items():
-            cdf = self.segment_label_cdf.setdefault(label, [])
-            for segment in segments:
-                cdf.append(segment.weight)
-
-        for key, cdf in self.segment_label_cdf.items():
-            total = sum(cdf)
-            if total > 0:
-                self.segment_label_cdf[key] = [x / total for x in cdf]
-            else:
-                self.segment_label_cdf[key] = []
+        """Builds the segment weight arrays used for fast random sampling"""
+        bin_ids = {}
+        self.segment_weights = self._sample_weights(
+            self.segments,
+            [segment.weight for segment in self.segments],
+            lbl_p,
+            bin_index=[
+                bin_ids.setdefault(segment.track_bin, len(bin_ids))
+                for segment in self.segments
+            ],
+        )
 
-        # do this after so labels are balanced
-        if self.label_mapping:
-            mapped_cdf = {}
-            labels = list(self.label_mapping.keys())
-            labels.sort()
-            for label in labels:
-                if label not in self.segment_label_cdf:
-                    continue
-                label_cdf = self.segment_label_cdf[label]
-                new_label = self.label_mapping[label]
+    def get_segment_weights(self):
+        """Returns the segment weights, rebuilding them if segments have changed"""
+        if self.segment_weights is None or len(self.segment_weights) != len(
+            self.segments
+        ):
+            self.rebuild_segment_cdf()
+        return self.segment_weights
 
-                if lbl_p and label in lbl_p:
-                    label_cdf = np.float64(label_cdf)
-                    label_cdf *= lbl_p[label]
-                cdf = mapped_cdf.setdefault(new_label, [])
-                cdf.extend(label_cdf)
+    def get_frame_weights(self):
+        """Returns the frame weights, rebuilding them if frame samples have changed"""
+        if self.frame_weights is None or len(self.frame_weights) != len(
+            self.frame_samples
+        ):
+            self.rebuild_frame_cdf()
+        return self.frame_weights
 
-            for key, cdf in mapped_cdf.items():
-                total = sum(cdf)
+    def _sample_weights(self, samples, weights, lbl_p=None, bin_index=None):
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        if self.label_mapping:
+            for label, mapped in self.label_mapping.items():
+                if mapped in label_index:
+                    label_index[label] = label_index[mapped]
+        sample_labels = [sample.label for sample in samples]
+        scale = None
+        if lbl_p:
+            scale = [lbl_p.get(label, 1.0) for label in sample_labels]
+        return SampleWeights(
+            weights,
+            [label_index.get(label, -1) for label in sample_labels],
+            len(self.labels),
+            bin_index=bin_index,
+            scale=scale,
+        )
 
-                mapped_cdf[key] = [x / total for x in cdf]
-            self.segment_label_cdf = mapped_cdf
+    def _store_segment_weights(self):
+        """Copies weights back to the segment headers"""
+        for segment, weight in zip(
+            self.segments, self.segment_weights.weights.tolist()
+        ):
+            segment.weight = weight
 
     def get_label_weight(self, label):
         """Returns the total weight for all segments of given label."""
@@ -760,9 +1019,9 @@ class Dataset:
                 self.segments_by_id[seg.id] = seg
 
             if shuffle:
-                np.random.shuffle(self.segments)
+                self.rng.shuffle(self.segments)
         elif shuffle:
-            np.random.shuffle(self.frame_samples)
+            self.rng.shuffle(self.frame_samples)
         self.rebuild_cdf()
 
     def samples_for(self, label, remapped=False):
@@ -816,19 +1075,24 @@ class Dataset:
         # this could be solved either by using linux (with forking, which is copy on write) or with a shared ctype
         # array.
 
+        # each worker gets its own independent stream, forked processes would
+        # otherwise all continue the same generator state
+        worker_seeds = self.seed_sequence.spawn(self.WORKER_THREADS)
         if self.PROCESS_BASED:
             self.preloader_queue = multiprocessing.Queue(buffer_size)
             self.preloader_threads = [
                 multiprocessing.Process(
-                    target=preloader, args=(self.preloader_queue, self)
+                    target=preloader, args=(self.preloader_queue, self, seed)
                 )
-                for _ in range(self.WORKER_THREADS)
+                for seed in worker_seeds
             ]
         else:
             self.preloader_queue = queue.Queue(buffer_size)
             self.preloader_threads = [
-                threading.Thread(target=preloader, args=(self.preloader_queue, self))
-                for _ in range(self.WORKER_THREADS)
+                threading.Thread(
+                    target=preloader, args=(self.preloader_queue, self, seed)
+                )
+                for seed in worker_seeds
             ]
 
         self.preloader_stop_flag = False
@@ -840,29 +1104,45 @@ class Dataset:
         Stops async worker thread.
         """
         if self.preloader_threads is not None:
+            self.preloader_stop_flag = True
             for thread in self.preloader_threads:
                 if hasattr(thread, "terminate"):
                     # note this will corrupt the queue, so reset it
                     thread.terminate()
                     self.preloader_queue = None
                 else:
-                    thread.exit()
+                    thread.join()
+            self.preloader_threads = None
+
+
+# dataset used by load_tracks worker processes
+loader_dataset = None
+
+
+def init_track_loader(dataset):
+    global loader_dataset
+    loader_dataset = dataset
+
+
+def load_track_shard(job):
+    return loader_dataset.load_track_shard(*job)
 
 
 # continue to read examples until queue is full
-def preloader(q, dataset):
+def preloader(q, dataset, seed_sequence):
     """add a segment into buffer"""
     logging.info(
-        " -started async fetcher for %s with augment=%s segment_width=%s",
+        " -started async fetcher for %s with augment=%s segment_length=%s",
         dataset.name,
         dataset.enable_augmentation,
-        dataset.segment_width,
+        dataset.segment_length,
     )
+    rng = np.random.default_rng(seed_sequence)
     loads = 0
     timer = time.time()
     while not dataset.preloader_stop_flag:
         if not q.full():
-            q.put(dataset.next_batch(1, disable_async=True))
+            q.put(dataset.next_batch(1, disable_async=True, rng=rng))
             loads += 1
             if (time.time() - timer) > 1.0:
                 # logging.debug("{} segments per seconds {:.1f}".format(dataset.name, loads / (time.time() - timer)))
@@ -871,8 +1151,42 @@ def preloader(q, dataset):
             time.sleep(0.1)
 
 
+def encode_segments(segments, track_index):
+    """Returns segments as arrays of track index and segment index"""
+    return (
+        np.int32([track_index[id(segment.track)] for segment in segments]),
+        np.int32([segment.index for segment in segments]),
+    )
+
+
+def decode_segments(encoded, tracks):
+    track_indices, segment_indices = encoded
+    return [
+        tracks[track_index].get_segment(segment_index)
+        for track_index, segment_index in zip(
+            track_indices.tolist(), segment_indices.tolist()
+        )
+    ]
+
+
+def encode_frames(frames, track_index):
+    """Returns frame samples as arrays of track index and frame number"""
+    return (
+        np.int32([track_index[id(frame.track)] for frame in frames]),
+        np.int32([frame.frame_num for frame in frames]),
+    )
+
+
+def decode_frames(encoded, tracks):
+    track_indices, frame_nums = encoded
+    return [
+        FrameSample(tracks[track_index], frame_num)
+        for track_index, frame_num in zip(track_indices.tolist(), frame_nums.tolist())
+    ]
+
+
 def dataset_db_path(config):
-    return os.path.join(config.tracks_folder, "datasets.dat")
+    return os.path.join(config.tracks_folder, "datasets")
 
     # trying to get only clear frames
 
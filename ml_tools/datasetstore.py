@@ -0,0 +1,398 @@
+"""
+Saves and loads dataset splits (train, validation, test) built by build.py.
+
+Each split is stored in its own directory of NumPy arrays, per frame and per segment
+data is concatenated across tracks and indexed by offsets, so it can be memory mapped.
+Per track headers, labels and config are stored as JSON. Loading a split still builds
+every track and segment header up front, only the array data is paged in on use.
+"""
+
+import datetime
+import json
+import logging
+import os
+
+import numpy as np
+from dateutil.parser import parse as parse_date
+
+from ml_tools.dataset import (
+    Dataset,
+    encode_segments,
+    decode_segments,
+    encode_frames,
+    decode_frames,
+)
+from ml_tools.datasetstructures import TrackHeader, Camera, SEGMENT_DTYPE
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+TRACKS_FILE = "tracks.json"
+
+# dataset attributes saved as json
+DATASET_ATTRIBUTES = [
+    "name",
+    "labels",
+    "label_mapping",
+    "use_segments",
+    "consecutive_segments",
+    "enable_augmentation",
+    "scale_frequency",
+    "encode_frame_offsets_in_flow",
+    "min_frame_mass",
+    "segment_length",
+    "segment_spacing",
+    "banned_clips",
+    "included_labels",
+    "clip_before_date",
+    "segment_min_mass",
+    "filtered_stats",
+]
+
+# track attributes saved as json
+TRACK_ATTRIBUTES = [
+    "clip_id",
+    "track_id",
+    "label",
+    "start_time",
+    "num_frames",
+    "duration",
+    "camera",
+    "location",
+    "score",
+    "frames_per_second",
+    "correct_prediction",
+    "start_frame",
+    "res_x",
+    "res_y",
+    "ffc_frames",
+    "important_predicted",
+    "lower_mass",
+    "upper_mass",
+    "median_mass",
+    "mean_mass",
+    "filtered_stats",
+]
+
+# per frame track arrays
+FRAME_ARRAYS = [
+    "track_bounds",
+    "frame_temp_median",
+    "frame_mass",
+    "frame_velocity",
+    "frame_crop",
+]
+
+
+def save_datasets(path, datasets):
+    """
+    Saves datasets to directory path, overwriting any existing splits of the same name
+    :param datasets: list of Dataset
+    """
+    os.makedirs(path, exist_ok=True)
+    splits = []
+    for dataset in datasets:
+        split_meta = save_dataset(os.path.join(path, dataset.name), dataset)
+        splits.append(split_meta)
+
+    meta = {"version": FORMAT_VERSION, "splits": splits}
+    # meta is written last so a partially written directory is never loaded
+    temp_file = os.path.join(path, META_FILE + ".tmp")
+    with open(temp_file, "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(temp_file, os.path.join(path, META_FILE))
+
+
+def save_dataset(path, dataset):
+    """Saves a single dataset split to directory path, returning its metadata"""
+    os.makedirs(path, exist_ok=True)
+    tracks = dataset.tracks
+    track_index = {id(track): i for i, track in enumerate(tracks)}
+
+    frame_arrays = {name: [] for name in FRAME_ARRAYS}
+    sample_frames = []
+    segment_data = []
+    segment_frames = []
+    track_segments = []
+    predictions = []
+    track_meta = []
+    for track in tracks:
+        frame_arrays["track_bounds"].append(
+            np.asarray(track.track_bounds, dtype=np.float32).reshape(-1, 4)
+        )
+        frame_arrays["frame_temp_median"].append(
+            np.asarray(track.frame_temp_median, dtype=np.float32)
+        )
+        frame_arrays["frame_mass"].append(
+            np.asarray(track.frame_mass, dtype=np.float32)
+        )
+        frame_arrays["frame_velocity"].append(
+            np.asarray(track.frame_velocity, dtype=np.float32).reshape(-1, 2)
+        )
+        frame_arrays["frame_crop"].append(
+            np.asarray(track.frame_crop, dtype=np.float32)
+        )
+        sample_frames.append(
+            np.int32([frame.frame_num for frame in track.sample_frames or []])
+        )
+        segment_data.append(track.segment_data)
+        segment_frames.append(track.segment_frames)
+        track_segments.append(np.int32([segment.index for segment in track.segments]))
+        track_predictions = None
+        if track.predictions is not None:
+            track_predictions = np.asarray(track.predictions, dtype=np.float32)
+        predictions.append(
+            np.empty(0, np.float32)
+            if track_predictions is None
+            else track_predictions.ravel()
+        )
+
+        meta = {key: to_json(getattr(track, key)) for key in TRACK_ATTRIBUTES}
+        meta["has_sample_frames"] = track.sample_frames is not None
+        meta["predictions_shape"] = (
+            None if track_predictions is None else track_predictions.shape
+        )
+        track_meta.append(meta)
+
+    for name, values in frame_arrays.items():
+        save_ragged(path, name, values, np.float32)
+    save_ragged(path, "sample_frames", sample_frames, np.int32)
+    save_ragged(path, "segment_data", segment_data, SEGMENT_DTYPE)
+    save_ragged(path, "segment_frames", segment_frames, np.int32)
+    save_ragged(path, "track_segments", track_segments, np.int32)
+    save_ragged(path, "predictions", predictions, np.float32)
+    with open(os.path.join(path, TRACKS_FILE), "w") as f:
+        json.dump(track_meta, f)
+
+    labels = {
+        "segments": {
+            label: encode_segments(segments, track_index)
+            for label, segments in dataset.segments_by_label.items()
+        },
+        "frames": {
+            label: encode_frames(frames, track_index)
+            for label, frames in dataset.frames_by_label.items()
+        },
+    }
+    save_samples(path, "segments", encode_segments(dataset.segments, track_index))
+    save_samples(path, "frames", encode_frames(dataset.frame_samples, track_index))
+    label_keys = {}
+    for kind, by_label in labels.items():
+        label_keys[kind] = list(by_label.keys())
+        save_samples(
+            path,
+            "label_" + kind,
+            (
+                [np.concatenate(encoded) for encoded in zip(*by_label.values())]
+                if by_label
+                else (np.empty(0, np.int32), np.empty(0, np.int32))
+            ),
+            [len(encoded[0]) for encoded in by_label.values()],
+        )
+
+    meta = {key: to_json(getattr(dataset, key, None)) for key in DATASET_ATTRIBUTES}
+    meta["tracks"] = len(tracks)
+    meta["segments"] = len(dataset.segments)
+    meta["frame_samples"] = len(dataset.frame_samples)
+    meta["label_keys"] = label_keys
+    meta["database"] = None if dataset.db is None else dataset.db.database
+    return meta
+
+
+def save_ragged(path, name, values, dtype):
+    """Saves a list of per track arrays concatenated, with offsets to each track"""
+    array = np.concatenate(values) if values else np.empty(0, dtype=dtype)
+    np.save(os.path.join(path, name + ".npy"), array)
+    np.save(
+        os.path.join(path, name + "_offsets.npy"),
+        offsets([len(value) for value in values]),
+    )
+
+
+def save_samples(path, name, encoded, counts=None):
+    track_indices, indices = encoded
+    np.save(
+        os.path.join(path, name + ".npy"),
+        np.stack([track_indices, indices], axis=1).astype(np.int32),
+    )
+    if counts is not None:
+        np.save(os.path.join(path, name + "_offsets.npy"), offsets(counts))
+
+
+def offsets(counts):
+    """Returns the start of each block of counts, with the total last"""
+    return np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+
+
+def read_meta(path):
+    """Reads the dataset metadata, checking it is a supported version"""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            "Unsupported dataset version {} in {}, please rebuild the dataset".format(
+                meta.get("version"), path
+            )
+        )
+    return meta
+
+
+def load_datasets(path, names=None, track_db=None, read_only=False):
+    """
+    Loads datasets from directory path, only the requested splits are read.
+    Per frame and segment arrays are memory mapped copy on write, but a TrackHeader
+    and SegmentHeader is still created for every track and segment of each split
+    when it is loaded, so load time and header memory grow with the split size.
+    :param names: names of splits to load, defaults to all splits in saved order
+    :param track_db: TrackDatabase to use, defaults to the database saved with each split
+    :param read_only: open the saved databases read only, for training
+    :return: list of Dataset
+    """
+    meta = read_meta(path)
+    splits = {split["name"]: split for split in meta["splits"]}
+    if names is None:
+        names = [split["name"] for split in meta["splits"]]
+    datasets = []
+    for name in names:
+        if name not in splits:
+            raise ValueError("Dataset {} not found in {}".format(name, path))
+        datasets.append(
+            load_dataset(
+                os.path.join(path, name),
+                splits[name],
+                track_db=track_db,
+                read_only=read_only,
+            )
+        )
+    return datasets
+
+
+def load_dataset(path, meta, track_db=None, read_only=False):
+    if track_db is None and meta["database"] is not None:
+        from ml_tools.trackdatabase import TrackDatabase
+
+        track_db = TrackDatabase(meta["database"], read_only=read_only)
+    dataset = Dataset(
+        track_db,
+        meta["name"],
+        use_segments=meta["use_segments"],
+        consecutive_segments=meta["consecutive_segments"],
+    )
+    for key in DATASET_ATTRIBUTES:
+        setattr(dataset, key, meta[key])
+    if dataset.clip_before_date is not None:
+        dataset.clip_before_date = parse_date(dataset.clip_before_date)
+
+    tracks = load_tracks(path)
+    dataset.tracks = tracks
+    for track in tracks:
+        dataset.tracks_by_id[track.unique_id] = track
+        dataset.tracks_by_bin.setdefault(track.bin_id, []).append(track)
+        dataset.tracks_by_label.setdefault(track.label, []).append(track)
+        dataset.camera_names.add(track.camera_id)
+        camera = dataset.cameras_by_id.setdefault(
+            track.camera_id, Camera(track.camera_id)
+        )
+        camera.add_track(track)
+
+    dataset.segments = decode_segments(load_samples(path, "segments"), tracks)
+    dataset.frame_samples = decode_frames(load_samples(path, "frames"), tracks)
+    label_keys = meta["label_keys"]
+    samples = load_samples(path, "label_segments")
+    sample_offsets = np.load(os.path.join(path, "label_segments_offsets.npy"))
+    for i, label in enumerate(label_keys["segments"]):
+        start, end = sample_offsets[i], sample_offsets[i + 1]
+        dataset.segments_by_label[label] = decode_segments(
+            (samples[0][start:end], samples[1][start:end]), tracks
+        )
+    samples = load_samples(path, "label_frames")
+    sample_offsets = np.load(os.path.join(path, "label_frames_offsets.npy"))
+    for i, label in enumerate(label_keys["frames"]):
+        start, end = sample_offsets[i], sample_offsets[i + 1]
+        dataset.frames_by_label[label] = decode_frames(
+            (samples[0][start:end], samples[1][start:end]), tracks
+        )
+    dataset.segments_by_id = {
+        segment.id: segment
+        for segments in dataset.segments_by_label.values()
+        for segment in segments
+    }
+    logging.info(
+        "Loaded dataset %s with %d tracks and %d segments",
+        dataset.name,
+        len(tracks),
+        len(dataset.segments),
+    )
+    return dataset
+
+
+def load_tracks(path):
+    with open(os.path.join(path, TRACKS_FILE)) as f:
+        track_meta = json.load(f)
+    ragged = {
+        name: RaggedArray(path, name)
+        for name in [
+            *FRAME_ARRAYS,
+            "sample_frames",
+            "segment_data",
+            "segment_frames",
+            "track_segments",
+            "predictions",
+        ]
+    }
+    tracks = []
+    for i, meta in enumerate(track_meta):
+        track = TrackHeader.__new__(TrackHeader)
+        for key in TRACK_ATTRIBUTES:
+            setattr(track, key, meta[key])
+        if track.start_time is not None:
+            track.start_time = parse_date(track.start_time)
+        if isinstance(track.location, list):
+            track.location = np.asarray(track.location)
+        for name in FRAME_ARRAYS:
+            setattr(track, name, ragged[name][i])
+        track.predictions = None
+        if meta["predictions_shape"] is not None:
+            track.predictions = ragged["predictions"][i].reshape(
+                meta["predictions_shape"]
+            )
+        track.segment_data = ragged["segment_data"][i]
+        track.segment_frames = ragged["segment_frames"][i]
+        track.restore_views(
+            ragged["track_segments"][i],
+            ragged["sample_frames"][i] if meta["has_sample_frames"] else None,
+        )
+        tracks.append(track)
+    return tracks
+
+
+class RaggedArray:
+    """Memory mapped per track arrays saved by save_ragged"""
+
+    def __init__(self, path, name):
+        self.values = np.load(os.path.join(path, name + ".npy"), mmap_mode="c")
+        self.offsets = np.load(os.path.join(path, name + "_offsets.npy"))
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i] : self.offsets[i + 1]]
+
+
+def load_samples(path, name):
+    samples = np.load(os.path.join(path, name + ".npy"))
+    return samples[:, 0], samples[:, 1]
+
+
+def to_json(value):
+    """Converts numpy and date values to json serialisable types"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, set):
+        return sorted(value)
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    return value
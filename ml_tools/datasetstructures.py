@@ -11,6 +11,20 @@ FRAMES_PER_SECOND = 9
 CPTV_FILE_WIDTH = 160
 CPTV_FILE_HEIGHT = 120
 
+# segments of a track are stored as rows of a structured array
+SEGMENT_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("start_frame", np.int32),
+        ("frames", np.int32),
+        ("weight", np.float64),
+        ("avg_mass", np.float32),
+        # offset into segment_frames, or -1 if the segment has no frame indices
+        ("frame_offset", np.int32),
+        ("frame_count", np.int32),
+    ]
+)
+
 
 class TrackHeader:
     """Header for track."""
@@ -47,8 +61,12 @@ class TrackHeader:
         self.clip_id = clip_id
         # reference to track this segment came from
         self.track_id = track_id
-        # list of segments that belong to this track
+        # list of segments that belong to this track, these are views of the rows in
+        # segment_data, with any frame indices stored in segment_frames
         self.segments = []
+        self.segment_data = np.empty(0, dtype=SEGMENT_DTYPE)
+        self.segment_frames = np.empty(0, dtype=np.int32)
+        self._segment_views = []
         # label for this track
         self.label = label
         # date and time of the start of the track
@@ -75,7 +93,7 @@ class TrackHeader:
         self.calculate_velocity()
         self.calculate_frame_crop()
         self.important_predicted = 0
-        self.frame_mass = frame_mass
+        self.frame_mass = np.asarray(frame_mass)
         self.lower_mass = np.percentile(frame_mass, q=25)
         self.upper_mass = np.percentile(frame_mass, q=75)
         self.median_mass = np.median(frame_mass)
@@ -87,15 +105,88 @@ class TrackHeader:
             self.set_sample_frames(important_frames)
 
     def set_sample_frames(self, important_frames):
-        self.sample_frames = []
-        for frame_num in important_frames:
-            f = FrameSample(
-                self.clip_id,
-                self.track_id,
-                frame_num,
-                self.label,
+        self.sample_frames = [
+            FrameSample(self, int(frame_num)) for frame_num in important_frames
+        ]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # views are pickled as indices so pickle size scales with tracks not segments
+        del state["_segment_views"]
+        state["segments"] = np.int32([segment.index for segment in self.segments])
+        if self.sample_frames is not None:
+            state["sample_frames"] = np.int32(
+                [frame.frame_num for frame in self.sample_frames]
             )
-            self.sample_frames.append(f)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.restore_views(state["segments"], state["sample_frames"])
+
+    def restore_views(self, segment_rows, sample_frames):
+        """
+        Recreates segment and sample frame views after loading
+        :param segment_rows: rows of segment_data that belong to this track
+        :param sample_frames: frame numbers of the sample frames, or None
+        """
+        self._segment_views = [
+            SegmentHeader(self, i) for i in range(len(self.segment_data))
+        ]
+        self.segments = [self._segment_views[i] for i in segment_rows.tolist()]
+        self.sample_frames = None
+        if sample_frames is not None:
+            self.set_sample_frames(sample_frames.tolist())
+
+    def get_segment(self, index):
+        """Returns the view of the segment stored at index of segment_data"""
+        return self._segment_views[index]
+
+    def add_segments(
+        self, start_frames, frames, weights, avg_masses, frame_indices=None
+    ):
+        """
+        Stores new segments and adds them to this track
+        :param frame_indices: optional list of frame indices for each segment
+        :return: the new segments
+        """
+        count = len(start_frames)
+        if count == 0:
+            return []
+        data = np.empty(count, dtype=SEGMENT_DTYPE)
+        data["id"] = np.arange(
+            SegmentHeader._segment_id, SegmentHeader._segment_id + count
+        )
+        SegmentHeader._segment_id += count
+        data["start_frame"] = start_frames
+        data["frames"] = frames
+        data["weight"] = weights
+        data["avg_mass"] = avg_masses
+        if frame_indices is None:
+            data["frame_offset"] = -1
+            data["frame_count"] = 0
+        else:
+            counts = np.int32([len(indices) for indices in frame_indices])
+            data["frame_count"] = counts
+            data["frame_offset"] = len(self.segment_frames) + np.cumsum(counts) - counts
+            self.segment_frames = np.concatenate(
+                [self.segment_frames, *frame_indices]
+            ).astype(np.int32)
+
+        first = len(self.segment_data)
+        self.segment_data = np.concatenate([self.segment_data, data])
+        segments = [SegmentHeader(self, i) for i in range(first, first + count)]
+        self._segment_views.extend(segments)
+        self.segments.extend(segments)
+        return segments
+
+    def assign_segment_ids(self):
+        """Gives this tracks segments new ids, used when tracks are created in another process"""
+        count = len(self.segment_data)
+        self.segment_data["id"] = np.arange(
+            SegmentHeader._segment_id, SegmentHeader._segment_id + count
+        )
+        SegmentHeader._segment_id += count
 
     def toJSON(self):
         meta_dict = {}
@@ -183,109 +274,76 @@ class TrackHeader:
         use_important=True,
         require_movement=False,
         scale=1,
+        rng=None,
     ):
-
+        """
+        Creates the segments for this track
+        :param rng: random generator used to choose important frames, defaults to np.random
+        """
+        if rng is None:
+            rng = np.random
         self.segments = []
+        self.segment_data = np.empty(0, dtype=SEGMENT_DTYPE)
+        self.segment_frames = np.empty(0, dtype=np.int32)
+        self._segment_views = []
         if use_important and self.num_sample_frames < segment_width:
             # dont want to repeat too many frames
             return
         elif len(mass_history) < segment_width:
             return
+        mass_history = np.asarray(mass_history)
         if use_important:
-            mid_x = [
-                tools.Rectangle.from_ltrb(*bound).mid_x for bound in self.track_bounds
-            ]
-            mid_y = [
-                tools.Rectangle.from_ltrb(*bound).mid_y for bound in self.track_bounds
-            ]
-            vel_x = [cur - prev for cur, prev in zip(mid_x[1:], mid_x[:-1])]
-            vel_y = [cur - prev for cur, prev in zip(mid_y[1:], mid_y[:-1])]
-
-            movement = sum((vx ** 2 + vy ** 2) ** 0.5 for vx, vy in zip(vel_x, vel_y))
-            widths = [
-                tools.Rectangle.from_ltrb(*bound).width for bound in self.track_bounds
-            ]
+            bounds = np.asarray(self.track_bounds, dtype=np.float64)
+            widths = bounds[:, 2] - bounds[:, 0]
+            mid_x = bounds[:, 0] + widths / 2
+            mid_y = bounds[:, 1] + (bounds[:, 3] - bounds[:, 1]) / 2
+            movement = np.sum(np.hypot(np.diff(mid_x), np.diff(mid_y)))
             if movement < np.median(widths) * 2.0:
                 logging.debug("Not enough movment %s %s", self, self.label)
                 return
 
-        if use_important:
-            remaining = segment_width - self.num_sample_frames
             segment_count = max(0, (self.num_sample_frames - segment_width) // 9)
             segment_count += 1
             segment_count = int(scale * segment_count)
+            if segment_count <= 0:
+                return
             # take any segment_width frames, this could be done each epoch
-            for i in range(segment_count):
-                frames = list(
-                    np.random.choice(
-                        self.sample_frames,
-                        min(segment_width, len(self.sample_frames)),
-                        replace=False,
-                    )
-                )
-                # sample another batch
-                if remaining > 0:
-                    frames.extend(
-                        np.random.choice(
-                            self.sample_frames,
-                            remaining,
-                            replace=False,
-                        )
-                    )
-                frames = [frame.frame_num for frame in frames]
-                frames.sort()
-                mass_slice = mass_history[frames]
-                segment_avg_mass = np.mean(mass_slice)
-                if segment_avg_mass < 50:
-                    segment_weight_factor = 0.75
-                elif segment_avg_mass < 100:
-                    segment_weight_factor = 1
-                else:
-                    segment_weight_factor = 1.2
-                segment = SegmentHeader(
-                    track=self,
-                    start_frame=0,
-                    frames=segment_width,
-                    weight=segment_weight_factor,
-                    avg_mass=segment_avg_mass,
-                    frame_indices=frames,
-                )
-                self.segments.append(segment)
-
+            # the segment_width smallest of uniform random keys gives a uniformly random
+            # subset of the sample frames for every segment at once
+            frame_nums = np.int32([frame.frame_num for frame in self.sample_frames])
+            keys = rng.random((segment_count, len(frame_nums)))
+            chosen = np.argpartition(keys, segment_width - 1, axis=1)[:, :segment_width]
+            frames = np.sort(frame_nums[chosen], axis=1)
+            segment_avg_mass = np.mean(mass_history[frames], axis=1)
+            self.add_segments(
+                np.zeros(segment_count, dtype=np.int32),
+                segment_width,
+                segment_weight_factors(segment_avg_mass),
+                segment_avg_mass,
+                frame_indices=list(frames),
+            )
             return
 
         segment_count = (len(mass_history) - segment_width) // segment_frame_spacing
         segment_count += 1
         # scan through track looking for good segments to add to our datset
-        for i in range(segment_count):
-            segment_start = i * segment_frame_spacing
-
-            mass_slice = mass_history[segment_start : segment_start + segment_width]
-            segment_avg_mass = np.mean(mass_slice)
-            segment_frames = len(mass_slice)
-
-            if segment_frames != segment_width:
-                continue
-            if segment_min_mass and segment_avg_mass < segment_min_mass:
-                self.filtered_stats["segment_mass"] += 1
-                continue
-            # try to sample the better segments more often
-            if segment_avg_mass < 50:
-                segment_weight_factor = 0.75
-            elif segment_avg_mass < 100:
-                segment_weight_factor = 1
-            else:
-                segment_weight_factor = 1.2
-
-            segment = SegmentHeader(
-                track=self,
-                start_frame=segment_start,
-                frames=segment_width,
-                weight=segment_weight_factor,
-                avg_mass=segment_avg_mass,
-            )
-
-            self.segments.append(segment)
+        segment_starts = np.arange(segment_count) * segment_frame_spacing
+        mass_sum = np.concatenate([[0], np.cumsum(mass_history, dtype=np.float64)])
+        segment_avg_mass = (
+            mass_sum[segment_starts + segment_width] - mass_sum[segment_starts]
+        ) / segment_width
+        if segment_min_mass:
+            enough_mass = segment_avg_mass >= segment_min_mass
+            self.filtered_stats["segment_mass"] += int(np.sum(~enough_mass))
+            segment_starts = segment_starts[enough_mass]
+            segment_avg_mass = segment_avg_mass[enough_mass]
+
+        self.add_segments(
+            segment_starts,
+            segment_width,
+            segment_weight_factors(segment_avg_mass),
+            segment_avg_mass,
+        )
 
     @property
     def camera_id(self):
@@ -462,11 +520,25 @@ class Camera:
 
 
 class FrameSample:
-    def __init__(self, clip_id, track_id, frame_num, label):
-        self.clip_id = clip_id
-        self.track_id = track_id
+    """A sample frame of a track."""
+
+    __slots__ = ("track", "frame_num")
+
+    def __init__(self, track, frame_num):
+        self.track = track
         self.frame_num = frame_num
-        self.label = label
+
+    @property
+    def clip_id(self):
+        return self.track.clip_id
+
+    @property
+    def track_id(self):
+        return self.track.track_id
+
+    @property
+    def label(self):
+        return self.track.label
 
     @property
     def unique_track_id(self):
@@ -474,32 +546,53 @@ class FrameSample:
 
 
 class SegmentHeader:
-    """Header for segment."""
+    """Header for segment, a view of a row of its tracks segment_data."""
+
+    __slots__ = ("track", "index")
 
     _segment_id = 1
 
-    def __init__(
-        self,
-        track: TrackHeader,
-        start_frame,
-        frames,
-        weight,
-        avg_mass,
-        frame_indices=None,
-    ):
-        self.id = SegmentHeader._segment_id
-        SegmentHeader._segment_id += 1
+    def __init__(self, track: TrackHeader, index):
         # reference to track this segment came from
         self.track = track
+        # row of track.segment_data holding this segment
+        self.index = index
+
+    @property
+    def id(self):
+        return int(self.track.segment_data["id"][self.index])
+
+    @property
+    def start_frame(self):
         # first frame of this segment referenced by start of track
-        self.start_frame = start_frame
+        return int(self.track.segment_data["start_frame"][self.index])
+
+    @property
+    def frames(self):
         # length of segment in frames
-        self.frames = frames
+        return int(self.track.segment_data["frames"][self.index])
+
+    @property
+    def weight(self):
         # relative weight of the segment (higher is sampled more often)
-        self.weight = weight
+        return float(self.track.segment_data["weight"][self.index])
+
+    @weight.setter
+    def weight(self, weight):
+        self.track.segment_data["weight"][self.index] = weight
+
+    @property
+    def avg_mass(self):
         # average mass of the segment
-        self.avg_mass = avg_mass
-        self.frame_indices = frame_indices
+        return float(self.track.segment_data["avg_mass"][self.index])
+
+    @property
+    def frame_indices(self):
+        row = self.track.segment_data[self.index]
+        if row["frame_offset"] < 0:
+            return None
+        offset = row["frame_offset"]
+        return self.track.segment_frames[offset : offset + row["frame_count"]]
 
     @property
     def unique_track_id(self):
@@ -511,6 +604,11 @@ class SegmentHeader:
         # reference to clip this segment came from
         return self.track.clip_id
 
+    @property
+    def track_id(self):
+        # reference to track this segment came from
+        return self.track.track_id
+
     @property
     def label(self):
         # label for this segment
@@ -563,6 +661,11 @@ class SegmentHeader:
         )
 
 
+def segment_weight_factors(avg_mass):
+    """Returns segment weights so the better segments are sampled more often"""
+    return np.select([avg_mass < 50, avg_mass < 100], [0.75, 1], 1.2)
+
+
 def get_cropped_fraction(region: tools.Rectangle, width, height):
     """Returns the fraction regions mass outside the rect ((0,0), (width, height)"""
     bounds = tools.Rectangle(0, 0, width - 1, height - 1)
@@ -0,0 +1,313 @@
+"""
+Chunk layout and compression settings for the frames of a track database, with
+a read benchmark and a repack that rewrites a database with a chosen layout.
+
+A layout is written as "chunks/compressor/shuffle", for example "channel/gzip/none"
+is what load.py writes with compression enabled and "channel/blosc:zstd/byte" is
+tools.blosc_zstd, used by the cptv track extractor (tools.blosc_opts itself defaults
+to blosc:lz4):
+    chunks      channel (one chunk per channel, as add_track writes) or frame
+    compressor  none, gzip, lzf or blosc:<blosclz|lz4|lz4hc|snappy|zlib|zstd>
+    shuffle     none, byte or bit (bit is only supported by blosc)
+"""
+
+import logging
+import os
+import time
+
+import attr
+import h5py
+import numpy as np
+
+from ml_tools import tools
+from ml_tools.trackdatabase import TrackDatabase
+
+BLOSC_FILTER = 32001
+
+# groups of a track holding one dataset per frame
+FRAME_GROUPS = ["cropped", "original"]
+
+DEFAULT_LAYOUTS = [
+    "{}/{}".format(chunks, compression)
+    for chunks in ["channel", "frame"]
+    for compression in [
+        "none/none",
+        "gzip/none",
+        "gzip/byte",
+        "blosc:lz4/none",
+        "blosc:lz4/byte",
+        "blosc:lz4/bit",
+        "blosc:zstd/byte",
+        "blosc:zstd/bit",
+    ]
+]
+
+
+@attr.s(frozen=True)
+class Layout:
+    chunks = attr.ib()
+    compressor = attr.ib()
+    shuffle = attr.ib()
+    level = attr.ib(default=None)
+
+    @classmethod
+    def parse(cls, text, level=None):
+        try:
+            chunks, compressor, shuffle = text.split("/")
+        except ValueError:
+            raise ValueError(
+                "Layout {} should be chunks/compressor/shuffle".format(text)
+            )
+        layout = cls(chunks, compressor, shuffle, level)
+        layout.validate()
+        return layout
+
+    def validate(self):
+        if self.chunks not in ["channel", "frame"]:
+            raise ValueError("Unknown chunk layout {}".format(self.chunks))
+        if self.shuffle not in ["none", "byte", "bit"]:
+            raise ValueError("Unknown shuffle {}".format(self.shuffle))
+        if self.compressor.startswith("blosc:"):
+            # raises if the blosc compressor isn't known
+            tools.blosc_opts(complib=self.compressor)
+        elif self.compressor not in ["none", "gzip", "lzf"]:
+            raise ValueError("Unknown compressor {}".format(self.compressor))
+        elif self.shuffle == "bit":
+            raise ValueError("Bit shuffle needs a blosc compressor")
+
+    @property
+    def name(self):
+        return "{}/{}/{}".format(self.chunks, self.compressor, self.shuffle)
+
+    def available(self):
+        """Returns if the hdf5 filters this layout needs can be used"""
+        if not self.compressor.startswith("blosc:"):
+            return True
+        if not h5py.h5z.filter_avail(BLOSC_FILTER):
+            try:
+                # pytables registers the blosc filter
+                import tables
+            except ImportError:
+                pass
+        return h5py.h5z.filter_avail(BLOSC_FILTER)
+
+    def dataset_opts(self, shape):
+        """Returns create_dataset arguments for a frame of shape"""
+        if self.chunks == "channel" and len(shape) == 3:
+            chunks = (1, *shape[1:])
+        else:
+            chunks = tuple(shape)
+        opts = {"chunks": chunks}
+        if self.compressor.startswith("blosc:"):
+            opts.update(
+                tools.blosc_opts(
+                    complevel=9 if self.level is None else self.level,
+                    complib=self.compressor,
+                    shuffle=False if self.shuffle == "none" else self.shuffle,
+                )
+            )
+        elif self.compressor != "none":
+            opts["compression"] = self.compressor
+            if self.level is not None and self.compressor == "gzip":
+                opts["compression_opts"] = self.level
+            opts["shuffle"] = self.shuffle == "byte"
+        return opts
+
+
+def copy_attrs(source, dest):
+    for key, value in source.attrs.items():
+        dest.attrs[key] = value
+
+
+def is_track(node):
+    return isinstance(node, h5py.Group) and "frames" in node.attrs
+
+
+def frame_groups(track):
+    """Returns the groups of a track holding frames, older databases store them on the track"""
+    groups = [track[name] for name in FRAME_GROUPS if name in track]
+    return groups if groups else [track]
+
+
+def copy_frames(source, dest, layout):
+    """Copies the frames in group source to dest, writing them with layout"""
+    copy_attrs(source, dest)
+    for name, node in source.items():
+        if isinstance(node, h5py.Dataset):
+            dest.create_dataset(
+                name, data=node[()], dtype=node.dtype, **layout.dataset_opts(node.shape)
+            )
+            copy_attrs(node, dest[name])
+        else:
+            source.copy(node, dest, name=name)
+
+
+def copy_track(source, dest, layout):
+    if not any(name in source for name in FRAME_GROUPS):
+        copy_frames(source, dest, layout)
+        return
+    copy_attrs(source, dest)
+    for name, node in source.items():
+        if name in FRAME_GROUPS:
+            copy_frames(node, dest.create_group(name), layout)
+        else:
+            source.copy(node, dest, name=name)
+
+
+def copy_clip(source, dest, layout, track_ids=None):
+    """
+    Copies a clip, the frames of its tracks are written with layout
+    :param track_ids: names of the tracks to copy, defaults to all tracks
+    """
+    copy_attrs(source, dest)
+    for name, node in source.items():
+        if not is_track(node):
+            source.copy(node, dest, name=name)
+        elif track_ids is None or name in track_ids:
+            copy_track(node, dest.create_group(name), layout)
+
+
+def repack(source_file, dest_file, layout, track_ids=None):
+    """
+    Writes a copy of the track database source_file to dest_file with frames stored
+    using layout.
+    :param track_ids: (clip_id, track_id) of tracks to copy, defaults to every track
+    """
+    if track_ids is not None:
+        clip_tracks = {}
+        for clip_id, track_id in track_ids:
+            clip_tracks.setdefault(str(clip_id), set()).add(str(track_id))
+    with h5py.File(source_file, "r") as source, h5py.File(dest_file, "w") as dest:
+        copy_attrs(source, dest)
+        for name, node in source.items():
+            if name != "clips":
+                source.copy(node, dest, name=name)
+        clips = dest.create_group("clips")
+        copy_attrs(source["clips"], clips)
+        for clip_id, clip in source["clips"].items():
+            if track_ids is None:
+                copy_clip(clip, clips.create_group(clip_id), layout)
+            elif clip_id in clip_tracks:
+                copy_clip(
+                    clip, clips.create_group(clip_id), layout, clip_tracks[clip_id]
+                )
+
+
+def frames_size(filename):
+    """Returns the stored bytes and uncompressed bytes of all track frames in a database"""
+    stored = 0
+    raw = 0
+    with h5py.File(filename, "r") as f:
+        for clip in f["clips"].values():
+            for track in clip.values():
+                if not is_track(track):
+                    continue
+                for group in frame_groups(track):
+                    for node in group.values():
+                        if isinstance(node, h5py.Dataset):
+                            stored += node.id.get_storage_size()
+                            raw += node.size * node.dtype.itemsize
+    return stored, raw
+
+
+def benchmark_reads(filename, track_ids, segment_frames=27, repeats=3, seed=0):
+    """
+    Times typical training reads of track_ids from the database in filename
+    :return: dictionary of access pattern to (seconds per read, MB per second)
+    """
+    rng = np.random.default_rng(seed)
+    db = TrackDatabase(filename, read_only=True)
+    with h5py.File(filename, "r") as f:
+        track_frames = {
+            (clip_id, track_id): f["clips"][str(clip_id)][str(track_id)].attrs["frames"]
+            for clip_id, track_id in track_ids
+        }
+
+    def full_track(clip_id, track_id):
+        return db.get_track(clip_id, track_id)
+
+    def random_segment(clip_id, track_id):
+        frames = track_frames[(clip_id, track_id)]
+        start = rng.integers(0, max(1, frames - segment_frames + 1))
+        return db.get_track(
+            clip_id, track_id, start, min(frames, start + segment_frames)
+        )
+
+    def single_channel(clip_id, track_id):
+        # thermal channel of a segment, read through h5py
+        f = db.get_read_file()
+        track = frame_groups(f["clips"][str(clip_id)][str(track_id)])[0]
+        frames = track_frames[(clip_id, track_id)]
+        start = rng.integers(0, max(1, frames - segment_frames + 1))
+        return [
+            track[str(i)][0] for i in range(start, min(frames, start + segment_frames))
+        ]
+
+    results = {}
+    for pattern, read in [
+        ("full track", full_track),
+        ("random segment", random_segment),
+        ("single channel", single_channel),
+    ]:
+        times = []
+        read_bytes = 0
+        for _ in range(repeats):
+            start = time.time()
+            for clip_id, track_id in track_ids:
+                for frame in read(clip_id, track_id):
+                    if isinstance(frame, np.ndarray):
+                        read_bytes += frame.nbytes
+                    else:
+                        read_bytes += frame.as_array().nbytes
+            times.append(time.time() - start)
+        seconds = min(times)
+        reads = len(track_ids)
+        results[pattern] = (
+            seconds / reads,
+            read_bytes / repeats / 1e6 / seconds if seconds > 0 else 0,
+        )
+    db.get_read_file().close()
+    return results
+
+
+def sample_tracks(filename, count, seed=0):
+    """Returns up to count random (clip_id, track_id) with frames from a database"""
+    with h5py.File(filename, "r") as f:
+        track_ids = [
+            (clip_id, track_id)
+            for clip_id, clip in f["clips"].items()
+            for track_id, track in clip.items()
+            if is_track(track) and track.attrs["frames"] > 0
+        ]
+    rng = np.random.default_rng(seed)
+    if len(track_ids) > count:
+        chosen = rng.choice(len(track_ids), count, replace=False)
+        track_ids = [track_ids[i] for i in sorted(chosen)]
+    return track_ids
+
+
+def benchmark(source_file, layouts, track_count=50, work_dir=None, seed=0):
+    """
+    Repacks a sample of tracks with each layout and times reading them back.
+    :return: list of (layout, stored bytes, raw bytes, read results)
+    """
+    track_ids = sample_tracks(source_file, track_count, seed)
+    if work_dir is None:
+        work_dir = os.path.dirname(os.path.abspath(source_file))
+    results = []
+    for layout in layouts:
+        if not layout.available():
+            logging.warning("Skipping %s, hdf5 filter not available", layout.name)
+            continue
+        filename = os.path.join(
+            work_dir, "benchmark-{}.hdf5".format(layout.name.replace("/", "-"))
+        )
+        try:
+            repack(source_file, filename, layout, track_ids)
+            stored, raw = frames_size(filename)
+            reads = benchmark_reads(filename, track_ids, seed=seed)
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+        results.append((layout, stored, raw, reads))
+    return results
@@ -4,13 +4,14 @@ import math
 
 from pathlib import Path
 from PIL import Image, ImageDraw
-from scipy import ndimage
 
 from ml_tools.tools import eucl_distance
 from track.track import TrackChannels
 
 
 def rotate(image, degrees, mode="nearest", order=1):
+    from scipy import ndimage
+
     return ndimage.rotate(image, degrees, reshape=False, mode=mode, order=order)
 
 
@@ -18,6 +18,9 @@ from ml_tools import preprocessresnet
 class KerasModel:
     """Defines a deep learning model using the tensorflow v2 keras framework"""
 
+    # train.model that trains a KerasModel with the tf.data pipeline
+    MODEL_NAME = "keras_tfdata"
+
     def __init__(self, train_config=None):
         self.params = {
             # augmentation
@@ -36,8 +39,13 @@ class KerasModel:
         self.frame_size = None
         self.model_name = None
         self.model = None
+        # validation accuracy after training
+        self.eval_score = None
         self.use_movement = False
         self.square_width = 1
+        self.red_type = FrameTypes.thermal_tiled
+        self.green_type = FrameTypes.filtered_tiled
+        self.blue_type = FrameTypes.overlay
 
     def get_base_model(self, input_shape):
         if self.model_name == "resnet":
@@ -150,15 +158,13 @@ class KerasModel:
         return softmax
 
     def optimizer(self):
-        if self.params["learning_rate_decay"] != 1.0:
-            learning_rate = tf.compat.v1.train.exponential_decay(
+        if self.params.get("learning_rate_decay", 1.0) != 1.0:
+            learning_rate = tf.keras.optimizers.schedules.ExponentialDecay(
                 self.params["learning_rate"],
-                self.global_step,
                 1000,
                 self.params["learning_rate_decay"],
                 staircase=True,
             )
-            tf.compat.v1.summary.scalar("params/learning_rate", learning_rate)
         else:
             learning_rate = self.params["learning_rate"]  # setup optimizer
         optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
@@ -190,10 +196,14 @@ class KerasModel:
         meta = json.load(open(os.path.join(dir, "metadata.txt"), "r"))
         self.params = meta.get("hyperparams", {})
         self.labels = meta["labels"]
+        self.set_params(meta.get("frame_size", 48), meta.get("square_width", 1))
+
+    def set_params(self, frame_size, square_width):
+        """Sets up the model from its hyper parameters"""
         self.model_name = self.params.get("model", "resnetv2")
         self.preprocess_fn = self.get_preprocess_fn()
-        self.frame_size = meta.get("frame_size", 48)
-        self.square_width = meta.get("square_width", 1)
+        self.frame_size = frame_size
+        self.square_width = square_width
         self.use_movement = self.params.get("use_movement", False)
         self.green_type = self.params.get("green_type", FrameTypes.filtered_tiled.name)
         self.blue_type = self.params.get("blue_type", FrameTypes.overlay.name)
@@ -221,6 +231,62 @@ class KerasModel:
         self.keep_aspect = self.params.get("keep_aspect", False)
         self.dense_sizes = self.params.get("dense_sizes", [1024, 512])
 
+    def get_dataset(
+        self, dataset, augment=None, epoch_size=None, weighted=True, deterministic=False
+    ):
+        """
+        Returns a tf.data pipeline of batches from dataset for use with fit
+        :param augment: defaults to the augmentation hyper parameter
+        """
+        from ml_tools.tfdataset import get_dataset
+
+        if augment is None:
+            augment = self.params["augmentation"]
+        return get_dataset(
+            self,
+            dataset,
+            self.params["batch_size"],
+            augment=augment,
+            epoch_size=epoch_size,
+            weighted=weighted,
+            deterministic=deterministic,
+        )
+
+    def train_model(self, train, validation, epochs, log_dir, epoch_size=None):
+        """
+        Builds the model and fits it with tf.data pipelines of the datasets
+        :param train: Dataset sampled by weight each epoch
+        :param validation: Dataset evaluated after each epoch, every sample once
+        :param log_dir: folder to write tensorboard logs to
+        :param epoch_size: training samples per epoch, defaults to the number of samples
+        :return: the training history
+        """
+        self.labels = train.labels.copy()
+        self.set_params(
+            self.params.get("frame_size", 48), self.params.get("square_width", 1)
+        )
+        self.build_model(self.dense_sizes)
+        history = self.model.fit(
+            self.get_dataset(train, epoch_size=epoch_size),
+            validation_data=self.get_dataset(validation, augment=False, weighted=False),
+            epochs=epochs,
+            callbacks=[tf.keras.callbacks.TensorBoard(log_dir)],
+        )
+        self.eval_score = history.history["val_accuracy"][-1]
+        return history
+
+    def save(self, dir):
+        """Saves the model with the metadata load_model reads to folder dir"""
+        self.model.save(dir)
+        meta = {
+            "labels": self.labels,
+            "hyperparams": self.params,
+            "frame_size": self.frame_size,
+            "square_width": self.square_width,
+        }
+        with open(os.path.join(dir, "metadata.txt"), "w") as f:
+            json.dump(meta, f, indent=4)
+
     def get_preprocess_fn(self):
         if self.model_name == "resnet":
             return tf.keras.applications.resnet.preprocess_input
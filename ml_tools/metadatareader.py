@@ -0,0 +1,135 @@
+"""
+Bulk reader for the JSON metadata files stored beside clips and classifier output.
+
+Files are found with os.scandir and parsed on a pool of threads, with orjson when it
+is installed.  Parsed files can be cached in a single file keyed by path, modification
+time and size, so later runs over the same folder only parse files that changed.
+"""
+
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_VERSION = 1
+
+
+def get_json_loads():
+    """Returns orjson.loads if it is installed, otherwise json.loads"""
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+
+    def loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is strict, e.g. it doesn't accept NaN
+            return json.loads(data)
+
+    return loads
+
+
+def scan_files(root, match, recursive=True):
+    """Yields the os.DirEntry of each file under root whose name match accepts"""
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        folders.append(entry.path)
+                elif match(entry.name):
+                    yield entry
+
+
+class MetadataReader:
+    """
+    Reads JSON files on a pool of threads.
+
+    Usage:
+
+        reader = MetadataReader(cache_file="metadata-cache.json")
+        for path, metadata in reader.iter_read(paths):
+            ...
+        reader.save_cache()
+
+    Cached metadata is shared with the cache, so it shouldn't be changed in place.
+    """
+
+    # files read ahead of the consumer, per worker
+    READ_AHEAD = 16
+
+    def __init__(self, workers=8, cache_file=None):
+        self.workers = workers
+        self.cache_file = cache_file
+        self.loads = get_json_loads()
+        self.cache = {}
+        self.read_paths = set()
+        if cache_file is not None and os.path.exists(cache_file):
+            self.load_cache()
+
+    def load_cache(self):
+        with open(self.cache_file, "rb") as f:
+            cache = self.loads(f.read())
+        if cache.get("version") != CACHE_VERSION:
+            logging.warning(
+                "Ignoring metadata cache %s of another version", self.cache_file
+            )
+            return
+        self.cache = cache["files"]
+
+    def save_cache(self):
+        """Saves the metadata of files read since the cache was loaded"""
+        if self.cache_file is None:
+            return
+        files = {
+            path: entry for path, entry in self.cache.items() if path in self.read_paths
+        }
+        temp_file = self.cache_file + ".tmp"
+        with open(temp_file, "w") as f:
+            json.dump({"version": CACHE_VERSION, "files": files}, f)
+        os.replace(temp_file, self.cache_file)
+
+    def read_file(self, path):
+        """Returns the parsed json in path, or None if it can't be read"""
+        try:
+            stat = os.stat(path)
+            key = [stat.st_mtime_ns, stat.st_size]
+            cached = self.cache.get(path)
+            if cached is not None and cached[:2] == key:
+                metadata = cached[2]
+            else:
+                with open(path, "rb") as f:
+                    metadata = self.loads(f.read())
+                if self.cache_file is not None:
+                    self.cache[path] = [*key, metadata]
+        except (OSError, ValueError) as e:
+            logging.error("Could not read metadata %s: %s", path, e)
+            return None
+        self.read_paths.add(path)
+        return metadata
+
+    def iter_read(self, paths):
+        """Yields (path, metadata) for each of paths in order, metadata is None if it couldn't be read"""
+        if not self.workers:
+            for path in paths:
+                yield path, self.read_file(path)
+            return
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = deque()
+            for path in paths:
+                pending.append((path, pool.submit(self.read_file, path)))
+                if len(pending) >= self.workers * self.READ_AHEAD:
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            while pending:
+                path, future = pending.popleft()
+                yield path, future.result()
+
+    def read(self, paths):
+        """Returns a dictionary of path to metadata for each of paths"""
+        return dict(self.iter_read(paths))
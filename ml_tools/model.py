@@ -7,7 +7,6 @@ import tensorflow as tf
 import numpy as np
 import matplotlib.pyplot as plt
 import os.path
-import pickle
 import math
 import logging
 import time
@@ -17,6 +16,7 @@ from sklearn import metrics
 
 from ml_tools import tools
 from ml_tools import visualise
+from ml_tools.datasetstore import load_datasets
 
 
 class Model:
@@ -138,15 +138,25 @@ class Model:
         if self.training:
             self.frame_count = self.training_segment_frames
 
-    def import_dataset(self, dataset_filename, ignore_labels=None):
+    def import_dataset(
+        self, dataset_filename, ignore_labels=None, seed=None, segment_cache=None
+    ):
         """
         Import dataset.
         :param dataset_filename: path and filename of the dataset
         :param ignore_labels: (optional) these labels will be removed from the dataset.
+        :param seed: (optional) run seed, makes sampling and augmentation reproducible
+        :param segment_cache: (optional) filename of a cache of preprocessed segments
         :return:
         """
-        datasets = pickle.load(open(dataset_filename, "rb"))
+        datasets = load_datasets(
+            dataset_filename, ["train", "validation", "test"], read_only=True
+        )
         self.datasets.train, self.datasets.validation, self.datasets.test = datasets
+        for i, dataset in enumerate(datasets):
+            dataset.set_seed(None if seed is None else [seed, i])
+            if segment_cache is not None:
+                dataset.use_segment_cache(segment_cache)
 
         # augmentation really helps with reducing over-fitting, but test set should be fixed so we don't apply it there.
         self.datasets.train.enable_augmentation = self.params["augmentation"]
@@ -591,7 +601,7 @@ class Model:
     def setup_sample_training_data(self, log_dir, writer):
 
         # get some samples
-        segs = [self.datasets.train.sample_segment() for _ in range(1000)]
+        segs = self.datasets.train.sample_segments(1000)
         sample_X = []
         sample_y = []
         for segment in segs:
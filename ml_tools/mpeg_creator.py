@@ -1,6 +1,105 @@
+import glob
 import locale
+import logging
 import os
+import shutil
 import subprocess
+import time
+
+import attr
+
+
+@attr.s(frozen=True)
+class EncoderPreset:
+    """How preview videos are encoded, see PRESETS"""
+
+    codec = attr.ib()
+    quality = attr.ib()
+    # ffmpeg option setting the quality, lower is better for all presets
+    quality_option = attr.ib()
+    pix_fmt = attr.ib()
+    extension = attr.ib()
+    options = attr.ib(factory=dict)
+    # writes one image per frame into a folder named after the video
+    image_sequence = attr.ib(default=False)
+    # the preset can be encoded in process by PyAV
+    pyav = attr.ib(default=False)
+
+    def output_filename(self, filename):
+        base = os.path.splitext(filename)[0]
+        if self.image_sequence:
+            return os.path.join(base, "%06d" + self.extension)
+        return base + self.extension
+
+    def codec_args(self, quality=None):
+        args = ["-vcodec", self.codec]
+        for key, value in self.options.items():
+            args.extend(["-" + key, value])
+        if self.quality_option:
+            quality = self.quality if quality is None else quality
+            args.extend(["-" + self.quality_option, str(quality)])
+        if self.pix_fmt:
+            args.extend(["-pix_fmt", self.pix_fmt])
+        return args
+
+
+PRESETS = {
+    # window thumbnails require yuv420p for some reason
+    "grain": EncoderPreset(
+        "libx264", 21, "crf", "yuv420p", ".mp4", {"tune": "grain"}, pyav=True
+    ),
+    "veryfast": EncoderPreset(
+        "libx264", 23, "crf", "yuv420p", ".mp4", {"preset": "veryfast"}, pyav=True
+    ),
+    "ultrafast": EncoderPreset(
+        "libx264", 23, "crf", "yuv420p", ".mp4", {"preset": "ultrafast"}, pyav=True
+    ),
+    # intra frame only, cheap to encode and to seek through for review
+    "mjpeg": EncoderPreset("mjpeg", 3, "q:v", "yuvj420p", ".avi"),
+    "png": EncoderPreset("png", None, None, None, ".png", image_sequence=True),
+}
+
+DEFAULT_PRESET = "grain"
+
+ENCODER_FFMPEG = "ffmpeg"
+ENCODER_PYAV = "pyav"
+ENCODERS = [ENCODER_FFMPEG, ENCODER_PYAV]
+
+FRAME_RATE = 9
+
+
+def create_encoder(filename, preset=DEFAULT_PRESET, quality=None, encoder=None):
+    """
+    Returns an MPEGCreator, or an AVCreator if encoder is pyav and PyAV can encode
+    the preset. The file written is given by the creator's filename.
+    """
+    if encoder == ENCODER_PYAV:
+        if not PRESETS[preset].pyav:
+            logging.warning("Preset %s can't be encoded with PyAV", preset)
+        else:
+            try:
+                import av
+
+                return AVCreator(filename, quality, preset)
+            except ImportError:
+                logging.warning("PyAV is not installed, encoding with ffmpeg")
+    return MPEGCreator(filename, quality, preset)
+
+
+def purge_outputs(folder, pattern, preset=DEFAULT_PRESET):
+    """
+    Deletes the outputs the preset wrote for filenames in folder matching pattern,
+    image sequence folders are removed with their frames.
+    """
+    preset = PRESETS[preset]
+    outputs = preset.output_filename(os.path.join(folder, pattern))
+    if preset.image_sequence:
+        for sequence in glob.glob(os.path.dirname(outputs)):
+            if os.path.isdir(sequence):
+                shutil.rmtree(sequence)
+    else:
+        for output in glob.glob(outputs):
+            os.remove(output)
 
 
 class MPEGCreator:
@@ -18,8 +117,9 @@ class MPEGCreator:
     The output from ffmpeg is available via the `output` property.
     """
 
-    def __init__(self, filename, quality=21):
-        self.filename = filename
+    def __init__(self, filename, quality=None, preset=DEFAULT_PRESET):
+        self.preset = PRESETS[preset]
+        self.filename = self.preset.output_filename(filename)
         self.quality = quality
         self._ffmpeg = None
         self._output = []
@@ -52,7 +152,11 @@ class MPEGCreator:
         return (b"".join(self._output)).decode(encoding)
 
     def _start(self, width, height):
-        command = get_ffmpeg_command(self.filename, width, height, self.quality)
+        if self.preset.image_sequence:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        command = get_ffmpeg_command(
+            self.filename, width, height, self.quality, self.preset
+        )
         proc = subprocess.Popen(
             command,
             stdin=subprocess.PIPE,
@@ -68,11 +172,51 @@ class MPEGCreator:
             self._output.append(buf)
 
 
-def get_ffmpeg_command(filename, width, height, quality=21):
+class AVCreator:
+    """MPEGCreator that encodes in process with PyAV rather than piping to ffmpeg"""
+
+    def __init__(self, filename, quality=None, preset=DEFAULT_PRESET):
+        self.preset = PRESETS[preset]
+        self.filename = self.preset.output_filename(filename)
+        self.quality = self.preset.quality if quality is None else quality
+        self._container = None
+        self._stream = None
+
+    def next_frame(self, frame):
+        import av
+
+        if self._container is None:
+            height, width, _ = frame.shape
+            self._container = av.open(self.filename, mode="w")
+            self._stream = self._container.add_stream(
+                self.preset.codec, rate=FRAME_RATE
+            )
+            self._stream.width = width
+            self._stream.height = height
+            self._stream.pix_fmt = self.preset.pix_fmt
+            options = dict(self.preset.options)
+            options[self.preset.quality_option] = str(self.quality)
+            self._stream.options = options
+        av_frame = av.VideoFrame.from_ndarray(frame, format="rgb24")
+        for packet in self._stream.encode(av_frame):
+            self._container.mux(packet)
+
+    def close(self):
+        if self._container is None:
+            return
+        for packet in self._stream.encode():
+            self._container.mux(packet)
+        self._container.close()
+        self._container = None
+
+
+def get_ffmpeg_command(filename, width, height, quality=None, preset=DEFAULT_PRESET):
     if os.name == "nt":
         FFMPEG_BIN = "ffmpeg.exe"  # on Windows
     else:
         FFMPEG_BIN = "ffmpeg"  # on Linux ans Mac OS
+    if isinstance(preset, str):
+        preset = PRESETS[preset]
 
     command = [
         FFMPEG_BIN,
@@ -88,18 +232,39 @@ def get_ffmpeg_command(filename, width, height, quality=21):
         "-pix_fmt",
         "rgb24",
         "-r",
-        "9",  # frames per second
+        str(FRAME_RATE),  # frames per second
         "-i",
         "-",  # The imput comes from a pipe
         "-an",  # Tells FFMPEG not to expect any audio
-        "-vcodec",
-        "libx264",
-        "-tune",
-        "grain",  # good for keepinn the grain in our videos
-        "-crf",
-        str(quality),  # quality, lower is better
-        "-pix_fmt",
-        "yuv420p",  # window thumbnails require yuv420p for some reason
+        *preset.codec_args(quality),
         filename,
     ]
     return command
+
+
+def benchmark_presets(frames, presets, work_dir, encoder=None):
+    """
+    Encodes frames with each preset and times it
+    :param frames: list of rgb uint8 frames
+    :return: list of (preset, frames per second, bytes written)
+    """
+    results = []
+    for name in presets:
+        creator = create_encoder(
+            os.path.join(work_dir, "benchmark-{}".format(name)), name, encoder=encoder
+        )
+        start = time.time()
+        for frame in frames:
+            creator.next_frame(frame)
+        creator.close()
+        seconds = time.time() - start
+        if PRESETS[name].image_sequence:
+            folder = os.path.dirname(creator.filename)
+            size = sum(
+                os.path.getsize(os.path.join(folder, image))
+                for image in os.listdir(folder)
+            )
+        else:
+            size = os.path.getsize(creator.filename)
+        results.append((name, len(frames) / seconds if seconds > 0 else 0, size))
+    return results
@@ -1,7 +1,6 @@
 import cv2
 import enum
 import numpy as np
-import random
 from ml_tools import tools
 from track.track import TrackChannels
 from ml_tools import imageprocessing
@@ -36,6 +35,7 @@ def preprocess_segment(
     frame_size=48,
     crop_rectangle=None,
     keep_edge=False,
+    rng=None,
 ):
     """
     Preprocesses the raw track data, scaling it to correct size, and adjusting to standard levels
@@ -44,6 +44,7 @@ def preprocess_segment(
     :param frame_velocity: velocity (x,y) for each frame.
     :param augment: if true applies a slightly random crop / scale
     :param default_inset: the default number of pixels to inset when no augmentation is applied.
+    :param rng: np.random.Generator used for augmentation, defaults to a new unseeded generator
     """
 
     if reference_level is not None:
@@ -59,17 +60,19 @@ def preprocess_segment(
     data = []
     flip = False
     if augment:
+        if rng is None:
+            rng = np.random.default_rng()
         contrast_adjust = None
         level_adjust = None
-        if random.random() <= 0.75:
+        if rng.random() <= 0.75:
             # we will adjust contrast and levels, but only within these bounds.
             # that is a bright input may have brightness reduced, but not increased.
             LEVEL_OFFSET = 4
 
             # apply level and contrast shift
-            level_adjust = float(random.normalvariate(0, LEVEL_OFFSET))
-            contrast_adjust = float(tools.random_log(0.9, (1 / 0.9)))
-        if random.random() <= 0.50:
+            level_adjust = float(rng.normal(0, LEVEL_OFFSET))
+            contrast_adjust = float(tools.random_log(0.9, (1 / 0.9), rng))
+        if rng.random() <= 0.50:
             flip = True
     for i, frame in enumerate(frames):
         frame.float_arrays()
@@ -79,20 +82,24 @@ def preprocess_segment(
         max_height_offset = int(np.clip(frame_height * 0.1, 1, 2))
         max_width_offset = int(np.clip(frame_width * 0.1, 1, 2))
 
-        top_offset = random.randint(0, max_height_offset) if augment else default_inset
-        bottom_offset = (
-            random.randint(0, max_height_offset) if augment else default_inset
-        )
-        left_offset = random.randint(0, max_width_offset) if augment else default_inset
-        right_offset = random.randint(0, max_width_offset) if augment else default_inset
+        if augment:
+            top_offset, bottom_offset = rng.integers(
+                0, max_height_offset, size=2, endpoint=True
+            )
+            left_offset, right_offset = rng.integers(
+                0, max_width_offset, size=2, endpoint=True
+            )
+        else:
+            top_offset = bottom_offset = default_inset
+            left_offset = right_offset = default_inset
         if frame_height < MIN_SIZE or frame_width < MIN_SIZE:
             continue
 
         frame_bounds = tools.Rectangle(0, 0, frame_width, frame_height)
         # rotate then crop
-        if augment and random.random() <= 0.75:
+        if augment and rng.random() <= 0.75:
 
-            degrees = random.randint(0, 40) - 20
+            degrees = int(rng.integers(-20, 20, endpoint=True))
             frame.rotate(degrees)
 
         # set up a cropping frame
@@ -137,6 +144,60 @@ def preprocess_segment(
     return data, flip
 
 
+def segment_array(frames, start_frame, num_frames, frame_size):
+    """
+    Stacks preprocessed frames into an array of shape [num_frames, channels, frame_size, frame_size]
+    in TrackChannels order, frames dropped by preprocess_segment are left as zeros.
+    """
+    data = np.zeros((num_frames, 5, frame_size, frame_size), dtype=np.float32)
+    for frame in frames:
+        out = data[frame.frame_number - start_frame]
+        out[TrackChannels.thermal] = frame.thermal
+        out[TrackChannels.filtered] = frame.filtered
+        out[TrackChannels.mask] = frame.mask
+        if frame.flow is not None:
+            out[TrackChannels.flow_h] = frame.flow_h
+            out[TrackChannels.flow_v] = frame.flow_v
+    return data
+
+
+def augment_segment(data, rng, max_offset=2):
+    """
+    Applies preprocess_segment style augmentation to already preprocessed frames of
+    shape [frames, channels, height, width].  This works at the output size so is much
+    cheaper than augmenting the raw frames, crops are taken from the inset frame and
+    scaled back up rather than widened.
+    :param max_offset: maximum pixels to crop from each edge
+    """
+    data = np.float32(data)
+    height, width = data.shape[2:]
+    for frame in data:
+        if rng.random() <= 0.75:
+            degrees = int(rng.integers(-20, 20, endpoint=True))
+            for channel in frame:
+                channel[:] = imageprocessing.rotate(channel, degrees)
+        top, bottom, left, right = rng.integers(0, max_offset, size=4, endpoint=True)
+        if top or bottom or left or right:
+            for i, channel in enumerate(frame):
+                channel[:] = imageprocessing.resize_cv(
+                    channel[top : height - bottom, left : width - right],
+                    (width, height),
+                    interpolation=cv2.INTER_NEAREST
+                    if i == TrackChannels.mask
+                    else None,
+                )
+
+    if rng.random() <= 0.75:
+        level_adjust = float(rng.normal(0, 4))
+        contrast_adjust = float(tools.random_log(0.9, (1 / 0.9), rng))
+        data[:, TrackChannels.thermal] += level_adjust
+        data[:, TrackChannels.thermal] *= contrast_adjust
+        data[:, TrackChannels.filtered] *= contrast_adjust
+    if rng.random() <= 0.50:
+        data = np.flip(data, axis=3)
+    return data
+
+
 def preprocess_frame(
     data, output_dim, use_thermal=True, augment=False, preprocess_fn=None
 ):
@@ -177,6 +238,7 @@ def preprocess_movement(
     overlay=None,
     crop_rectangle=None,
     keep_edge=False,
+    rng=None,
 ):
     segment, flipped = preprocess_segment(
         segment,
@@ -187,6 +249,7 @@ def preprocess_movement(
         frame_size=frame_size,
         crop_rectangle=crop_rectangle,
         keep_edge=keep_edge,
+        rng=rng,
     )
     frame_types = {}
     channel_types = set([green_type, blue_type, red_type])
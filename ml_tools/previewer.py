@@ -18,8 +18,12 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import logging
 from os import path
+import cv2
 import numpy as np
 
 from PIL import Image, ImageDraw, ImageFont
@@ -27,7 +31,7 @@ from PIL import Image, ImageDraw, ImageFont
 from load.clip import Clip
 from ml_tools import tools
 import ml_tools.globals as globs
-from ml_tools.mpeg_creator import MPEGCreator
+from ml_tools.mpeg_creator import PRESETS, create_encoder
 from track.region import Region
 from track.track import TrackChannels
 
@@ -55,9 +59,13 @@ class Previewer:
     TRACK_COLOURS = [(255, 0, 0), (0, 255, 0), (255, 255, 0), (128, 255, 255)]
     FILTERED_COLOURS = [(128, 128, 128)]
 
-    def __init__(self, config, preview_type):
+    # frames rendered ahead of the writer, per render thread
+    RENDER_AHEAD = 4
+
+    def __init__(self, config, preview_type, render_threads=None):
         self.config = config
         self.colourmap = self._load_colourmap()
+        self.colour_lut = tools.colourmap_lut(self.colourmap)
 
         # make sure all the required files are there
         self.track_descs = {}
@@ -66,6 +74,10 @@ class Previewer:
         self.preview_type = preview_type
         self.frame_scale = 1
         self.debug = config.debug
+        # threads drawing preview frames, 0 draws them on the calling thread
+        if render_threads is None:
+            render_threads = config.worker_threads
+        self.render_threads = render_threads
 
     @classmethod
     def create_if_required(self, config, preview_type):
@@ -109,8 +121,6 @@ class Previewer:
             logging.error("Do not have temperatures to use.")
             return
 
-        if self.debug:
-            footer = Previewer.stats_footer(clip.stats)
         if predictions and (
             self.preview_type == self.PREVIEW_CLASSIFIED
             or self.preview_type == self.PREVIEW_TRACKING
@@ -118,101 +128,156 @@ class Previewer:
             self.create_track_descriptions(clip, predictions)
 
         if clip.stats.min_temp is None or clip.stats.max_temp is None:
-            thermals = [frame.thermal for frame in clip.frame_buffer.frames]
-            clip.stats.min_temp = np.amin(thermals)
-            clip.stats.max_temp = np.amax(thermals)
-        mpeg = MPEGCreator(filename)
-        for frame_number, frame in enumerate(clip.frame_buffer):
-            if self.preview_type == self.PREVIEW_RAW:
-                image = self.convert_and_resize(
-                    frame.thermal, clip.stats.min_temp, clip.stats.max_temp
-                )
-                draw = ImageDraw.Draw(image)
-            elif self.preview_type == self.PREVIEW_TRACKING:
-                image = self.create_four_tracking_image(
-                    frame, clip.stats.min_temp, clip.stats.max_temp
-                )
-                image = self.convert_and_resize(
-                    image,
-                    clip.stats.min_temp,
-                    clip.stats.max_temp,
-                    3.0,
-                    mode=Image.NEAREST,
-                )
-                draw = ImageDraw.Draw(image)
-                self.add_tracks(draw, clip.tracks, frame_number, predictions)
+            for frame in clip.frame_buffer:
+                clip.stats.update_temp_range(frame.thermal)
+        footer = Previewer.stats_footer(clip.stats) if self.debug else None
+
+        def render(item):
+            frame_number, frame = item
+            return self.render_frame(clip, frame_number, frame, predictions, footer)
+
+        mpeg = self.create_encoder(filename)
+        try:
+            for image in ordered_map(
+                render, enumerate(clip.frame_buffer), self.render_threads
+            ):
+                mpeg.next_frame(image)
+        finally:
+            clip.frame_buffer.close_cache()
+            mpeg.close()
+
+    def output_filename(self, filename):
+        """Returns the file, or image sequence, the preview for filename is written to"""
+        return PRESETS[self.config.previews_preset].output_filename(filename)
+
+    def create_encoder(self, filename):
+        return create_encoder(
+            filename,
+            self.config.previews_preset,
+            encoder=self.config.previews_encoder,
+        )
 
-            elif self.preview_type == self.PREVIEW_BOXES:
-                image = self.convert_and_resize(
-                    frame.thermal, clip.stats.min_temp, clip.stats.max_temp, 4.0
-                )
-                draw = ImageDraw.Draw(image)
-                screen_bounds = Region(0, 0, image.width, image.height)
-                self.add_tracks(
-                    draw, clip.tracks, frame_number, colours=[(128, 255, 255)]
-                )
+    def render_frame(self, clip, frame_number, frame, predictions=None, footer=None):
+        """Draws one frame of the clip preview, returning it as an rgb array"""
+        draw = None
+        if self.preview_type == self.PREVIEW_RAW:
+            image = self.convert_and_resize(
+                frame.thermal, clip.stats.min_temp, clip.stats.max_temp
+            )
+            draw = ImageDraw.Draw(image)
+        elif self.preview_type == self.PREVIEW_TRACKING:
+            image = self.create_four_tracking_image(
+                frame, clip.stats.min_temp, clip.stats.max_temp
+            )
+            image = self.convert_and_resize(
+                image,
+                clip.stats.min_temp,
+                clip.stats.max_temp,
+                3.0,
+                interpolation=cv2.INTER_NEAREST,
+            )
+            draw = ImageDraw.Draw(image)
+            self.add_tracks(draw, clip.tracks, frame_number, predictions)
 
-            elif self.preview_type == self.PREVIEW_CLASSIFIED:
-                image = self.convert_and_resize(
-                    frame.thermal, clip.stats.min_temp, clip.stats.max_temp, 4.0
-                )
-                draw = ImageDraw.Draw(image)
-                screen_bounds = Region(0, 0, image.width, image.height)
-                self.add_tracks(
-                    draw, clip.tracks, frame_number, predictions, screen_bounds
-                )
-            if frame.ffc_affected:
-                self.add_header(draw, image.width, image.height, "Calibrating ...")
-            if self.debug and draw:
-                self.add_footer(
-                    draw, image.width, image.height, footer, frame.ffc_affected
-                )
-            mpeg.next_frame(np.asarray(image))
+        elif self.preview_type == self.PREVIEW_BOXES:
+            image = self.convert_and_resize(
+                frame.thermal, clip.stats.min_temp, clip.stats.max_temp, 4.0
+            )
+            draw = ImageDraw.Draw(image)
+            self.add_tracks(draw, clip.tracks, frame_number, colours=[(128, 255, 255)])
 
-            # we store the entire video in memory so we need to cap the frame count at some point.
-            if frame_number > clip.frames_per_second * 60 * 10:
-                break
-        clip.frame_buffer.close_cache()
-        mpeg.close()
+        elif self.preview_type == self.PREVIEW_CLASSIFIED:
+            image = self.convert_and_resize(
+                frame.thermal, clip.stats.min_temp, clip.stats.max_temp, 4.0
+            )
+            draw = ImageDraw.Draw(image)
+            screen_bounds = Region(0, 0, image.width, image.height)
+            self.add_tracks(draw, clip.tracks, frame_number, predictions, screen_bounds)
+        if frame.ffc_affected:
+            self.add_header(draw, image.width, image.height, "Calibrating ...")
+        if self.debug and draw:
+            self.add_footer(draw, image.width, image.height, footer, frame.ffc_affected)
+        return np.asarray(image)
 
     def create_individual_track_previews(self, filename, clip: Clip):
+        """
+        Writes a preview of each track, the clip is read once and every track that is
+        on a frame is written to its own encoder as the frame is reached.
+        """
+        filename_format = path.splitext(filename)[0] + "-{}.mp4"
+        last_frames = {
+            id: track.bounds_history[-1].frame_number
+            for id, track in enumerate(clip.tracks)
+            if track.bounds_history
+        }
+        mpegs = {}
+        try:
+            for frame_number, images in self.render_track_frames(clip):
+                for id, image in images:
+                    if id not in mpegs:
+                        mpegs[id] = self.create_encoder(filename_format.format(id + 1))
+                        logging.info("creating preview %s", mpegs[id].filename)
+                    mpegs[id].next_frame(image)
+                    if frame_number == last_frames[id]:
+                        mpegs.pop(id).close()
+        finally:
+            for mpeg in mpegs.values():
+                mpeg.close()
+
+    def render_track_frames(self, clip):
+        """
+        Yields frame number and a list of (track index, rgb image) for each track
+        on the frame, up to the last tracked frame of the clip.
+        """
         # resolution of video file.
         # videos look much better scaled up
-        filename_format = path.splitext(filename)[0] + "-{}.mp4"
-
         FRAME_SIZE = 4 * 48
         frame_width, frame_height = FRAME_SIZE, FRAME_SIZE
 
+        regions_by_frame = {}
         for id, track in enumerate(clip.tracks):
-            video_frames = []
             for region in track.bounds_history:
-                frame = clip.frame_buffer.get_frame(region.frame_number)
+                regions_by_frame.setdefault(region.frame_number, []).append(
+                    (id, region)
+                )
+        if not regions_by_frame:
+            return
+
+        def render(item):
+            frame_number, frame = item
+            images = []
+            for id, region in regions_by_frame.get(frame_number, []):
                 cropped = frame.crop_by_region(region)
-                img = tools.convert_heat_to_img(
+                img = tools.heat_to_rgb(
                     cropped.thermal,
-                    self.colourmap,
+                    self.colour_lut,
                     np.amin(cropped.thermal),
                     np.amax(cropped.thermal),
                 )
-                img = img.resize((frame_width, frame_height), Image.NEAREST)
-                video_frames.append(np.asarray(img))
+                img = cv2.resize(
+                    img, (frame_width, frame_height), interpolation=cv2.INTER_NEAREST
+                )
+                images.append((id, img))
+            return frame_number, images
 
-            logging.info("creating preview %s", filename_format.format(id + 1))
-            tools.write_mpeg(filename_format.format(id + 1), video_frames)
+        frames = islice(enumerate(clip.frame_buffer), max(regions_by_frame) + 1)
+        yield from ordered_map(render, frames, self.render_threads)
 
-    def convert_and_resize(self, frame, h_min, h_max, size=None, mode=Image.BILINEAR):
+    def convert_and_resize(
+        self, frame, h_min, h_max, size=None, interpolation=cv2.INTER_LINEAR
+    ):
         """Converts the image to colour using colour map and resize"""
         thermal = frame[:120, :160].copy()
-        image = tools.convert_heat_to_img(frame, self.colourmap, h_min, h_max)
+        image = tools.heat_to_rgb(frame, self.colour_lut, h_min, h_max)
         if size:
             self.frame_scale = size
-            image = image.resize(
-                (
-                    int(image.width * self.frame_scale),
-                    int(image.height * self.frame_scale),
-                ),
-                mode,
+            height, width = image.shape[:2]
+            image = cv2.resize(
+                image,
+                (int(width * self.frame_scale), int(height * self.frame_scale)),
+                interpolation=interpolation,
             )
+        image = Image.fromarray(image)
 
         if self.debug:
             tools.add_heat_number(image, thermal, self.frame_scale)
@@ -468,3 +533,22 @@ def none_or_round(value, decimals=0):
         return round(value, decimals)
     else:
         return value
+
+
+def ordered_map(fn, items, threads, ahead=Previewer.RENDER_AHEAD):
+    """
+    Yields fn(item) for each of items in order, computing them on a pool of threads
+    with at most threads * ahead results in flight.
+    :param threads: number of threads, 0 calls fn on the calling thread
+    """
+    if not threads:
+        yield from map(fn, items)
+        return
+    with ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= threads * ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
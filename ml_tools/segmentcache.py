@@ -0,0 +1,127 @@
+"""
+On disk cache of preprocessed track frames used for training.
+
+Frames are cropped with the default inset, resized, have the reference level
+removed and are normalised once when the cache is built, so fetching a segment
+is a single read.  Augmentation is applied to the cached frames at sample time.
+"""
+
+import logging
+import os
+
+import h5py
+import numpy as np
+
+from ml_tools.preprocess import preprocess_segment, segment_array
+
+CACHE_VERSION = 1
+CACHE_FILE = "segment_cache.hdf5"
+
+
+def segment_cache_path(config):
+    return os.path.join(config.tracks_folder, CACHE_FILE)
+
+
+def cache_key(frame_size, default_inset, keep_aspect=False):
+    """Name of the group holding frames preprocessed with these parameters"""
+    return "v{}_size{}_inset{}_aspect{}".format(
+        CACHE_VERSION, frame_size, default_inset, int(keep_aspect)
+    )
+
+
+class SegmentCache:
+    """
+    Preprocessed frames for each track stored as float16 arrays of shape
+    [frames, channels, frame_size, frame_size] in TrackChannels order.
+    """
+
+    # frames per hdf5 chunk, a 3 second segment at 9 fps touches 3 to 4 chunks
+    CHUNK_FRAMES = 9
+
+    def __init__(self, filename, frame_size=48, default_inset=2, keep_aspect=False):
+        self.filename = filename
+        self.frame_size = frame_size
+        self.default_inset = default_inset
+        self.keep_aspect = keep_aspect
+        self.key = cache_key(frame_size, default_inset, keep_aspect)
+        self.f = None
+        self.pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["f"] = None
+        state["pid"] = None
+        return state
+
+    def open(self):
+        # hdf5 handles can't be shared with forked workers, so each process opens its own
+        if self.f is None or self.pid != os.getpid():
+            self.f = h5py.File(self.filename, "r")
+            self.pid = os.getpid()
+        return self.f
+
+    def close(self):
+        if self.f is not None and self.pid == os.getpid():
+            self.f.close()
+        self.f = None
+        self.pid = None
+
+    def track_key(self, clip_id, track_number):
+        return "{}/{}/{}".format(self.key, clip_id, track_number)
+
+    def has_track(self, clip_id, track_number):
+        if not os.path.exists(self.filename):
+            return False
+        return self.track_key(clip_id, track_number) in self.open()
+
+    def get_frames(self, clip_id, track_number, start_frame, end_frame):
+        """
+        Returns preprocessed frames start_frame to end_frame (exclusive) of a track
+        :return: float16 array of shape [frames, channels, frame_size, frame_size]
+        """
+        node = self.open()[self.track_key(clip_id, track_number)]
+        data = np.empty((end_frame - start_frame, *node.shape[1:]), dtype=node.dtype)
+        node.read_direct(data, np.s_[start_frame:end_frame])
+        return data
+
+    def build(self, track_db, tracks, overwrite=False):
+        """
+        Preprocesses and stores every frame of the given tracks, tracks already in
+        the cache are skipped unless overwrite is set.
+        :return: number of tracks added
+        """
+        self.close()
+        added = 0
+        with h5py.File(self.filename, "a") as f:
+            f.attrs["version"] = CACHE_VERSION
+            group = f.require_group(self.key)
+            group.attrs["frame_size"] = self.frame_size
+            group.attrs["default_inset"] = self.default_inset
+            group.attrs["keep_aspect"] = self.keep_aspect
+            for track in tracks:
+                key = "{}/{}".format(track.clip_id, track.track_id)
+                if key in group:
+                    if not overwrite:
+                        continue
+                    del group[key]
+                data = self.preprocess_track(track_db, track)
+                group.create_dataset(
+                    key,
+                    data=data,
+                    chunks=(min(len(data), self.CHUNK_FRAMES), *data.shape[1:]),
+                )
+                added += 1
+                if added % 100 == 0:
+                    logging.info("cached %d tracks", added)
+        return added
+
+    def preprocess_track(self, track_db, track):
+        frames = track_db.get_track(track.clip_id, track.track_id, 0, track.num_frames)
+        frames, _ = preprocess_segment(
+            frames,
+            reference_level=track.frame_temp_median,
+            default_inset=self.default_inset,
+            keep_aspect=self.keep_aspect,
+            frame_size=self.frame_size,
+        )
+        return np.float16(segment_array(frames, 0, track.num_frames, self.frame_size))
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from config.config import Config
+from ml_tools.cptvfileprocessor import CPTVFileProcessor, ProgressJournal
+
+
+class RecordingProcessor(CPTVFileProcessor):
+    """Writes an output file for each file processed, failing on 'bad' files"""
+
+    def get_classify_filename(self, filename):
+        return os.path.join(
+            self.config.classify.classify_folder,
+            os.path.splitext(os.path.basename(filename))[0],
+        )
+
+    def process_file(self, filename):
+        if "bad" in filename:
+            raise ValueError("bad file")
+        with open(self.get_classify_filename(filename) + ".txt", "w") as f:
+            f.write("done")
+        self.processed.append(os.path.basename(filename))
+
+
+class FailingInitProcessor(RecordingProcessor):
+    def init_worker(self):
+        raise ValueError("model not found")
+
+
+def make_processor(tmp_path, workers, processor_class=RecordingProcessor):
+    config = Config.get_defaults()
+    config.worker_threads = workers
+    config.classify.classify_folder = str(tmp_path / "classify")
+    processor = processor_class(config, config.classify_tracking)
+    processor.processed = []
+    return processor
+
+
+@pytest.fixture
+def source(tmp_path):
+    folder = tmp_path / "source"
+    (folder / "sub").mkdir(parents=True)
+    for name, size in [("small", 1), ("sub/large", 30), ("medium", 10), ("bad", 20)]:
+        (folder / (name + ".cptv")).write_bytes(b"x" * size)
+    (folder / "small.txt").write_text("{}")
+    return str(folder)
+
+
+def test_process_largest_first(tmp_path, source):
+    processor = make_processor(tmp_path, 0)
+    journal_file = os.path.join(
+        processor.config.classify.classify_folder, processor.JOURNAL_NAME
+    )
+    # an interrupted run processed medium, and failed on bad
+    with open(journal_file, "w") as f:
+        for name, succeeded in [("medium", True), ("bad", False)]:
+            entry = {
+                "file": os.path.join(source, name + ".cptv"),
+                "seconds": 1,
+                "succeeded": succeeded,
+            }
+            f.write(json.dumps(entry) + "\n")
+        f.write('{"file": "partly wri')
+
+    processor.process_all(source)
+
+    assert processor.processed == ["large.cptv", "small.cptv"]
+    assert not os.path.exists(journal_file)
+
+
+def test_process_on_pool(tmp_path, source):
+    processor = make_processor(tmp_path, 2)
+    processor.process_all(source)
+
+    outputs = os.listdir(processor.config.classify.classify_folder)
+    assert sorted(outputs) == ["large.txt", "medium.txt", "small.txt"]
+
+
+def test_worker_init_error(tmp_path, source):
+    processor = make_processor(tmp_path, 2, FailingInitProcessor)
+    processor.process_all(source)
+
+    outputs = os.listdir(processor.config.classify.classify_folder)
+    assert sorted(outputs) == ["large.txt", "medium.txt", "small.txt"]
+
+
+def test_journal(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    journal = ProgressJournal(filename)
+    journal.record("a.cptv", 2.25, True)
+    journal.record("b.cptv", 1, False)
+    assert ProgressJournal(filename).completed == {"a.cptv"}
+    journal.finish()
+    assert ProgressJournal(filename).completed == set()
@@ -0,0 +1,239 @@
+import os
+import pickle
+import threading
+
+import h5py
+import numpy as np
+import pytest
+
+from ml_tools.dataset import Dataset
+from ml_tools.datasetstructures import TrackHeader
+from ml_tools.trackdatabase import TrackDatabase
+
+LABELS = ["bird", "cat", "hedgehog"]
+
+
+def make_track(clip_id, track_id, label, num_frames, rng):
+    bounds = [[10 + i, 10, 20 + i, 20] for i in range(num_frames)]
+    mass = rng.randint(20, 150, num_frames)
+    track = TrackHeader(
+        clip_id=clip_id,
+        track_id=track_id,
+        label=label,
+        start_time=None,
+        num_frames=num_frames,
+        duration=num_frames / 9,
+        camera="camera",
+        location=None,
+        score=1,
+        track_bounds=bounds,
+        frame_temp_median=[0] * num_frames,
+        frames_per_second=9,
+        predictions=None,
+        correct_prediction=None,
+        frame_mass=mass,
+        start_frame=0,
+        important_frames=range(0, num_frames, 3),
+    )
+    track.calculate_segments(mass, 9, 27, use_important=False)
+    return track
+
+
+def make_dataset(seed=0):
+    rng = np.random.RandomState(seed)
+    dataset = Dataset(None, "test")
+    tracks = []
+    for clip_id in range(20):
+        label = LABELS[clip_id % len(LABELS)]
+        for track_id in range(rng.randint(1, 3)):
+            tracks.append(
+                make_track(str(clip_id), track_id, label, rng.randint(30, 120), rng)
+            )
+    dataset.add_tracks(tracks)
+    dataset.rebuild_cdf()
+    return dataset
+
+
+def make_track_db(filename, seed=0):
+    rng = np.random.RandomState(seed)
+    with h5py.File(filename, "w") as f:
+        clips = f.create_group("clips")
+        for clip_id in range(30):
+            num_frames = 120
+            clip = clips.create_group(str(clip_id))
+            clip.attrs["finished"] = True
+            clip.attrs["start_time"] = "2020-01-{:02}T10:00:00".format(clip_id % 28 + 1)
+            clip.attrs["filename"] = "{}.cptv".format(clip_id)
+            clip.attrs["device"] = "camera{}".format(clip_id % 4)
+            clip.attrs["frame_temp_median"] = np.full(num_frames, 3000, np.float32)
+            for track_id in range(rng.randint(1, 4)):
+                frames = rng.randint(30, num_frames)
+                track = clip.create_group(str(track_id))
+                track.attrs["tag"] = LABELS[rng.randint(len(LABELS))]
+                track.attrs["confidence"] = rng.uniform(0.5, 1)
+                track.attrs["score"] = 1.0
+                track.attrs["start_time"] = "2020-01-01T10:00:00"
+                track.attrs["end_time"] = "2020-01-01T10:00:10"
+                track.attrs["frames"] = frames
+                track.attrs["start_frame"] = 0
+                track.attrs["bounds_history"] = [
+                    [10 + i, 10, 20 + i, 20] for i in range(frames)
+                ]
+                track.attrs["mass_history"] = rng.randint(20, 150, frames)
+                track.attrs["important_frames"] = np.sort(
+                    rng.choice(frames, frames // 2, replace=False)
+                )
+
+
+def make_loader_dataset(db, name="test"):
+    dataset = Dataset(db, name)
+    dataset.banned_clips = None
+    dataset.included_labels = LABELS
+    dataset.clip_before_date = None
+    dataset.segment_min_mass = None
+    return dataset
+
+
+def fake_fetch_segment(self, segment, augment=False, rng=None):
+    # stands in for reading the track database, jitter comes from the generator
+    return np.float32([segment.index, rng.random()])
+
+
+def worker_next_batch(
+    self, n, disable_async=False, force_no_augmentation=False, rng=None
+):
+    # tags each batch with the worker that made it
+    worker = (os.getpid(), threading.get_ident())
+    segments = self.sample_segments(n, rng=rng)
+    return worker, [(segment.id, rng.random()) for segment in segments]
+
+
+class TestDataset:
+    def assert_weights_match(self, dataset):
+        expected = [segment.weight for segment in dataset.segments]
+        assert np.allclose(dataset.segment_weights.weights, expected)
+        assert np.allclose(dataset.segment_weights.cdf, np.cumsum(expected))
+
+    def test_balance_weights(self):
+        dataset = make_dataset()
+        dataset.balance_weights({"cat": 2})
+        self.assert_weights_match(dataset)
+        label_weights = [dataset.get_label_weight(label) for label in LABELS]
+        assert np.isclose(label_weights[0], label_weights[2])
+        assert np.isclose(label_weights[1], label_weights[0] * 2)
+
+    @pytest.mark.parametrize("max_bin_weight", [None, 2])
+    def test_balance_bins(self, max_bin_weight):
+        dataset = make_dataset()
+        dataset.balance_bins(max_bin_weight)
+        self.assert_weights_match(dataset)
+        for tracks in dataset.tracks_by_bin.values():
+            bin_weight = sum(track.weight for track in tracks)
+            if max_bin_weight is None:
+                assert np.isclose(bin_weight, 1)
+            else:
+                assert bin_weight <= max_bin_weight + 1e-9
+
+    def test_remove_label(self):
+        dataset = make_dataset()
+        dataset.remove_label("cat")
+        self.assert_weights_match(dataset)
+        assert all(segment.label != "cat" for segment in dataset.segments)
+        assert all(segment.label != "cat" for segment in dataset.sample_segments(100))
+
+    def test_regroup(self):
+        dataset = make_dataset()
+        dataset.regroup([(["bird", "cat"], "animal"), (["hedgehog"], "hedgehog")])
+        self.assert_weights_match(dataset)
+        animals = dataset.sample_segments(100, label="animal")
+        assert all(segment.label in ["bird", "cat"] for segment in animals)
+
+    def test_sample_distribution(self):
+        dataset = make_dataset()
+        dataset.balance_bins()
+        dataset.set_seed(0)
+        n = 20000
+        segments = dataset.sample_segments(n)
+        assert len(segments) == n
+        counts = {}
+        for segment in segments:
+            counts[segment.track_bin] = counts.get(segment.track_bin, 0) + 1
+        # every bin has equal weight
+        expected = n / len(dataset.tracks_by_bin)
+        for count in counts.values():
+            assert abs(count - expected) < expected * 0.2
+
+        frames = dataset.sample_frames(100, label="hedgehog")
+        assert all(frame.label == "hedgehog" for frame in frames)
+
+    def test_pickle(self):
+        dataset = make_dataset()
+        dataset.balance_bins()
+        loaded = pickle.loads(pickle.dumps(dataset))
+        assert len(loaded.segments) == len(dataset.segments)
+        for segment, loaded_segment in zip(dataset.segments, loaded.segments):
+            assert loaded_segment.id == segment.id
+            assert loaded_segment.start_frame == segment.start_frame
+            assert loaded_segment.weight == segment.weight
+            assert loaded_segment.track.unique_id == segment.track.unique_id
+            # views are shared with the tracks
+            assert loaded_segment in loaded_segment.track.segments
+        for frame, loaded_frame in zip(dataset.frame_samples, loaded.frame_samples):
+            assert loaded_frame.unique_track_id == frame.unique_track_id
+            assert loaded_frame.frame_num == frame.frame_num
+        loaded.balance_weights()
+        self.assert_weights_match(loaded)
+
+    def test_parallel_load_tracks(self, tmp_path, monkeypatch):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_track_db(filename)
+        db = TrackDatabase(filename)
+        monkeypatch.setattr(Dataset, "LOAD_SHARD_SIZE", 7)
+        datasets = []
+        for workers in [0, 2]:
+            dataset = make_loader_dataset(db)
+            loaded, total = dataset.load_tracks(shuffle=True, workers=workers, seed=5)
+            assert loaded == len(dataset.tracks)
+            datasets.append(dataset)
+        sequential, parallel = datasets
+        assert sequential.filtered_stats == parallel.filtered_stats
+        assert sequential.filtered_stats["confidence"] > 0
+        assert sequential.labels == parallel.labels
+        assert [track.unique_id for track in sequential.tracks] == [
+            track.unique_id for track in parallel.tracks
+        ]
+        assert len(sequential.segments) > 0
+        for segment, parallel_segment in zip(sequential.segments, parallel.segments):
+            assert segment.unique_track_id == parallel_segment.unique_track_id
+            assert np.array_equal(segment.frame_indices, parallel_segment.frame_indices)
+        ids = [segment.id for segment in parallel.segments]
+        assert len(set(ids)) == len(ids)
+
+    def test_seeded_batches(self, monkeypatch):
+        monkeypatch.setattr(Dataset, "fetch_segment", fake_fetch_segment)
+        batches = []
+        for seed in [1, 1, 2]:
+            dataset = make_dataset()
+            dataset.set_seed(seed)
+            batches.append(dataset.next_batch(20)[0])
+        assert np.array_equal(batches[0], batches[1])
+        assert not np.array_equal(batches[0], batches[2])
+
+    @pytest.mark.parametrize("process_based", [True, False])
+    def test_preloader_streams_differ(self, monkeypatch, process_based):
+        monkeypatch.setattr(Dataset, "next_batch", worker_next_batch)
+        monkeypatch.setattr(Dataset, "PROCESS_BASED", process_based)
+        dataset = make_dataset()
+        dataset.set_seed(3)
+        dataset.start_async_load(16)
+        streams = {}
+        try:
+            while len(streams) < 2 or min(map(len, streams.values())) < 10:
+                worker, batch = dataset.preloader_queue.get(timeout=10)
+                streams.setdefault(worker, []).extend(batch)
+        finally:
+            dataset.stop_async_load()
+        assert len(streams) == 2
+        first, second = [stream[:10] for stream in streams.values()]
+        assert first != second
+        assert not set(value for _, value in first) & set(value for _, value in second)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from ml_tools.datasetstore import load_datasets, read_meta, save_datasets
+from ml_tools.test_dataset import make_dataset
+
+
+class TestDatasetStore:
+    def test_round_trip(self, tmp_path):
+        train = make_dataset()
+        train.name = "train"
+        train.balance_bins()
+        test = make_dataset(seed=1)
+        test.name = "test"
+        test.regroup([(["bird", "cat"], "animal"), (["hedgehog"], "hedgehog")])
+        save_datasets(str(tmp_path), [train, test])
+
+        meta = read_meta(str(tmp_path))
+        assert [split["name"] for split in meta["splits"]] == ["train", "test"]
+        assert meta["splits"][0]["labels"] == train.labels
+
+        for dataset, loaded in zip(
+            [test, train], load_datasets(str(tmp_path), ["test", "train"])
+        ):
+            assert loaded.name == dataset.name
+            assert loaded.labels == dataset.labels
+            assert loaded.label_mapping == dataset.label_mapping
+            assert set(loaded.tracks_by_bin) == set(dataset.tracks_by_bin)
+            for track, loaded_track in zip(dataset.tracks, loaded.tracks):
+                assert set(loaded_track.__dict__) == set(track.__dict__)
+                assert loaded_track.unique_id == track.unique_id
+                assert np.array_equal(loaded_track.track_bounds, track.track_bounds)
+                assert np.allclose(loaded_track.frame_velocity, track.frame_velocity)
+                assert [s.id for s in loaded_track.segments] == [
+                    s.id for s in track.segments
+                ]
+            for segment, loaded_segment in zip(dataset.segments, loaded.segments):
+                assert loaded_segment.id == segment.id
+                assert loaded_segment.weight == segment.weight
+                assert loaded_segment is loaded_segment.track.get_segment(
+                    loaded_segment.index
+                )
+            for label, frames in dataset.frames_by_label.items():
+                assert [f.frame_num for f in loaded.frames_by_label[label]] == [
+                    f.frame_num for f in frames
+                ]
+            loaded.balance_weights()
+            assert len(loaded.sample_segments(10)) == 10
+
+    def test_unsupported_version(self, tmp_path):
+        save_datasets(str(tmp_path), [make_dataset()])
+        meta_file = tmp_path / "meta.json"
+        meta_file.write_text(
+            meta_file.read_text().replace('"version": 1', '"version": 0')
+        )
+        with pytest.raises(ValueError):
+            load_datasets(str(tmp_path))
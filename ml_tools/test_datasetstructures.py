@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from ml_tools.test_dataset import make_track
+
+
+def naive_consecutive_segments(mass_history, spacing, width, min_mass):
+    segments = []
+    filtered = 0
+    for start in range(0, len(mass_history) - width + 1, spacing):
+        avg_mass = np.mean(mass_history[start : start + width])
+        if min_mass and avg_mass < min_mass:
+            filtered += 1
+            continue
+        if avg_mass < 50:
+            weight = 0.75
+        elif avg_mass < 100:
+            weight = 1
+        else:
+            weight = 1.2
+        segments.append((start, avg_mass, weight))
+    return segments, filtered
+
+
+class TestTrackHeader:
+    @pytest.mark.parametrize("num_frames", [27, 28, 100, 301])
+    @pytest.mark.parametrize("min_mass", [None, 80])
+    def test_consecutive_segments(self, num_frames, min_mass):
+        rng = np.random.RandomState(num_frames)
+        track = make_track("1", 1, "cat", num_frames, rng)
+        mass = track.frame_mass
+        track.calculate_segments(mass, 9, 27, min_mass, use_important=False)
+        expected, filtered = naive_consecutive_segments(mass, 9, 27, min_mass)
+        assert len(track.segments) == len(expected)
+        assert track.filtered_stats["segment_mass"] == filtered
+        for segment, (start, avg_mass, weight) in zip(track.segments, expected):
+            assert segment.start_frame == start
+            assert segment.frames == 27
+            assert np.isclose(segment.avg_mass, avg_mass)
+            assert segment.weight == weight
+
+    def test_important_segments(self):
+        rng = np.random.RandomState(0)
+        track = make_track("1", 1, "cat", 600, rng)
+        mass = track.frame_mass
+        frame_nums = [frame.frame_num for frame in track.sample_frames]
+        track.calculate_segments(mass, 9, 27, rng=np.random.default_rng(1))
+        # one segment for every 9 sample frames over the segment width
+        assert len(track.segments) == (len(frame_nums) - 27) // 9 + 1
+        for segment in track.segments:
+            frames = segment.frame_indices
+            assert len(frames) == 27
+            assert len(set(frames)) == 27
+            assert np.all(np.diff(frames) > 0)
+            assert set(frames).issubset(frame_nums)
+            assert np.isclose(segment.avg_mass, np.mean(mass[frames]))
+
+        again = make_track("1", 1, "cat", 600, np.random.RandomState(0))
+        again.calculate_segments(mass, 9, 27, rng=np.random.default_rng(1))
+        for segment, other in zip(track.segments, again.segments):
+            assert np.array_equal(segment.frame_indices, other.frame_indices)
+
+        # each sample frame is equally likely to be chosen
+        counts = np.zeros(600)
+        generator = np.random.default_rng(2)
+        for _ in range(200):
+            track.calculate_segments(mass, 9, 27, rng=generator)
+            for segment in track.segments:
+                counts[segment.frame_indices] += 1
+        expected = 200 * len(track.segments) * 27 / len(frame_nums)
+        assert np.all(np.abs(counts[frame_nums] - expected) < expected * 0.2)
+
+    def test_recalculate_segments(self):
+        rng = np.random.RandomState(0)
+        track = make_track("1", 1, "cat", 300, rng)
+        mass = track.frame_mass
+        track.calculate_segments(mass, 9, 27, rng=np.random.default_rng(1))
+        track.calculate_segments(mass, 27, 27, use_important=False)
+        expected, _ = naive_consecutive_segments(mass, 27, 27, None)
+        assert len(track.segment_data) == len(expected)
+        assert len(track._segment_views) == len(expected)
+        assert len(track.segment_frames) == 0
+        for i, (segment, (start, _, _)) in enumerate(zip(track.segments, expected)):
+            assert segment.index == i
+            assert segment.start_frame == start
+            assert segment.frame_indices is None
@@ -0,0 +1,53 @@
+import h5py
+import numpy as np
+import pytest
+
+from ml_tools.dblayout import Layout, benchmark, frames_size, repack
+from ml_tools.test_trackdatabase import FRAMES, make_frames_db
+from ml_tools.trackdatabase import TrackDatabase
+
+
+class TestDBLayout:
+    @pytest.mark.parametrize(
+        "layout", ["channel/none/none", "frame/gzip/byte", "channel/lzf/none"]
+    )
+    def test_repack(self, tmp_path, layout):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_frames_db(filename, {"chunks": "channel"})
+        layout = Layout.parse(layout)
+        repacked = str(tmp_path / "repacked.hdf5")
+        repack(filename, repacked, layout)
+
+        expected = TrackDatabase(filename).get_track("1", 0)
+        frames = TrackDatabase(repacked, read_only=True).get_track("1", 0)
+        assert len(frames) == FRAMES
+        for frame, expected_frame in zip(frames, expected):
+            assert np.array_equal(frame.as_array(), expected_frame.as_array())
+        with h5py.File(repacked, "r") as f:
+            track = f["clips/1/0"]
+            assert track.attrs["frames"] == FRAMES
+            node = track["cropped/0"]
+            assert node.chunks == layout.dataset_opts(node.shape)["chunks"]
+            assert node.compression == (
+                None if layout.compressor == "none" else layout.compressor
+            )
+        stored, raw = frames_size(repacked)
+        assert raw == sum(frame.as_array().size * 2 for frame in expected)
+
+    def test_benchmark(self, tmp_path):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_frames_db(filename, {})
+        layouts = [Layout.parse("channel/gzip/byte"), Layout.parse("frame/none/none")]
+        results = benchmark(filename, layouts, track_count=1)
+        assert [layout for layout, *_ in results] == layouts
+        for _, stored, raw, reads in results:
+            assert stored > 0 and raw > 0
+            assert set(reads) == {"full track", "random segment", "single channel"}
+        assert list(tmp_path.iterdir()) == [tmp_path / "dataset.hdf5"]
+
+    def test_parse(self):
+        with pytest.raises(ValueError):
+            Layout.parse("channel/gzip")
+        with pytest.raises(ValueError):
+            Layout.parse("channel/gzip/bit")
+        assert Layout.parse("frame/blosc:zstd/bit").name == "frame/blosc:zstd/bit"
@@ -0,0 +1,63 @@
+import json
+import os
+
+from ml_tools.metadatareader import MetadataReader, scan_files
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def test_iter_read_keeps_order(tmp_path):
+    paths = []
+    for i in range(50):
+        path = str(tmp_path / "{}.txt".format(i))
+        write_json(path, {"id": i})
+        paths.append(path)
+    missing = str(tmp_path / "missing.txt")
+
+    reader = MetadataReader(workers=4)
+    reader.READ_AHEAD = 2
+    results = list(reader.iter_read(paths + [missing]))
+
+    assert [path for path, _ in results] == paths + [missing]
+    assert [data["id"] for _, data in results[:-1]] == list(range(50))
+    assert results[-1][1] is None
+
+
+def test_cache_reparses_modified_files(tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    same = str(tmp_path / "same.txt")
+    changed = str(tmp_path / "changed.txt")
+    write_json(same, {"value": 1})
+    write_json(changed, {"value": 1})
+
+    reader = MetadataReader(workers=0, cache_file=cache_file)
+    reader.read([same, changed])
+    reader.save_cache()
+
+    write_json(changed, {"value": 22})
+    os.utime(changed, ns=(0, 0))
+    reader = MetadataReader(workers=0, cache_file=cache_file)
+    # same size and modification time, so the cached metadata is used
+    mtime, size = reader.cache[same][:2]
+    with open(same, "w") as f:
+        f.write("x" * size)
+    os.utime(same, ns=(mtime, mtime))
+    metadata = reader.read([same, changed])
+
+    assert metadata[same] == {"value": 1}
+    assert metadata[changed] == {"value": 22}
+
+
+def test_scan_files(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ["a.txt", "b.cptv", "sub/c.txt"]:
+        (tmp_path / name).write_text("{}")
+    match = lambda name: name.endswith(".txt")
+
+    found = sorted(entry.name for entry in scan_files(str(tmp_path), match))
+    assert found == ["a.txt", "c.txt"]
+    found = [entry.name for entry in scan_files(str(tmp_path), match, False)]
+    assert found == ["a.txt"]
@@ -0,0 +1,63 @@
+from ml_tools.mpeg_creator import (
+    PRESETS,
+    AVCreator,
+    MPEGCreator,
+    create_encoder,
+    get_ffmpeg_command,
+    purge_outputs,
+)
+
+
+class TestMPEGCreator:
+    def test_default_command(self):
+        command = get_ffmpeg_command("out.mp4", 640, 480)
+        codec = command[command.index("-an") + 1 : -1]
+        assert codec == [
+            "-vcodec",
+            "libx264",
+            "-tune",
+            "grain",
+            "-crf",
+            "21",
+            "-pix_fmt",
+            "yuv420p",
+        ]
+        assert command[-1] == "out.mp4"
+
+    def test_presets(self):
+        for name, preset in PRESETS.items():
+            creator = create_encoder("previews/clip-preview.mp4", name)
+            assert isinstance(creator, MPEGCreator)
+            assert creator.filename.endswith(preset.extension)
+            command = get_ffmpeg_command(creator.filename, 640, 480, 30, name)
+            assert command[command.index("-an") + 2] == preset.codec
+            if preset.quality_option:
+                assert "30" in command
+        assert create_encoder("clip.mp4", "png").filename == "clip/%06d.png"
+
+    def test_pyav_fallback(self):
+        try:
+            import av
+
+            expected = AVCreator
+        except ImportError:
+            expected = MPEGCreator
+        assert isinstance(create_encoder("clip.mp4", encoder="pyav"), expected)
+        # PyAV isn't used for image sequences
+        assert isinstance(
+            create_encoder("clip.mp4", "png", encoder="pyav"), MPEGCreator
+        )
+
+    def test_purge_outputs(self, tmp_path):
+        for name in ["clip-preview.mp4", "clip-preview-1.mp4", "clip.avi", "other.mp4"]:
+            (tmp_path / name).touch()
+        (tmp_path / "clip-preview").mkdir()
+        (tmp_path / "clip-preview" / "000001.png").touch()
+
+        purge_outputs(str(tmp_path), "clip*.mp4")
+        remaining = sorted(path.name for path in tmp_path.iterdir())
+        assert remaining == ["clip-preview", "clip.avi", "other.mp4"]
+
+        purge_outputs(str(tmp_path), "clip*.mp4", "mjpeg")
+        purge_outputs(str(tmp_path), "clip*.mp4", "png")
+        assert [path.name for path in tmp_path.iterdir()] == ["other.mp4"]
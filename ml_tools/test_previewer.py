@@ -0,0 +1,115 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from config.config import Config
+from ml_tools.frame import Frame
+from load.clip import ClipStats
+from ml_tools.previewer import Previewer, ordered_map
+from track.framebuffer import FrameBuffer
+from track.region import Region
+
+
+def make_clip(frames=3):
+    rng = np.random.RandomState(0)
+    buffer = []
+    for frame_number in range(frames):
+        thermal = rng.randint(2900, 3500, (120, 160)).astype(np.float32)
+        buffer.append(
+            Frame(thermal, thermal - 2900, np.zeros((120, 160)), frame_number)
+        )
+    stats = SimpleNamespace(min_temp=2900, max_temp=3500)
+    return SimpleNamespace(stats=stats, tracks=[], frame_buffer=buffer)
+
+
+class TestPreviewer:
+    def test_ordered_map(self):
+        lock = threading.Lock()
+        running = 0
+        most_running = 0
+
+        def work(i):
+            nonlocal running, most_running
+            with lock:
+                running += 1
+                most_running = max(most_running, running)
+            time.sleep(np.random.uniform(0, 0.005))
+            with lock:
+                running -= 1
+            return i
+
+        assert list(ordered_map(work, range(50), 4, ahead=2)) == list(range(50))
+        assert most_running <= 4
+        assert list(ordered_map(work, range(5), 0)) == list(range(5))
+
+    @pytest.mark.parametrize(
+        "preview_type, size",
+        [
+            (Previewer.PREVIEW_RAW, (120, 160)),
+            (Previewer.PREVIEW_TRACKING, (720, 960)),
+            (Previewer.PREVIEW_BOXES, (480, 640)),
+            (Previewer.PREVIEW_CLASSIFIED, (480, 640)),
+        ],
+    )
+    def test_render_frame(self, preview_type, size):
+        clip = make_clip()
+        previewer = Previewer(Config.get_defaults(), preview_type, render_threads=2)
+        images = list(
+            ordered_map(
+                lambda item: previewer.render_frame(clip, *item),
+                enumerate(clip.frame_buffer),
+                previewer.render_threads,
+            )
+        )
+        assert len(images) == len(clip.frame_buffer)
+        for frame_number, (image, frame) in enumerate(zip(images, clip.frame_buffer)):
+            assert image.shape == (*size, 3)
+            assert image.dtype == np.uint8
+            assert np.array_equal(
+                image, previewer.render_frame(clip, frame_number, frame)
+            )
+
+    def test_frame_buffer_streams_temp_range(self):
+        clip = make_clip(5)
+        frame_buffer = FrameBuffer(None, False, False, False, True)
+        for frame in clip.frame_buffer:
+            frame_buffer.add_frame(frame.thermal, frame.filtered, frame.mask, 0)
+        stats = ClipStats()
+        for frame in frame_buffer:
+            stats.update_temp_range(frame.thermal)
+        thermals = [frame.thermal for frame in clip.frame_buffer]
+        assert stats.min_temp == np.amin(thermals)
+        assert stats.max_temp == np.amax(thermals)
+        # the buffer can be read again for rendering
+        assert len(list(frame_buffer)) == 5
+
+    def test_render_track_frames(self):
+        clip = make_clip(6)
+        clip.tracks = [
+            SimpleNamespace(
+                bounds_history=[
+                    Region(10, 10, 20, 15, frame_number=i) for i in range(1, 4)
+                ]
+            ),
+            SimpleNamespace(
+                bounds_history=[
+                    Region(40, 30, 8, 8, frame_number=i) for i in range(2, 5)
+                ]
+            ),
+        ]
+        previewer = Previewer(Config.get_defaults(), Previewer.PREVIEW_RAW, 2)
+        rendered = list(previewer.render_track_frames(clip))
+        assert [frame_number for frame_number, _ in rendered] == list(range(5))
+        assert [[id for id, _ in images] for _, images in rendered] == [
+            [],
+            [0],
+            [0, 1],
+            [0, 1],
+            [1],
+        ]
+        for _, images in rendered:
+            for _, image in images:
+                assert image.shape == (192, 192, 3)
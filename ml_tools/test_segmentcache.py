@@ -0,0 +1,60 @@
+import h5py
+import numpy as np
+
+from ml_tools.preprocess import augment_segment
+from ml_tools.segmentcache import SegmentCache
+from ml_tools.test_dataset import make_loader_dataset, make_track_db
+from ml_tools.trackdatabase import TrackDatabase
+
+
+def add_track_frames(filename, seed=0):
+    rng = np.random.RandomState(seed)
+    with h5py.File(filename, "a") as f:
+        for clip in f["clips"].values():
+            for track in clip.values():
+                for frame_number in range(track.attrs["frames"]):
+                    frame = rng.randint(0, 500, (5, 10, 10)).astype(np.int16)
+                    # optical flow is stored clipped
+                    frame[2:4] -= 250
+                    frame[4] = frame[4] > 200
+                    track.create_dataset(str(frame_number), data=frame)
+
+
+class TestSegmentCache:
+    def test_cached_segments_match(self, tmp_path):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_track_db(filename)
+        add_track_frames(filename)
+        db = TrackDatabase(filename)
+        dataset = make_loader_dataset(db)
+        dataset.load_tracks()
+        cache_filename = str(tmp_path / "cache.hdf5")
+        cache = SegmentCache(cache_filename)
+        tracks = dataset.tracks[:5]
+        assert cache.build(db, tracks) == len(tracks)
+        assert cache.build(db, tracks) == 0
+
+        segments = [segment for track in tracks for segment in track.segments]
+        assert segments
+        expected = [dataset.fetch_segment(segment) for segment in segments]
+        dataset.use_segment_cache(cache_filename)
+        for segment, data in zip(segments, expected):
+            cached = dataset.fetch_segment(segment)
+            assert cached.shape == data.shape
+            assert np.allclose(cached, data, rtol=1e-3, atol=0.1)
+        assert not dataset.segment_cache.has_track(
+            dataset.tracks[-1].clip_id, dataset.tracks[-1].track_id
+        )
+
+        # a cache built with other parameters is kept separately
+        other = SegmentCache(cache_filename, frame_size=32)
+        assert not other.has_track(tracks[0].clip_id, tracks[0].track_id)
+
+    def test_augment_segment(self):
+        data = np.random.RandomState(0).uniform(0, 255, (27, 5, 48, 48))
+        augmented = augment_segment(data, np.random.default_rng(1))
+        assert augmented.shape == data.shape
+        assert not np.array_equal(augmented, data)
+        assert np.array_equal(
+            augmented, augment_segment(data, np.random.default_rng(1))
+        )
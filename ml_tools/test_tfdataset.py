@@ -0,0 +1,72 @@
+import h5py
+import numpy as np
+import pytest
+
+from ml_tools.kerasmodel import KerasModel
+from ml_tools.test_dataset import LABELS, make_loader_dataset, make_track_db
+from ml_tools.test_segmentcache import add_track_frames
+from ml_tools.tfdataset import SampleLoader, get_dataset
+from ml_tools.trackdatabase import TrackDatabase
+
+
+def add_thermal_frames(filename):
+    """Adds track frames with thermal around the clips frame_temp_median"""
+    add_track_frames(filename)
+    with h5py.File(filename, "a") as f:
+        for clip in f["clips"].values():
+            for track in clip.values():
+                for frames in track.values():
+                    frame = frames[()]
+                    frame[0] += 2800
+                    frames[...] = frame
+
+
+def make_model(use_movement):
+    model = KerasModel()
+    model.labels = LABELS
+    model.frame_size = 32
+    model.use_movement = use_movement
+    model.square_width = 3 if use_movement else 1
+    return model
+
+
+class TestTFDataset:
+    @pytest.mark.parametrize("use_movement", [True, False])
+    def test_batches(self, tmp_path, use_movement):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_track_db(filename)
+        add_thermal_frames(filename)
+        model = make_model(use_movement)
+
+        batches = []
+        for _ in range(2):
+            dataset = make_loader_dataset(TrackDatabase(filename))
+            dataset.load_tracks(seed=1)
+            dataset.set_seed(4)
+            tf_dataset = get_dataset(
+                model, dataset, 5, augment=True, epoch_size=12, deterministic=True
+            )
+            batches.append(list(tf_dataset.as_numpy_iterator()))
+
+        size = model.frame_size * model.square_width
+        first, second = batches
+        assert [len(y) for _, y in first] == [5, 5, 2]
+        for (x, y), (x2, y2) in zip(first, second):
+            assert x.shape[1:] == (size, size, 3)
+            assert np.array_equal(y.sum(axis=1), np.ones(len(y)))
+            assert np.array_equal(x, x2)
+            assert np.array_equal(y, y2)
+
+    def test_unweighted_epoch_repeats(self, tmp_path):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_track_db(filename)
+        dataset = make_loader_dataset(TrackDatabase(filename))
+        dataset.load_tracks(seed=1)
+        loader = SampleLoader(make_model(False), dataset)
+
+        size = len(loader.samples) + 3
+        indices = np.concatenate(
+            [block for block, _ in loader.epoch(size, weighted=False)]
+        )
+        assert len(indices) == size
+        assert list(indices[-3:]) == [0, 1, 2]
@@ -0,0 +1,20 @@
+import numpy as np
+
+from ml_tools import tools
+
+
+class TestTools:
+    def test_heat_to_rgb_matches_colourmap(self):
+        colourmap = tools.load_colourmap(tools.resource_path("colourmap.dat"))
+        lut = tools.colourmap_lut(colourmap)
+        frame = np.random.RandomState(0).randint(2500, 4500, (120, 160))
+        float_frame = np.float32(frame)
+        for temp_min, temp_max in [(2800, 4200), (3000.5, 3900.3)]:
+            normalised = (np.float32(frame) - temp_min) / (temp_max - temp_min)
+            expected = np.uint8(255.0 * colourmap(normalised))[:, :, :3]
+            assert np.array_equal(
+                tools.heat_to_rgb(frame, lut, temp_min, temp_max), expected
+            )
+            # float32 frames are not changed in place
+            tools.heat_to_rgb(float_frame, lut, temp_min, temp_max)
+            assert np.array_equal(float_frame, frame)
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import pytest
+
+from ml_tools.trackdatabase import TrackDatabase
+
+FRAMES = 12
+
+
+def make_frames_db(filename, opts):
+    rng = np.random.RandomState(0)
+    with h5py.File(filename, "w") as f:
+        track = f.create_group("clips").create_group("1").create_group("0")
+        track.attrs["frames"] = FRAMES
+        track.attrs["bounds_history"] = [[i, 5, i + 7, 14] for i in range(FRAMES)]
+        cropped = track.create_group("cropped")
+        for frame_number in range(FRAMES):
+            # frames vary in size like track crops do
+            shape = (5, 9, 7 + frame_number % 3)
+            frame_opts = dict(opts)
+            if frame_opts.get("chunks") == "channel":
+                # as written by add_track
+                frame_opts["chunks"] = (1, *shape[1:])
+            cropped.create_dataset(
+                str(frame_number),
+                data=rng.randint(-500, 5000, shape).astype(np.int16),
+                **frame_opts,
+            )
+
+
+class TestTrackDatabase:
+    @pytest.mark.parametrize(
+        "opts",
+        [
+            {},
+            {"chunks": "channel"},
+            {"chunks": (1, 4, 4)},
+            {"compression": "gzip"},
+            {"compression": "gzip", "chunks": "channel"},
+            {"compression": "gzip", "shuffle": True, "chunks": "channel"},
+            {"compression": "lzf", "chunks": "channel"},
+        ],
+    )
+    def test_read_only_matches(self, tmp_path, opts):
+        filename = str(tmp_path / "dataset.hdf5")
+        make_frames_db(filename, opts)
+        expected = TrackDatabase(filename).get_track("1", 0)
+        db = TrackDatabase(filename, read_only=True)
+        with ThreadPoolExecutor(4) as pool:
+            tracks = list(
+                pool.map(lambda i: db.get_track("1", 0, i, FRAMES), range(FRAMES))
+            )
+        for start, frames in enumerate(tracks):
+            assert len(frames) == FRAMES - start
+            for frame, expected_frame in zip(frames, expected[start:]):
+                assert frame.frame_number == expected_frame.frame_number
+                assert np.array_equal(frame.thermal, expected_frame.thermal)
+                assert np.array_equal(frame.mask, expected_frame.mask)
+                assert np.array_equal(frame.flow, expected_frame.flow)
@@ -0,0 +1,218 @@
+"""
+tf.data input pipeline feeding Dataset samples to KerasModel training.
+
+Blocks of weighted sample indices are read from the track database by
+interleaved parallel readers, the raw frames are preprocessed by a parallel map
+and the results are batched and prefetched, so reading, preprocessing and
+training overlap.  tf.data autotunes the parallelism of each stage.
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from ml_tools.frame import Frame
+from ml_tools.preprocess import preprocess_frame, preprocess_movement
+from track.region import Region
+
+# number of samples each interleaved reader reads in turn
+READ_BLOCK_SIZE = 8
+
+
+def frame_array(frame):
+    """Returns the channels of a frame in TrackChannels order, as Frame.from_array expects"""
+    flow_h, flow_v = frame.flow_h, frame.flow_v
+    if flow_h is None:
+        flow_h = flow_v = np.zeros(frame.thermal.shape)
+    return np.float32([frame.thermal, frame.filtered, flow_h, flow_v, frame.mask])
+
+
+class SampleLoader:
+    """
+    Reads samples of a Dataset and preprocesses them into inputs for a KerasModel.
+    Movement models use segments, frame models use frame samples.
+    """
+
+    def __init__(self, model, dataset, augment=False):
+        self.model = model
+        self.dataset = dataset
+        self.augment = augment
+        if model.use_movement:
+            self.samples = dataset.segments
+            self.weights = dataset.get_segment_weights()
+            size = model.frame_size * model.square_width
+        else:
+            self.samples = dataset.frame_samples
+            self.weights = dataset.get_frame_weights()
+            size = model.frame_size
+        self.output_shape = (size, size, 3)
+        self.labels = {label: i for i, label in enumerate(model.labels)}
+        if dataset.label_mapping:
+            for label, mapped in dataset.label_mapping.items():
+                if mapped in self.labels:
+                    self.labels[label] = self.labels[mapped]
+
+    def epoch(self, size=None, weighted=True):
+        """
+        Yields blocks of (sample indices, augmentation seeds) for one epoch
+        :param size: number of samples, defaults to all samples
+        :param weighted: samples by weight, otherwise every sample is used in order,
+            repeating from the start if size is more than the number of samples
+        """
+        rng = self.dataset.rng
+        if size is None:
+            size = len(self.samples)
+        if weighted:
+            indices = self.weights.sample(size, rng=rng)
+        else:
+            indices = np.arange(size) % len(self.samples)
+        seeds = rng.integers(np.iinfo(np.int64).max, size=len(indices))
+        for start in range(0, len(indices), READ_BLOCK_SIZE):
+            yield indices[start : start + READ_BLOCK_SIZE], seeds[
+                start : start + READ_BLOCK_SIZE
+            ]
+
+    def frame_numbers(self, sample):
+        if not self.model.use_movement:
+            return [sample.frame_num]
+        frame_numbers = sample.frame_indices
+        if frame_numbers is None:
+            frame_numbers = range(sample.start_frame, sample.end_frame)
+        return list(frame_numbers[: self.model.square_width ** 2])
+
+    def read(self, index):
+        """
+        Reads the raw frames of a sample as flat arrays so they can pass through tf.data
+        :return: pixels, frame shapes, frame bounds, reference levels, label index
+        """
+        sample = self.samples[index]
+        frame_numbers = self.frame_numbers(sample)
+        frames = self.dataset.db.get_track(
+            sample.clip_id, sample.track_id, frame_numbers=frame_numbers
+        )
+        arrays = [frame_array(frame) for frame in frames]
+        return (
+            np.concatenate([array.ravel() for array in arrays]),
+            np.int32([array.shape for array in arrays]),
+            np.int32(
+                [
+                    [region.left, region.top, region.right, region.bottom]
+                    for region in (frame.region for frame in frames)
+                ]
+            ),
+            np.float32(np.asarray(sample.track.frame_temp_median)[frame_numbers]),
+            np.int32(self.labels[sample.label]),
+        )
+
+    def preprocess(self, pixels, shapes, bounds, reference, seed):
+        """
+        Preprocesses the frames from read into a model input
+        :return: input of output_shape, and False if the sample couldn't be used
+        """
+        frames = []
+        offset = 0
+        for i, shape in enumerate(shapes):
+            size = np.prod(shape)
+            frame = Frame.from_array(
+                pixels[offset : offset + size].reshape(shape),
+                i,
+                flow_clipped=True,
+                region=Region.region_from_array(bounds[i]),
+            )
+            frames.append(frame)
+            offset += size
+
+        rng = np.random.default_rng(seed)
+        model = self.model
+        if model.use_movement:
+            data = preprocess_movement(
+                frames,
+                [frame.copy() for frame in frames],
+                model.square_width,
+                model.frame_size,
+                [frame.region for frame in frames],
+                model.red_type,
+                model.green_type,
+                model.blue_type,
+                model.preprocess_fn,
+                augment=self.augment,
+                keep_aspect=model.params.get("keep_aspect", False),
+                reference_level=reference
+                if model.params.get("subtract_median", True)
+                else None,
+                keep_edge=model.params.get("keep_edge", False),
+                rng=rng,
+            )
+        else:
+            data = preprocess_frame(
+                frames[0],
+                self.output_shape,
+                model.params.get("use_thermal", True),
+                augment=self.augment,
+                preprocess_fn=model.preprocess_fn,
+            )
+        if data is None:
+            return np.zeros(self.output_shape, np.float32), False
+        return np.float32(data), True
+
+    def read_tensors(self, index, seed):
+        pixels, shapes, bounds, reference, label = tf.numpy_function(
+            self.read,
+            [index],
+            [tf.float32, tf.int32, tf.int32, tf.float32, tf.int32],
+        )
+        label.set_shape(())
+        return pixels, shapes, bounds, reference, seed, label
+
+    def preprocess_tensors(self, pixels, shapes, bounds, reference, seed, label):
+        data, valid = tf.numpy_function(
+            self.preprocess,
+            [pixels, shapes, bounds, reference, seed],
+            [tf.float32, tf.bool],
+        )
+        data.set_shape(self.output_shape)
+        valid.set_shape(())
+        return data, valid, label
+
+
+def get_dataset(
+    model,
+    dataset,
+    batch_size,
+    augment=False,
+    epoch_size=None,
+    weighted=True,
+    deterministic=False,
+):
+    """
+    Returns a tf.data.Dataset of (inputs, one hot labels) batches for model
+    :param epoch_size: samples per epoch, each epoch is sampled again
+    :param weighted: sample by segment / frame weight, otherwise use every sample once
+    :param deterministic: keep sample order fixed, with a seeded dataset batches are reproducible
+    """
+    loader = SampleLoader(model, dataset, augment)
+    num_labels = len(model.labels)
+    blocks = tf.data.Dataset.from_generator(
+        lambda: loader.epoch(epoch_size, weighted),
+        output_signature=(
+            tf.TensorSpec(shape=(None,), dtype=tf.int64),
+            tf.TensorSpec(shape=(None,), dtype=tf.int64),
+        ),
+    )
+    samples = blocks.interleave(
+        lambda indices, seeds: tf.data.Dataset.from_tensor_slices((indices, seeds)).map(
+            loader.read_tensors
+        ),
+        cycle_length=tf.data.AUTOTUNE,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic,
+    )
+    samples = samples.map(
+        loader.preprocess_tensors,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic,
+    )
+    samples = samples.filter(lambda data, valid, label: valid)
+    samples = samples.map(
+        lambda data, valid, label: (data, tf.one_hot(label, num_labels))
+    )
+    return samples.batch(batch_size).prefetch(tf.data.AUTOTUNE)
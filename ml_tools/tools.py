@@ -7,9 +7,7 @@ import numpy as np
 import random
 import pickle
 import math
-import matplotlib.pyplot as plt
 import logging
-from sklearn import metrics
 import json
 import dateutil
 import binascii
@@ -17,8 +15,6 @@ import datetime
 import glob
 import cv2
 import timezonefinder
-from matplotlib.colors import LinearSegmentedColormap
-import subprocess
 from PIL import ImageFont, ImageDraw, Image
 from pathlib import Path
 
@@ -193,135 +189,30 @@ def find_file_from_cmd_line(root, cmd_line_input):
     return None
 
 
-def get_ffmpeg_command(filename, width, height, quality=21):
-    if os.name == "nt":
-        FFMPEG_BIN = "ffmpeg.exe"  # on Windows
-    else:
-        FFMPEG_BIN = "ffmpeg"  # on Linux ans Mac OS
-
-    command = [
-        FFMPEG_BIN,
-        "-y",  # (optional) overwrite output file if it exists
-        "-f",
-        "rawvideo",
-        "-vcodec",
-        "rawvideo",
-        "-loglevel",
-        "error",  # no output
-        "-s",
-        str(width) + "x" + str(height),  # size of one frame
-        "-pix_fmt",
-        "rgb24",
-        "-r",
-        "9",  # frames per second
-        "-i",
-        "-",  # The imput comes from a pipe
-        "-an",  # Tells FFMPEG not to expect any audio
-        "-vcodec",
-        "libx264",
-        "-tune",
-        "grain",  # good for keepinn the grain in our videos
-        "-crf",
-        str(quality),  # quality, lower is better
-        "-pix_fmt",
-        "yuv420p",  # window thumbnails require yuv420p for some reason
-        filename,
-    ]
-    return command
-
-
-def stream_mpeg(filename, frame_generator):
-    """
-    Saves a
-    Saves a sequence of rgb image frames as an MPEG video.
-    :param filename: output filename
-    :param frame_generator: generator that produces numpy array of shape [height, width, 3] of type uint8
-    """
-
-    first_frame = next(frame_generator)
-    height, width, channels = first_frame.shape
-
-    command = get_ffmpeg_command(filename, width, height)
-
-    # write out the data.
-
-    # note:
-    # I don't consume stdout here, so if ffmpeg writes to stdout it will eventually fill up the buffer and cause
-    # ffmpeg to pause.  Because of this I have set ffmpeg into a quiet mode (the issue is that stats are peroidically
-    # printed.  Unfortunately I was not able to figure out how to consume stdout without blocking if there is no input.
-
-    process = None
-    try:
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=4096,
-        )
-
-        for frame in frame_generator:
-            data = frame.tobytes()
-            process.stdin.write(data)
-            process.stdin.flush()
+def load_colourmap(filename):
+    with open(filename, "rb") as f:
+        return pickle.load(f)
 
-        process.stdin.close()
-        process.stderr.close()
 
-        return_code = process.wait(timeout=30)
-        if return_code != 0:
-            raise Exception(
-                "FFMPEG failed with error {}. Have you installed ffmpeg and added it to your path?".format(
-                    return_code
-                )
-            )
-    except Exception as e:
-        logging.error(
-            "Failed to write MPEG: %s.  Have you installed ffmpeg and added it to your path?",
-            e,
-        )
-        if process is not None:
-            logging.error(process.stderr.read())
+def colourmap_lut(colormap):
+    """Returns the colours of a matplotlib colormap as a [N, 3] uint8 lookup table"""
+    return np.uint8(255.0 * colormap(np.arange(colormap.N)))[:, :3]
 
 
-def write_mpeg(filename, frames):
+def heat_to_rgb(frame, lut, temp_min=2800, temp_max=4200):
     """
-    Saves a sequence of rgb image frames as an MPEG video.
-    :param filename: output filename
-    :param frames: numpy array of shape [frame, height, width, 3] of type uint8
+    Colourises a frame of heat values with a lookup table from colourmap_lut,
+    indexing it the same way the colormap would.
+    :return: a uint8 array of shape [height, width, 3]
     """
-
-    # we may have passed a list of frames, if so convert to a 3d array.
-    frames = np.asarray(frames, np.uint8)
-
-    if frames is None or len(frames) == 0:
-        # empty video
-        return
-
-    _, height, width, _ = frames.shape
-
-    command = get_ffmpeg_command(filename, width, height)
-
-    # write out the data.
-    process = None
-    try:
-        process = subprocess.run(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            input=frames.tostring(),
-        )
-        process.check_returncode()
-    except Exception as e:
-        logging.error("Failed to write MPEG: %s", e)
-        if process is not None:
-            logging.info("out:  %s", process.stdout.decode("ascii"))
-            logging.info("error: %s", process.stderr.decode("ascii"))
-
-
-def load_colourmap(filename):
-    with open(filename, "rb") as f:
-        return pickle.load(f)
+    size = len(lut)
+    index = np.array(frame, dtype=np.float32)
+    index -= temp_min
+    if temp_max > temp_min:
+        index /= temp_max - temp_min
+    index *= size
+    np.clip(index, 0, size - 1, out=index)
+    return np.take(lut, index.astype(np.uint16), axis=0)
 
 
 def convert_heat_to_img(frame, colormap, temp_min=2800, temp_max=4200):
@@ -331,15 +222,11 @@ def convert_heat_to_img(frame, colormap, temp_min=2800, temp_max=4200):
     :param colormap: an optional colormap to use, if none is provided then tracker.colormap is used.
     :return: a pillow Image containing a colorised heatmap
     """
-    # normalise
     if colormap is None:
         colormap = _load_colourmap(None)
-
-    frame = np.float32(frame)
-    frame = (frame - temp_min) / (temp_max - temp_min)
-    colorized = np.uint8(255.0 * colormap(frame))
-    img = Image.fromarray(colorized[:, :, :3])  # ignore alpha
-    return img
+    return Image.fromarray(
+        heat_to_rgb(frame, colourmap_lut(colormap), temp_min, temp_max)
+    )
 
 
 def most_common(lst):
@@ -382,8 +269,13 @@ def load_clip_metadata(filename):
         # add in some metadata stats
         meta = json.load(t)
 
-    meta["recordingDateTime"] = dateutil.parser.parse(meta["recordingDateTime"])
+    return parse_clip_metadata(meta)
+
 
+def parse_clip_metadata(meta):
+    """Returns a copy of loaded clip metadata with its recording time parsed"""
+    meta = dict(meta)
+    meta["recordingDateTime"] = dateutil.parser.parse(meta["recordingDateTime"])
     return meta
 
 
@@ -450,11 +342,11 @@ def to_CHW(data):
     return np.transpose(data, axes=(2, 0, 1))
 
 
-def random_log(a, b):
+def random_log(a, b, rng=random):
     """Returns a random number between a and b, but on a log scale"""
     a = math.log(a)
     b = math.log(b)
-    x = random.random() * (b - a) + a
+    x = rng.random() * (b - a) + a
     return math.exp(x)
 
 
@@ -672,6 +564,8 @@ def classify_segment(model, segment, verbose=False):
     if verbose:
         logging.info("%d %d", image.min(), image.max())
         logging.info("%r", prediction)
+        import matplotlib.pyplot as plt
+
         plt.imshow(image, aspect="auto", vmin=0, vmax=1.0)
         plt.show()
     # divide by temperature to smooth out confidence (i.e. decrease confidence when there are competing categories)
@@ -708,6 +602,7 @@ def product(numbers):
 
 def get_confusion_matrix(pred_class, true_class, classes, normalize=True):
     """get a confusion matrix figure from list of results with optional normalisation."""
+    from sklearn import metrics
 
     cm = metrics.confusion_matrix(
         [classes[class_num] for class_num in pred_class],
@@ -731,7 +626,12 @@ color_dict = {
     "green": ((0.0, 1.0, 1.0), (0.5, 0.0, 0.0), (1.0, 0.5, 0.8)),
     "blue": ((0.0, 0.3, 0.3), (0.5, 0.0, 0.0), (1.0, 0.1, 0.1)),
 }
-cm_blue_red = LinearSegmentedColormap("BlueRed2", color_dict)
+
+
+def blue_red_colormap():
+    from matplotlib.colors import LinearSegmentedColormap
+
+    return LinearSegmentedColormap("BlueRed2", color_dict)
 
 
 def calculate_mass(filtered, threshold):
@@ -13,6 +13,8 @@ import logging
 import filelock
 import datetime
 import json
+import threading
+import zlib
 from dateutil.parser import parse as parse_date
 
 from multiprocessing import Lock
@@ -22,6 +24,11 @@ from track.region import Region
 
 special_datasets = ["background_frame", "predictions", "overlay"]
 
+# hdf5 filter ids that chunks can be decoded from without going through h5py
+H5Z_FILTER_DEFLATE = 1
+H5Z_FILTER_SHUFFLE = 2
+H5Z_FILTER_BLOSC = 32001
+
 
 class HDF5Manager:
     """Class to handle locking of HDF5 files."""
@@ -50,13 +57,20 @@ class HDF5Manager:
 
 
 class TrackDatabase:
-    def __init__(self, database_filename):
+    def __init__(self, database_filename, read_only=False):
         """
         Initialises given database.  If database does not exist an empty one is created.
         :param database_filename: filename of database
+        :param read_only: if true track frames are read through a shared read only handle
+            without the file lock, so reads from multiple threads can overlap.  Only use
+            when nothing is writing to the database.
         """
 
         self.database = database_filename
+        self.read_only = read_only
+        self.read_file = None
+        self.read_pid = None
+        self.read_lock = threading.Lock()
 
         if not os.path.exists(database_filename):
             logging.info("Creating new database %s", database_filename)
@@ -64,6 +78,25 @@ class TrackDatabase:
             f.create_group("clips")
             f.close()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["read_file"] = None
+        state["read_pid"] = None
+        del state["read_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.read_lock = threading.Lock()
+
+    def get_read_file(self):
+        """Returns the read only handle for this process, hdf5 handles don't survive a fork"""
+        with self.read_lock:
+            if self.read_file is None or self.read_pid != os.getpid():
+                self.read_file = h5py.File(self.database, "r")
+                self.read_pid = os.getpid()
+            return self.read_file
+
     def has_clip(self, clip_id):
         """
         Returns if database contains track information for given clip
@@ -224,6 +257,34 @@ class TrackDatabase:
             result["id"] = track_number
         return result
 
+    def get_tracks_meta(self, track_ids):
+        """
+        Gets clip metadata, track metadata and predictions for many tracks in one read
+        :param track_ids: list of clip_id, track_number pairs
+        :return: list of (clip_id, track_number, clip_meta, track_meta, predictions)
+        """
+        result = []
+        clips_meta = {}
+        with HDF5Manager(self.database) as f:
+            clips = f["clips"]
+            for clip_id, track_number in track_ids:
+                clip = clips[str(clip_id)]
+                clip_meta = clips_meta.get(clip_id)
+                if clip_meta is None:
+                    clip_meta = hdf5_attributes_dictionary(clip)
+                    clip_meta["tracks"] = len(clip)
+                    clips_meta[clip_id] = clip_meta
+                track = clip[str(track_number)]
+                track_meta = hdf5_attributes_dictionary(track)
+                track_meta["id"] = track_number
+                predictions = None
+                if "predictions" in track:
+                    predictions = track["predictions"][:]
+                result.append(
+                    (clip_id, track_number, clip_meta, track_meta, predictions)
+                )
+        return result
+
     def get_track_predictions(self, clip_id, track_number):
         """
         Gets metadata for given track
@@ -303,36 +364,65 @@ class TrackDatabase:
         :param end_frame: last frame of slice to return (exclusive).
         :return: a list of numpy arrays of shape [channels, height, width] and of type np.int16
         """
+        if self.read_only:
+            return self._read_track(
+                self.get_read_file(),
+                clip_id,
+                track_number,
+                start_frame,
+                end_frame,
+                original,
+                frame_numbers,
+            )
         with HDF5Manager(self.database) as f:
-            clips = f["clips"]
-            track_node = clips[str(clip_id)][str(track_number)]
-            bounds = track_node.attrs["bounds_history"]
-            if start_frame is None:
-                start_frame = 0
-            if end_frame is None:
-                end_frame = track_node.attrs["frames"]
-
-            result = []
-            if original:
-                track_node = track_node["original"]
-            else:
-                if "cropped" in track_node:
-                    track_node = track_node["cropped"]
-
-            if frame_numbers is None:
-                frame_iter = range(start_frame, end_frame)
+            return self._read_track(
+                f,
+                clip_id,
+                track_number,
+                start_frame,
+                end_frame,
+                original,
+                frame_numbers,
+            )
+
+    def _read_track(
+        self, f, clip_id, track_number, start_frame, end_frame, original, frame_numbers
+    ):
+        clips = f["clips"]
+        track_node = clips[str(clip_id)][str(track_number)]
+        bounds = track_node.attrs["bounds_history"]
+        if start_frame is None:
+            start_frame = 0
+        if end_frame is None:
+            end_frame = track_node.attrs["frames"]
+
+        result = []
+        if original:
+            track_node = track_node["original"]
+        else:
+            if "cropped" in track_node:
+                track_node = track_node["cropped"]
+
+        if frame_numbers is None:
+            frame_iter = range(start_frame, end_frame)
+        else:
+            frame_iter = iter(frame_numbers)
+
+        # every frame of a track is written with the same filters
+        filters = False
+        for frame_number in frame_iter:
+            node = track_node[str(frame_number)]
+            if self.read_only:
+                if filters is False:
+                    filters = chunk_filters(node)
+                frame = read_frame(node, filters, self.read_lock)
             else:
-                frame_iter = iter(frame_numbers)
-
-            for frame_number in frame_iter:
-                frame = track_node[str(frame_number)][:, :, :]
+                frame = node[()]
 
-                region = Region.region_from_array(bounds[frame_number])
-                result.append(
-                    Frame.from_array(
-                        frame, frame_number, flow_clipped=True, region=region
-                    )
-                )
+            region = Region.region_from_array(bounds[frame_number])
+            result.append(
+                Frame.from_array(frame, frame_number, flow_clipped=True, region=region)
+            )
         return result
 
     def remove_clip(self, clip_id):
@@ -520,3 +610,65 @@ def hdf5_attributes_dictionary(dataset):
     for key, value in dataset.attrs.items():
         result[key] = value
     return result
+
+
+def chunk_filters(node):
+    """
+    Returns the filters applied to chunks of node if they can all be reversed without
+    h5py, otherwise None
+    """
+    plist = node.id.get_create_plist()
+    filters = [plist.get_filter(i)[0] for i in range(plist.get_nfilters())]
+    for code in filters:
+        if code == H5Z_FILTER_BLOSC:
+            try:
+                import blosc
+            except ImportError:
+                return None
+        elif code not in (H5Z_FILTER_DEFLATE, H5Z_FILTER_SHUFFLE):
+            return None
+    return filters
+
+
+def read_frame(node, filters, lock):
+    """
+    Reads a frame node into a new array.  Frames written by add_track have a chunk
+    per channel, for these only the raw chunk bytes are read while holding lock and
+    they are decompressed outside of it.  zlib and blosc release the GIL while
+    decompressing so reads from several threads run in parallel.
+    """
+    shape = node.shape
+    out = np.empty(shape, node.dtype)
+    if filters is None or node.chunks != (1, *shape[1:]):
+        with lock:
+            node.read_direct(out)
+        return out
+    dsid = node.id
+    with lock:
+        raw = [dsid.read_direct_chunk((channel, 0, 0)) for channel in range(shape[0])]
+    if any(filter_mask for filter_mask, _ in raw):
+        # some filters were skipped for a chunk
+        with lock:
+            node.read_direct(out)
+        return out
+    chunks = [chunk for _, chunk in raw]
+    shuffled = False
+    for code in reversed(filters):
+        if code == H5Z_FILTER_DEFLATE:
+            chunks = [zlib.decompress(chunk) for chunk in chunks]
+        elif code == H5Z_FILTER_BLOSC:
+            import blosc
+
+            chunks = [blosc.decompress(chunk) for chunk in chunks]
+        else:
+            shuffled = True
+    data = np.frombuffer(b"".join(chunks), np.uint8)
+    if shuffled:
+        # the shuffle filter stores each byte of the values together
+        itemsize = out.dtype.itemsize
+        out.view(np.uint8).reshape(shape[0], -1, itemsize)[:] = data.reshape(
+            shape[0], itemsize, -1
+        ).transpose(0, 2, 1)
+    else:
+        out.view(np.uint8).reshape(-1)[:] = data
+    return out
@@ -1,6 +1,9 @@
 from datetime import datetime
 import logging
 import os
+import queue
+import threading
+import time
 import yaml
 
 from cptv import CPTVWriter
@@ -9,13 +12,20 @@ CPTV_TEMP_EXT = ".cptv.temp"
 
 
 class CPTVRecorder:
+    """
+    Records frames to CPTV files, compression and disk writes happen on a writer
+    thread fed by a bounded queue so slow disks don't hold up frame processing
+    """
+
+    # how many seconds of frames can be waiting to be written
+    MAX_QUEUED_SECS = 10
+
     def __init__(self, thermal_config, headers):
         self.location_config = thermal_config.location
         self.device_config = thermal_config.device
         self.output_dir = thermal_config.recorder.output_dir
         self.motion_config = thermal_config.motion
         self.preview_secs = thermal_config.recorder.preview_secs
-        self.writer = None
         self.filename = None
         self.recording = False
         self.frames = 0
@@ -24,19 +34,39 @@ class CPTVRecorder:
         self.max_frames = thermal_config.recorder.max_secs * headers.fps
         self.write_until = 0
 
+        # only used from the writer thread
+        self.writer = None
+        self.file = None
+
+        # back pressure metrics
+        self.max_queued = 0
+        self.queue_full_count = 0
+        self.blocked_secs = 0
+
+        self.write_queue = queue.Queue(
+            maxsize=(CPTVRecorder.MAX_QUEUED_SECS + self.preview_secs) * headers.fps
+        )
+        self.writer_thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+
     def force_stop(self):
-        if not self.recording:
-            return
+        if self.recording:
+            if self.has_minimum():
+                self.stop_recording()
+            else:
+                self.delete_recording()
+        self.flush()
 
-        if self.has_minimum():
-            self.stop_recording()
-        else:
-            self.delete_recording()
+    def flush(self):
+        """Blocks until all queued frames have been written"""
+        self.write_queue.join()
 
-    def process_frame(self, movement_detected, cptv_frame, temp_thresh):
+    def process_frame(
+        self, movement_detected, cptv_frame, temp_thresh, preview_frames=None
+    ):
         if movement_detected:
             self.write_until = self.frames + self.min_frames
-            self.write_frame(cptv_frame, temp_thresh)
+            self.write_frame(cptv_frame, temp_thresh, preview_frames)
         elif self.recording:
             if self.has_minimum():
                 self.stop_recording()
@@ -49,57 +79,122 @@ class CPTVRecorder:
     def has_minimum(self):
         return self.frames > self.write_until
 
-    def start_recording(self, temp_thresh):
+    def start_recording(self, temp_thresh, preview_frames=None):
+        """
+        Starts a new recording, any preview_frames (the frames before motion was detected)
+        are written first. They are not counted towards the min and max recording length
+        """
         self.frames = 0
+        self.max_queued = 0
+        self.queue_full_count = 0
+        self.blocked_secs = 0
         self.filename = new_temp_name()
         self.filename = os.path.join(self.output_dir, self.filename)
-        f = open(self.filename, "wb")
-        self.writer = CPTVWriter(f)
-        self.writer.timestamp = datetime.now()
-        self.writer.latitude = self.location_config.latitude
-        self.writer.longitude = self.location_config.longitude
-        self.writer.preview_secs = self.preview_secs
+
+        header = {
+            "timestamp": datetime.now(),
+            "latitude": self.location_config.latitude,
+            "longitude": self.location_config.longitude,
+            "preview_secs": self.preview_secs,
+        }
         default_thresh = self.motion_config.temp_thresh
         self.motion_config.temp_thresh = temp_thresh
-        self.writer.motion_config = yaml.dump(self.motion_config).encode()[:255]
+        header["motion_config"] = yaml.dump(self.motion_config).encode()[:255]
         self.motion_config.temp_thresh = default_thresh
 
         # add brand model fps etc to cptv when python-cptv supports
 
         if self.device_config.name:
-            self.writer.device_name = self.device_config.name.encode()
+            header["device_name"] = self.device_config.name.encode()
         if self.device_config.device_id:
-            self.writer.device_id = self.device_config.device_id
+            header["device_id"] = self.device_config.device_id
 
-        self.writer.write_header()
+        self._queue((self._open, self.filename, header))
+        if preview_frames:
+            for frame in preview_frames:
+                self._queue((self._write, frame))
         self.recording = True
-        logging.debug("recording started temp_thresh: %d", temp_thresh)
+        logging.debug(
+            "recording started temp_thresh: %d with %d preview frames",
+            temp_thresh,
+            len(preview_frames) if preview_frames else 0,
+        )
 
-    def write_frame(self, cptv_frame, temp_thresh):
-        if self.writer is None:
-            self.start_recording(temp_thresh)
-        self.writer.write_frame(cptv_frame)
+    def write_frame(self, cptv_frame, temp_thresh, preview_frames=None):
+        if not self.recording:
+            self.start_recording(temp_thresh, preview_frames)
+        self._queue((self._write, cptv_frame))
         self.frames += 1
 
     def stop_recording(self):
         self.recording = False
-        logging.debug("recording ended")
-        if self.writer is None:
+        logging.debug(
+            "recording ended max queued %d frames, queue full %d times blocking for %.2fs",
+            self.max_queued,
+            self.queue_full_count,
+            self.blocked_secs,
+        )
+        if self.filename is None:
             return
 
-        self.writer.close()
-        final_name = os.path.splitext(self.filename)[0]
-        os.rename(self.filename, final_name)
-        self.writer = None
+        self._queue((self._close, self.filename, True))
+        self.filename = None
 
     def delete_recording(self):
         self.recording = False
-        if self.writer is None:
+        if self.filename is None:
             return
 
+        self._queue((self._close, self.filename, False))
+        self.filename = None
+
+    def _queue(self, task):
+        try:
+            self.write_queue.put_nowait(task)
+        except queue.Full:
+            self.queue_full_count += 1
+            start = time.time()
+            self.write_queue.put(task)
+            self.blocked_secs += time.time() - start
+            logging.warning(
+                "cptv writer queue full, frame processing blocked for %.3fs",
+                time.time() - start,
+            )
+        self.max_queued = max(self.max_queued, self.write_queue.qsize())
+
+    def _write_loop(self):
+        while True:
+            task, *args = self.write_queue.get()
+            try:
+                task(*args)
+            except Exception:
+                logging.error("Error writing cptv", exc_info=True)
+            finally:
+                self.write_queue.task_done()
+
+    def _open(self, filename, header):
+        self.file = open(filename, "wb")
+        self.writer = CPTVWriter(self.file)
+        for key, value in header.items():
+            setattr(self.writer, key, value)
+        self.writer.write_header()
+
+    def _write(self, cptv_frame):
+        if self.writer is not None:
+            self.writer.write_frame(cptv_frame)
+
+    def _close(self, filename, keep):
+        if self.writer is None:
+            return
         self.writer.close()
-        os.remove(self.filename)
+        self.file.close()
         self.writer = None
+        self.file = None
+        if keep:
+            final_name = os.path.splitext(filename)[0]
+            os.rename(filename, final_name)
+        else:
+            os.remove(filename)
 
 
 def new_temp_name():
@@ -9,6 +9,8 @@ from .processor import Processor
 
 
 class SlidingWindow:
+    """Ring buffer of the most recent shape[0] frames."""
+
     def __init__(self, shape, dtype):
         self.lock = Lock()
         self.frames = np.empty(shape, dtype)
@@ -60,6 +62,13 @@ class SlidingWindow:
                 return self.frames[self.oldest_index]
             return None
 
+    @property
+    def count(self):
+        with self.lock:
+            if self.last_index is None:
+                return 0
+            return (self.last_index - self.oldest_index) % self.size + 1
+
     def add(self, frame):
         with self.lock:
             if self.last_index is None:
@@ -73,6 +82,11 @@ class SlidingWindow:
                 self.frames[new_index] = frame
                 self.last_index = new_index
 
+    def keep_last(self):
+        """Drops all frames except the most recent"""
+        with self.lock:
+            self.oldest_index = self.last_index
+
     def reset(self):
         with self.lock:
             self.last_index = None
@@ -103,9 +117,14 @@ class MotionDetector(Processor):
             np.int32,
         )
 
-        self.thermal_window = SlidingWindow(
-            (self.preview_frames, headers.res_y, headers.res_x), np.uint16
-        )
+        # holds references to the received frames, the frames before the one that
+        # triggers a recording are shared with the recorder and tracker without copying
+        self.thermal_window = SlidingWindow((self.preview_frames + 1,), object)
+        # preallocated work buffers so per frame detection doesn't allocate
+        clipped_shape = (headers.res_y - edge * 2, headers.res_x - edge * 2)
+        self.clipped_frame = np.empty(clipped_shape, np.int32)
+        self.delta_frame = np.empty(clipped_shape, np.int32)
+        self.delta_mask = np.empty(clipped_shape, np.bool_)
         self.processed = 0
         self.num_frames = 0
         self.thermal_thresh = 0
@@ -184,25 +203,22 @@ class MotionDetector(Processor):
             self.temp_thresh = self.config.temp_thresh
 
     def detect(self, clipped_frame):
-        oldest = self.clipped_window.oldest
-        delta_frame = clipped_frame - oldest
+        delta_frame = self.delta_frame
+        delta_mask = self.delta_mask
+        np.subtract(clipped_frame, self.clipped_window.oldest, out=delta_frame)
 
         if not self.config.warmer_only:
-            delta_frame = abs(delta_frame)
+            np.absolute(delta_frame, out=delta_frame)
         if self.config.one_diff_only:
-            diff = len(delta_frame[delta_frame > self.config.delta_thresh])
+            np.greater(delta_frame, self.config.delta_thresh, out=delta_mask)
+            diff = np.count_nonzero(delta_mask)
         else:
+            np.minimum(delta_frame, self.config.delta_thresh, out=delta_frame)
             if self.processed > 2:
-                delta_frame2 = self.diff_window.oldest
-                delta_frame[
-                    delta_frame >= self.config.delta_thresh
-                ] = self.config.delta_thresh
-                delta_frame = delta_frame2 + delta_frame
-                diff = len(delta_frame[delta_frame == self.config.delta_thresh * 2])
+                np.add(delta_frame, self.diff_window.oldest, out=delta_frame)
+                np.equal(delta_frame, self.config.delta_thresh * 2, out=delta_mask)
+                diff = np.count_nonzero(delta_mask)
             else:
-                delta_frame[
-                    delta_frame >= self.config.delta_thresh
-                ] = self.config.delta_thresh
                 diff = 0
 
         self.diff_window.add(delta_frame)
@@ -225,7 +241,17 @@ class MotionDetector(Processor):
         return False
 
     def get_recent_frame(self):
-        return self.thermal_window.current_copy()
+        frame = self.thermal_window.current
+        if frame is None:
+            return None
+        return frame.pix.copy()
+
+    def get_preview_frames(self):
+        """
+        Gets the frames received before the latest frame, oldest first.
+        These are the frames as received not copies, so must not be modified
+        """
+        return self.thermal_window.get_frames()[:-1]
 
     def can_record(self):
         return self.rec_window.inside_window()
@@ -240,33 +266,41 @@ class MotionDetector(Processor):
     def process_frame(self, cptv_frame):
         if self.can_record() or (self.recorder and self.recorder.recording):
             cropped_frame = self.crop_rectangle.subimage(cptv_frame.pix)
-            frame = np.int32(cropped_frame)
             prev_ffc = self.ffc_affected
             self.ffc_affected = is_affected_by_ffc(cptv_frame)
             if not self.ffc_affected:
-                self.thermal_window.add(cptv_frame.pix)
+                self.thermal_window.add(cptv_frame)
                 if self.background is None:
                     self.background = cptv_frame.pix
                     self.last_background_change = self.processed
                 else:
                     self.calc_temp_thresh(cptv_frame.pix, prev_ffc)
 
-            clipped_frame = np.clip(frame, a_min=self.temp_thresh, a_max=None)
+            clipped_frame = self.clipped_frame
+            np.maximum(
+                cropped_frame, self.temp_thresh, out=clipped_frame, dtype=np.int32
+            )
             self.clipped_window.add(clipped_frame)
 
             if self.ffc_affected or prev_ffc:
                 logging.debug("{} MotionDetector FFC".format(self.num_frames))
                 self.movement_detected = False
-                self.clipped_window.oldest_index = self.clipped_window.last_index
+                self.clipped_window.keep_last()
             elif self.processed != 0:
                 self.movement_detected = self.detect(clipped_frame)
             self.processed += 1
             if self.recorder:
+                preview_frames = None
+                if self.movement_detected and not self.recorder.recording:
+                    preview_frames = self.get_preview_frames()
                 self.recorder.process_frame(
-                    self.movement_detected, cptv_frame, self.temp_thresh
+                    self.movement_detected,
+                    cptv_frame,
+                    self.temp_thresh,
+                    preview_frames,
                 )
         else:
-            self.thermal_window.update_current_frame(cptv_frame.pix)
+            self.thermal_window.update_current_frame(cptv_frame)
             self.movement_detected = False
         self.num_frames += 1
 
@@ -89,10 +89,9 @@ class PiClassifier(Processor):
             True,
         )
 
-        # process preview_frames
-        frames = self.motion_detector.thermal_window.get_frames()
-        for frame in frames:
-            self.track_extractor.process_frame(self.clip, frame.copy())
+        # process preview_frames, these are shared with the recorder so aren't copied
+        for frame in self.motion_detector.get_preview_frames():
+            self.track_extractor.process_frame(self.clip, frame.pix)
 
     def startup_classifier(self):
         # classifies an empty frame to force loading of the model into memory
@@ -1,5 +1,4 @@
 #!/usr/bin/python3
-import absl.logging
 import argparse
 from datetime import datetime
 import logging
@@ -7,8 +6,6 @@ import os
 import psutil
 import socket
 
-# fixes logging not showing up in tensorflow
-
 from cptv import CPTVReader
 import numpy as np
 import json
@@ -20,8 +17,6 @@ from .headerinfo import HeaderInfo
 from ml_tools.logs import init_logging
 from ml_tools import tools
 from .motiondetector import MotionDetector
-from .piclassifier import PiClassifier
-from service import SnapshotService
 from .cameras import lepton3
 
 SOCKET_NAME = "/var/run/lepton-frames"
@@ -131,11 +126,24 @@ def parse_args():
 def get_classifier(config):
     model_name, model_type = os.path.splitext(config.classify.model)
     if model_type == ".tflite":
-        return LiteInterpreter(model_name)
+        classifier = LiteInterpreter(model_name)
     elif model_type == ".xml":
-        return NeuralInterpreter(model_name)
+        classifier = NeuralInterpreter(model_name)
     else:
-        return get_full_classifier(config)
+        classifier = get_full_classifier(config)
+    remove_absl_handler()
+    return classifier
+
+
+def remove_absl_handler():
+    # fixes logging not showing up in tensorflow
+    try:
+        import absl.logging
+    except ImportError:
+        return
+
+    logging.root.removeHandler(absl.logging._absl_handler)
+    absl.logging._warn_preinit_stderr = False
 
 
 def get_full_classifier(config):
@@ -159,8 +167,6 @@ def get_full_classifier(config):
 
 # Links to socket and continuously waits for 1 connection
 def main():
-    logging.root.removeHandler(absl.logging._absl_handler)
-    absl.logging._warn_preinit_stderr = False
     init_logging()
     args = parse_args()
 
@@ -212,6 +218,8 @@ def parse_cptv(cptv_file, config, thermal_config):
 
 def get_processor(config, thermal_config, headers):
     if thermal_config.motion.run_classifier:
+        from .piclassifier import PiClassifier
+
         classifier = get_classifier(config)
         return PiClassifier(config, thermal_config, classifier, headers)
 
@@ -240,6 +248,8 @@ def handle_headers(connection):
 
 
 def handle_connection(connection, config, thermal_config):
+    from service import SnapshotService
+
     headers = handle_headers(connection)
     logging.debug("parsed camera headers", headers)
     processor = get_processor(config, thermal_config, headers)
@@ -0,0 +1,102 @@
+import os
+
+from cptv import CPTVReader
+
+from config.thermalconfig import ThermalConfig
+from piclassifier.cptvrecorder import CPTVRecorder
+from piclassifier.headerinfo import HeaderInfo
+from piclassifier.motiondetector import MotionDetector
+
+TESTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "tests"
+)
+
+
+def get_thermal_config(output_dir):
+    with open(os.path.join(TESTS_DIR, "config.toml")) as f:
+        thermal_config = ThermalConfig.load_from_stream(f)
+    thermal_config.recorder.output_dir = str(output_dir)
+    return thermal_config
+
+
+def get_headers():
+    return HeaderInfo(
+        res_x=160,
+        res_y=120,
+        fps=9,
+        brand="",
+        model="",
+        frame_size=160 * 120 * 2,
+        pixel_bits=16,
+    )
+
+
+def get_recorder(output_dir):
+    return CPTVRecorder(get_thermal_config(output_dir), get_headers())
+
+
+def read_recording(output_dir):
+    recordings = [name for name in os.listdir(output_dir) if name.endswith(".cptv")]
+    assert len(recordings) == 1
+    with open(os.path.join(output_dir, recordings[0]), "rb") as f:
+        return list(CPTVReader(f))
+
+
+def read_frames():
+    with open(os.path.join(TESTS_DIR, "clips", "hedgehog.cptv"), "rb") as f:
+        return list(CPTVReader(f))
+
+
+class TestCPTVRecorder:
+    def test_force_stop_flushes(self, tmp_path):
+        recorder = get_recorder(tmp_path)
+        frames = read_frames()
+        for frame in frames:
+            recorder.write_frame(frame, 3000)
+        recorder.force_stop()
+
+        assert not recorder.recording
+        assert recorder.max_queued > 0
+        written = read_recording(tmp_path)
+        assert len(written) == len(frames)
+        assert all(
+            (frame.pix == copy.pix).all() for frame, copy in zip(frames, written)
+        )
+
+    def test_force_stop_deletes_short_recording(self, tmp_path):
+        recorder = get_recorder(tmp_path)
+        frame = read_frames()[0]
+        recorder.process_frame(True, frame, 3000)
+        recorder.force_stop()
+
+        assert not recorder.recording
+        assert os.listdir(tmp_path) == []
+
+    def test_preview_frames_recorded(self, tmp_path):
+        thermal_config = get_thermal_config(tmp_path)
+        thermal_config.motion.delta_thresh = 20
+        thermal_config.motion.frame_compare_gap = 10
+        thermal_config.recorder.min_secs = 1
+        thermal_config.recorder.max_secs = 1000
+        headers = get_headers()
+        recorder = CPTVRecorder(thermal_config, headers)
+        detector = MotionDetector(thermal_config, True, recorder, headers)
+        frames = read_frames()
+        trigger = None
+        for i, frame in enumerate(frames):
+            detector.process_frame(frame)
+            if trigger is None and recorder.recording:
+                trigger = i
+                preview = detector.get_preview_frames()
+        detector.disconnected()
+
+        preview_frames = thermal_config.recorder.preview_secs * headers.fps
+        assert len(preview) == preview_frames
+        originals = frames[trigger - preview_frames :]
+        assert all(frame is original for frame, original in zip(preview, originals))
+        written = read_recording(tmp_path)
+        assert len(written) > preview_frames
+        for frame, original in zip(written, originals):
+            assert frame.time_on == original.time_on
+            assert frame.last_ffc_time == original.last_ffc_time
+            assert (frame.pix == original.pix).all()
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+from cptv import CPTVReader
+
+from config.thermalconfig import ThermalConfig
+from piclassifier.headerinfo import HeaderInfo
+from piclassifier.motiondetector import MotionDetector, SlidingWindow
+
+CLIPS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "tests", "clips"
+)
+CPTV_FILES = ["hedgehog.cptv", "hedgehog2.cptv", "background.cptv"]
+
+
+class NaiveMotionDetector(MotionDetector):
+    """The original allocating implementation of detect, used as a reference"""
+
+    def detect(self, clipped_frame):
+        oldest = self.clipped_window.oldest
+        delta_frame = clipped_frame - oldest
+
+        if not self.config.warmer_only:
+            delta_frame = abs(delta_frame)
+        if self.config.one_diff_only:
+            diff = len(delta_frame[delta_frame > self.config.delta_thresh])
+        else:
+            if self.processed > 2:
+                delta_frame2 = self.diff_window.oldest
+                delta_frame[
+                    delta_frame >= self.config.delta_thresh
+                ] = self.config.delta_thresh
+                delta_frame = delta_frame2 + delta_frame
+                diff = len(delta_frame[delta_frame == self.config.delta_thresh * 2])
+            else:
+                delta_frame[
+                    delta_frame >= self.config.delta_thresh
+                ] = self.config.delta_thresh
+                diff = 0
+
+        self.diff_window.add(delta_frame)
+        return diff > self.config.count_thresh
+
+
+def load_thermal_config(one_diff_only, warmer_only):
+    with open(os.path.join(CLIPS_DIR, "..", "config.toml")) as f:
+        thermal_config = ThermalConfig.load_from_stream(f)
+    thermal_config.motion.one_diff_only = one_diff_only
+    thermal_config.motion.warmer_only = warmer_only
+    thermal_config.motion.delta_thresh = 20
+    thermal_config.motion.count_thresh = 1
+    thermal_config.motion.frame_compare_gap = 10
+    return thermal_config
+
+
+class TestMotionDetector:
+    @pytest.mark.parametrize("cptv_file", CPTV_FILES)
+    @pytest.mark.parametrize("one_diff_only", [True, False])
+    @pytest.mark.parametrize("warmer_only", [True, False])
+    def test_detection_matches_naive(self, cptv_file, one_diff_only, warmer_only):
+        thermal_config = load_thermal_config(one_diff_only, warmer_only)
+        with open(os.path.join(CLIPS_DIR, cptv_file), "rb") as f:
+            reader = CPTVReader(f)
+            headers = HeaderInfo(
+                res_x=reader.x_resolution,
+                res_y=reader.y_resolution,
+                fps=9,
+                brand="",
+                model="",
+                frame_size=reader.x_resolution * reader.y_resolution * 2,
+                pixel_bits=16,
+            )
+            detector = MotionDetector(thermal_config, True, None, headers)
+            naive = NaiveMotionDetector(thermal_config, True, None, headers)
+            for frame in reader:
+                detector.process_frame(frame)
+                naive.process_frame(frame)
+                assert detector.movement_detected == naive.movement_detected
+                assert detector.temp_thresh == naive.temp_thresh
+                assert np.array_equal(
+                    detector.clipped_window.current, naive.clipped_window.current
+                )
+                if detector.diff_window.last_index is not None:
+                    assert np.array_equal(
+                        detector.diff_window.current, naive.diff_window.current
+                    )
+
+
+class TestSlidingWindow:
+    def test_keep_last(self):
+        window = SlidingWindow((3, 2), np.int32)
+        assert window.count == 0
+        for i in range(5):
+            window.add(np.full(2, i))
+        assert window.count == 3
+        assert [frame[0] for frame in window.get_frames()] == [2, 3, 4]
+        window.keep_last()
+        assert window.count == 1
+        assert window.oldest[0] == 4
+        window.add(np.full(2, 5))
+        assert [frame[0] for frame in window.get_frames()] == [4, 5]
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+start = time.time()
+from config.config import Config
+from config.thermalconfig import ThermalConfig
+from piclassifier.headerinfo import HeaderInfo
+from piclassifier.piclassify import get_processor
+
+config = Config.load_from_file("tests/test-config.yaml")
+thermal_config = ThermalConfig.load_from_file("tests/config.toml")
+headers = HeaderInfo(
+    res_x=160,
+    res_y=120,
+    fps=9,
+    brand="",
+    model="",
+    frame_size=160 * 120 * 2,
+    pixel_bits=16,
+)
+processor = get_processor(config, thermal_config, headers)
+print(
+    json.dumps(
+        {
+            "seconds": time.time() - start,
+            "processor": type(processor).__name__,
+            "modules": list(sys.modules),
+        }
+    )
+)
+"""
+
+
+class TestStartup:
+    # modules only needed when classifying, previewing or serving snapshots
+    HEAVY_MODULES = [
+        "tensorflow",
+        "h5py",
+        "matplotlib",
+        "sklearn",
+        "scipy",
+        "pydbus",
+        "gi",
+    ]
+    MAX_STARTUP_S = 2
+
+    def test_motion_only_startup(self):
+        root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            cwd=root,
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        startup = json.loads(result.stdout.decode().splitlines()[-1])
+        print("Motion only startup took {:.2f}s".format(startup["seconds"]))
+        assert startup["processor"] == "MotionDetector"
+        loaded = set(startup["modules"])
+        for module in TestStartup.HEAVY_MODULES:
+            assert module not in loaded, "{} imported on motion only path".format(
+                module
+            )
+        assert startup["seconds"] < TestStartup.MAX_STARTUP_S
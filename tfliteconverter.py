@@ -6,7 +6,7 @@ import shutil
 import tensorflow as tf
 from config.config import Config
 from ml_tools.dataset import dataset_db_path
-import pickle
+from ml_tools.datasetstore import load_datasets
 from ml_tools.model import Model
 from model_crnn import ModelCRNN_HQ, Model_CNN
 
@@ -39,10 +39,6 @@ def optimizer_model(args):
 # frame count to 1 as is needed for tflite
 def save_eval_model(args):
     config = Config.load_from_file()
-    datasets_filename = dataset_db_path(config)
-    with open(datasets_filename, "rb") as f:
-        dsets = pickle.load(f)
-
     labels = ["hedgehog", "false-positive", "possum", "rodent", "bird"]
 
     # this needs to be the same as the source model class
@@ -127,9 +123,7 @@ def run_model(args):
 def representative_dataset_gen():
     config = Config.load_from_file()
 
-    dataset_filename = os.path.join(config.tracks_folder, "datasets.dat")
-    datasets = pickle.load(open(dataset_filename, "rb"))
-    train, validation, test = datasets
+    train = load_datasets(dataset_db_path(config), ["train"])[0]
     num_calibration_steps = 1000
     for i in range(num_calibration_steps):
         X, y = train.next_batch(1)
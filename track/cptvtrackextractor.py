@@ -9,6 +9,7 @@ from ml_tools import trackdatabase
 
 from track.track import TrackChannels
 from ml_tools.tools import blosc_zstd
+from ml_tools.mpeg_creator import purge_outputs
 from ml_tools.previewer import Previewer
 from track.trackextractor import TrackExtractor
 
@@ -151,7 +152,9 @@ class CPTVTrackExtractor(CPTVFileProcessor):
         destination_folder = os.path.join(self.config.tracks_folder, tag.lower())
         os.makedirs(destination_folder, mode=0o775, exist_ok=True)
         # delete any previous files
-        tools.purge(destination_folder, base_filename + "*.mp4")
+        purge_outputs(
+            destination_folder, base_filename + "*.mp4", self.config.previews_preset
+        )
 
         # read additional information from hints file
         if cptv_filename in self.hints:
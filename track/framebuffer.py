@@ -20,7 +20,6 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 import attr
 import cv2
 import numpy as np
-from ml_tools.framecache import FrameCache
 from ml_tools.frame import Frame
 from track.track import TrackChannels
 from ml_tools.tools import get_optical_flow_function, get_clipped_flow
@@ -32,14 +31,17 @@ class FrameBuffer:
     def __init__(
         self, cptv_name, high_quality_flow, cache_to_disk, calc_flow, keep_frames
     ):
-        self.cache = FrameCache(cptv_name) if cache_to_disk else None
+        self.cache = None
+        if cache_to_disk:
+            from ml_tools.framecache import FrameCache
+
+            self.cache = FrameCache(cptv_name)
         self.opt_flow = None
         self.high_quality_flow = high_quality_flow
         self.frames = None
         self.prev_frame = None
         self.calc_flow = calc_flow
         self.keep_frames = keep_frames
-        self.current_frame = 0
         if calc_flow:
             self.set_optical_flow()
         self.reset()
@@ -122,14 +124,13 @@ class FrameBuffer:
         return len(self.frames)
 
     def __iter__(self):
+        """Yields frames in order, reading them from the cache one at a time if used"""
         if self.cache:
             self.cache.open(mode="r")
-        return self
-
-    def __next__(self):
-        frame = self.get_frame(self.current_frame)
-        if frame is None:
-            raise StopIteration
-
-        self.current_frame += 1
-        return frame
+        frame_number = 0
+        while True:
+            frame = self.get_frame(frame_number)
+            if frame is None:
+                return
+            yield frame
+            frame_number += 1
@@ -1,23 +1,46 @@
 import datetime
 import os
-import pickle
 
 import tensorflow as tf
 from model_crnn import ModelCRNN_HQ, ModelCRNN_LQ, Model_CNN
 from model_resnet import ResnetModel
 from ml_tools.dataset import dataset_db_path
+from ml_tools.datasetstore import load_datasets, read_meta
+from ml_tools.kerasmodel import KerasModel
+from ml_tools.segmentcache import segment_cache_path
+
+
+def train_keras_model(run_name, conf, hyper_params):
+    """
+    Trains a KerasModel, fed by a tf.data pipeline, and saves it in the train folder.
+    Frames are read from the track database, the segment cache isn't used.
+    """
+    train, validation = load_datasets(
+        dataset_db_path(conf), ["train", "validation"], read_only=True
+    )
+    model = KerasModel(conf.train)
+    model.params.update(hyper_params)
+    run_name = run_name + " " + datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    model_dir = os.path.join(conf.train.train_dir, run_name)
+
+    print("Training on labels", train.labels)
+    model.train_model(
+        train, validation, int(conf.train.epochs), os.path.join(model_dir, "logs")
+    )
+    model.save(model_dir)
+    return model
 
 
 def train_model(run_name, conf, hyper_params):
     """Trains a model with the given hyper parameters."""
+    if conf.train.model == KerasModel.MODEL_NAME:
+        return train_keras_model(run_name, conf, hyper_params)
     run_name = os.path.join("train", run_name)
 
     # a little bit of a pain, the model needs to know how many classes to classify during initialisation,
     # but we don't load the dataset till after that, so we load it here just to count the number of labels...
     datasets_filename = dataset_db_path(conf)
-    with open(datasets_filename, "rb") as f:
-        dsets = pickle.load(f)
-    labels = dsets[0].labels
+    labels = read_meta(datasets_filename)["splits"][0]["labels"]
     if conf.train.model == ResnetModel.MODEL_NAME:
         model = ResnetModel(labels, conf.train)
     elif conf.train.model == ModelCRNN_HQ.MODEL_NAME:
@@ -33,7 +56,11 @@ def train_model(run_name, conf, hyper_params):
             labels=len(labels), train_config=conf.train, training=True, **hyper_params
         )
 
-    model.import_dataset(datasets_filename)
+    cache_filename = segment_cache_path(conf)
+    model.import_dataset(
+        datasets_filename,
+        segment_cache=cache_filename if os.path.exists(cache_filename) else None,
+    )
     # display the data set summary
     print("Training on labels", labels)
     print()
@@ -53,7 +80,11 @@ def train_model(run_name, conf, hyper_params):
         )
     print()
 
-    for dataset in dsets:
+    for dataset in [
+        model.datasets.train,
+        model.datasets.validation,
+        model.datasets.test,
+    ]:
         print(dataset.labels)
 
     print("Training started")
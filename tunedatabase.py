@@ -0,0 +1,100 @@
+# Benchmark chunk layouts and compression of the track database, and repack it
+# with the layout chosen.
+#
+#   python tunedatabase.py benchmark -c classifier.yaml --tracks 100
+#   python tunedatabase.py repack -c classifier.yaml channel/blosc:lz4/bit dataset-lz4.hdf5
+#
+# Layouts are chunks/compressor/shuffle, see ml_tools/dblayout.py
+
+import argparse
+import logging
+import os
+
+from config.config import Config
+from ml_tools import dblayout
+from ml_tools.logs import init_logging
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config-file", help="Path to config file to use")
+    parser.add_argument(
+        "-d",
+        "--database",
+        help="Track database to use, defaults to dataset.hdf5 in the tracks folder",
+    )
+    parser.add_argument("-l", "--level", type=int, help="Compression level")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    benchmark = commands.add_parser(
+        "benchmark", help="Time reads of a sample of tracks with each layout"
+    )
+    benchmark.add_argument(
+        "layouts",
+        nargs="*",
+        default=dblayout.DEFAULT_LAYOUTS,
+        help="Layouts to benchmark, defaults to a matrix of chunks and compressors",
+    )
+    benchmark.add_argument(
+        "--tracks", type=int, default=50, help="Number of tracks to sample"
+    )
+    benchmark.add_argument("--seed", type=int, default=0, help="Seed for sampling")
+    benchmark.add_argument(
+        "--work-dir", help="Folder for the benchmark copies, defaults to the database's"
+    )
+
+    repack = commands.add_parser(
+        "repack", help="Write a copy of the database with a layout"
+    )
+    repack.add_argument("layout", help="Layout to write, e.g. channel/blosc:lz4/bit")
+    repack.add_argument("output", help="File to write")
+    return parser.parse_args()
+
+
+def print_benchmark(results):
+    patterns = ["full track", "random segment", "single channel"]
+    print(
+        "{:<26} {:>9} {:>6}".format("Layout", "MB", "Ratio")
+        + "".join(" {:>22}".format(pattern + " ms/MBs") for pattern in patterns)
+    )
+    for layout, stored, raw, reads in results:
+        line = "{:<26} {:>9.1f} {:>6.2f}".format(
+            layout.name, stored / 1e6, raw / stored if stored else 0
+        )
+        for pattern in patterns:
+            seconds, throughput = reads[pattern]
+            line += " {:>12.2f} / {:>7.1f}".format(seconds * 1000, throughput)
+        print(line)
+
+
+def main():
+    init_logging()
+    args = parse_args()
+    database = args.database
+    if database is None:
+        config = Config.load_from_file(args.config_file)
+        database = os.path.join(config.tracks_folder, "dataset.hdf5")
+
+    if args.command == "benchmark":
+        layouts = [dblayout.Layout.parse(layout, args.level) for layout in args.layouts]
+        results = dblayout.benchmark(
+            database, layouts, args.tracks, work_dir=args.work_dir, seed=args.seed
+        )
+        print_benchmark(results)
+    else:
+        layout = dblayout.Layout.parse(args.layout, args.level)
+        if not layout.available():
+            logging.error("The hdf5 filter for %s is not available", layout.name)
+            return
+        dblayout.repack(database, args.output, layout)
+        stored, raw = dblayout.frames_size(args.output)
+        print(
+            "Wrote {} with {:.1f} MB of frames, compression ratio {:.2f}".format(
+                args.output, stored / 1e6, raw / stored if stored else 0
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()